@@ -0,0 +1,96 @@
+"""Range-partition messages by month with a (conversation_id, created_at) index
+
+Revision ID: 002_partition_messages
+Revises: 001_initial
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '002_partition_messages'
+down_revision = '001_initial'
+branch_labels = None
+depends_on = None
+
+# Monthly partitions created beyond the current month; keep more ahead
+# with `python -m app.partitions`
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, count: int) -> date:
+    total = month.year * 12 + month.month - 1 + count
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+
+    op.execute('ALTER TABLE messages RENAME TO messages_unpartitioned')
+    op.execute('ALTER INDEX messages_pkey RENAME TO messages_unpartitioned_pkey')
+    op.execute('ALTER INDEX ix_messages_conversation_id RENAME TO ix_messages_unpartitioned_conversation_id')
+
+    # The partition key has to be part of the primary key
+    op.execute("""
+        CREATE TABLE messages (
+            id UUID NOT NULL,
+            conversation_id UUID NOT NULL,
+            role VARCHAR NOT NULL,
+            content TEXT NOT NULL,
+            intent VARCHAR,
+            confidence INTEGER,
+            extra_data JSONB,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            CONSTRAINT messages_pkey PRIMARY KEY (id, created_at),
+            CONSTRAINT messages_conversation_id_fkey FOREIGN KEY (conversation_id) REFERENCES conversations (id),
+            CONSTRAINT check_message_role CHECK (role IN ('user', 'assistant', 'system'))
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute(
+        'CREATE INDEX ix_messages_conversation_id_created_at '
+        'ON messages (conversation_id, created_at DESC)'
+    )
+
+    oldest = conn.execute(sa.text('SELECT min(created_at) FROM messages_unpartitioned')).scalar()
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    month = oldest.date().replace(day=1) if oldest else this_month
+    month = min(month, this_month)
+    while month <= _add_months(this_month, MONTHS_AHEAD):
+        end = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE messages_y{month.year}m{month.month:02d} PARTITION OF messages "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00+00') TO ('{end.isoformat()} 00:00+00')"
+        )
+        month = end
+    # Catches rows outside the pre-created range until a partition exists for them
+    op.execute('CREATE TABLE messages_default PARTITION OF messages DEFAULT')
+
+    op.execute('INSERT INTO messages SELECT * FROM messages_unpartitioned')
+    op.execute('DROP TABLE messages_unpartitioned')
+
+
+def downgrade() -> None:
+    op.execute('ALTER TABLE messages RENAME TO messages_partitioned')
+    op.execute('ALTER INDEX messages_pkey RENAME TO messages_partitioned_pkey')
+    op.create_table(
+        'messages',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('conversation_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('intent', sa.String(), nullable=True),
+        sa.Column('confidence', sa.Integer(), nullable=True),
+        sa.Column('extra_data', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.CheckConstraint("role IN ('user', 'assistant', 'system')", name='check_message_role'),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_messages_conversation_id'), 'messages', ['conversation_id'], unique=False)
+    op.execute('INSERT INTO messages SELECT * FROM messages_partitioned')
+    # Dropping the parent drops every partition with it
+    op.execute('DROP TABLE messages_partitioned')
@@ -0,0 +1,35 @@
+"""Hourly chat rollups by channel, locale and intent
+
+Revision ID: 003_chat_rollups
+Revises: 002_partition_messages
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003_chat_rollups'
+down_revision = '002_partition_messages'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'chat_rollups_hourly',
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('locale', sa.String(), nullable=False),
+        sa.Column('intent', sa.String(), nullable=False),
+        sa.Column('messages', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('faq_hits', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('faq_misses', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('handoffs', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('bucket_start', 'channel', 'locale', 'intent'),
+    )
+    # Populate with `python -m app.rollups backfill`
+
+
+def downgrade() -> None:
+    op.drop_table('chat_rollups_hourly')
@@ -0,0 +1,35 @@
+"""Handoff delivery queue columns
+
+Revision ID: 004_handoff_queue
+Revises: 003_chat_rollups
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004_handoff_queue'
+down_revision = '003_chat_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('handoffs', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+    # Existing pending handoffs become due immediately
+    op.add_column('handoffs', sa.Column(
+        'next_attempt_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()
+    ))
+    op.add_column('handoffs', sa.Column('last_error', sa.Text(), nullable=True))
+    op.create_index(
+        'ix_handoffs_queue', 'handoffs', ['next_attempt_at'],
+        postgresql_where=sa.text("status IN ('pending', 'processing')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_handoffs_queue', table_name='handoffs')
+    op.drop_column('handoffs', 'last_error')
+    op.drop_column('handoffs', 'next_attempt_at')
+    op.drop_column('handoffs', 'attempts')
@@ -0,0 +1,371 @@
+"""In-process caches and the recent-history cache for chat sessions.
+
+`LRUCache` is a small bounded mapping (LRU eviction, TTL,
+hit/miss/eviction counters) for hot lookups such as
+session_id -> conversation id. `ReplyCache` builds on it for reply
+decisions that must be dropped when the knowledge base changes, with
+no-match decisions kept in a smaller negative cache of their own.
+
+The history cache keeps the last N messages of each session so chat
+responses don't have to read them back from the `messages` table. It is
+accessed through the `HistoryBackend` interface so several workers can
+share a Redis-backed instance, with `InMemoryHistoryBackend` as the local
+stand-in. The in-memory backend is refused when WEB_CONCURRENCY > 1: each
+worker would keep its own copy, and one worker's writes leave the others'
+stale.
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Returned by `LRUCache.get` when a key is absent or expired
+MISSING = object()
+
+
+class LRUCache:
+    """Bounded mapping with LRU eviction and per-entry TTL."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at is None or expires_at > self._clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (value, self._clock() + self.ttl if self.ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class ReplyCache:
+    """LRU cache of reply decisions tied to a knowledge base version.
+
+    Entries are stored under (version, key); the first lookup with a newer
+    version drops everything cached for older ones, and lookups from
+    requests still on an older version bypass the cache.
+
+    Values set with `negative=True` (messages nothing matched) go to a
+    separate cache of `negative_maxsize` entries, so a stream of unique
+    unanswerable messages evicts other no-match decisions rather than real
+    answers. With `negative_maxsize=0` they aren't cached.
+    """
+
+    def __init__(self, maxsize: int, negative_maxsize: int = 0):
+        self._cache = LRUCache(maxsize)
+        self._negative = LRUCache(negative_maxsize) if negative_maxsize > 0 else None
+        self._version: Optional[int] = None
+        self.invalidations = 0
+
+    def _is_current(self, version: int) -> bool:
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            if self._version is not None and (len(self._cache) or self._negative and len(self._negative)):
+                self._cache.clear()
+                if self._negative is not None:
+                    self._negative.clear()
+                self.invalidations += 1
+            self._version = version
+        return True
+
+    def get(self, key: str, version: int) -> Any:
+        if not self._is_current(version):
+            return MISSING
+        value = self._cache.get((version, key))
+        if value is MISSING and self._negative is not None:
+            value = self._negative.get((version, key))
+        return value
+
+    def set(self, key: str, version: int, value: Any, negative: bool = False) -> None:
+        cache = self._negative if negative else self._cache
+        if cache is not None and self._is_current(version):
+            cache.set((version, key), value)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        negative = self._negative.stats() if self._negative is not None else None
+        hits = stats["hits"] + (negative["hits"] if negative else 0)
+        # Every lookup that misses the main cache goes on to the negative one
+        misses = negative["misses"] if negative else stats["misses"]
+        lookups = hits + misses
+        return {
+            "size": stats["size"],
+            "negative_size": negative["size"] if negative else 0,
+            "hits": hits,
+            "misses": misses,
+            "evictions": stats["evictions"] + (negative["evictions"] if negative else 0),
+            "invalidations": self.invalidations,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+class CachedMessage(NamedTuple):
+    """The parts of a `messages` row needed to render chat history."""
+
+    id: str
+    role: str
+    content: str
+    created_at: datetime
+
+    @classmethod
+    def from_row(cls, row: Any) -> "CachedMessage":
+        return cls(str(row.id), row.role, row.content, row.created_at)
+
+
+class HistoryBackend(ABC):
+    """Interface for recent-history storage keyed by session_id."""
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[List[CachedMessage]]:
+        """Return cached messages (oldest first), or None on a miss."""
+
+    @abstractmethod
+    async def set(self, session_id: str, messages: Iterable[CachedMessage]) -> None:
+        """Replace the cached history for a session."""
+
+    @abstractmethod
+    async def append(self, session_id: str, messages: Iterable[CachedMessage]) -> None:
+        """Append to a cached history; sessions not in the cache are left alone."""
+
+    @abstractmethod
+    async def invalidate(self, session_id: str) -> None:
+        """Drop a session's cached history."""
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for /metrics; backends report what they can track."""
+        return {}
+
+
+# Rough per-message overhead (tuple, strings, datetime) used for the memory cap
+_MESSAGE_OVERHEAD_BYTES = 200
+
+
+def _message_size(message: CachedMessage) -> int:
+    return len(message.content) + _MESSAGE_OVERHEAD_BYTES
+
+
+class InMemoryHistoryBackend(HistoryBackend):
+    """Per-process ring buffers with LRU/TTL eviction and a memory cap."""
+
+    def __init__(
+        self,
+        max_messages: int,
+        max_sessions: int = 10000,
+        ttl: Optional[float] = 1800,
+        max_bytes: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._sessions: "OrderedDict[str, Tuple[Deque[CachedMessage], Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _live_buffer(self, session_id: str) -> Optional[Deque[CachedMessage]]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        buffer, expires_at = entry
+        if expires_at is not None and expires_at <= self._clock():
+            self._drop(session_id)
+            return None
+        return buffer
+
+    def _drop(self, session_id: str) -> None:
+        buffer, _ = self._sessions.pop(session_id)
+        self._bytes -= sum(_message_size(m) for m in buffer)
+
+    def _store(self, session_id: str, buffer: Deque[CachedMessage]) -> None:
+        expires_at = self._clock() + self.ttl if self.ttl is not None else None
+        self._sessions[session_id] = (buffer, expires_at)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions or (
+            self.max_bytes is not None and self._bytes > self.max_bytes and len(self._sessions) > 1
+        ):
+            self._drop(next(iter(self._sessions)))
+            self.evictions += 1
+
+    def _extend(self, buffer: Deque[CachedMessage], messages: Iterable[CachedMessage]) -> None:
+        for message in messages:
+            if len(buffer) == buffer.maxlen:
+                self._bytes -= _message_size(buffer[0])
+            buffer.append(message)
+            self._bytes += _message_size(message)
+
+    async def get(self, session_id: str) -> Optional[List[CachedMessage]]:
+        buffer = self._live_buffer(session_id)
+        if buffer is None:
+            self.misses += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        self.hits += 1
+        return list(buffer)
+
+    async def set(self, session_id: str, messages: Iterable[CachedMessage]) -> None:
+        if session_id in self._sessions:
+            self._drop(session_id)
+        buffer: Deque[CachedMessage] = deque(maxlen=self.max_messages)
+        self._extend(buffer, messages)
+        self._store(session_id, buffer)
+
+    async def append(self, session_id: str, messages: Iterable[CachedMessage]) -> None:
+        buffer = self._live_buffer(session_id)
+        if buffer is None:
+            return
+        self._extend(buffer, messages)
+        self._store(session_id, buffer)
+
+    async def invalidate(self, session_id: str) -> None:
+        if session_id in self._sessions:
+            self._drop(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class RedisHistoryBackend(HistoryBackend):
+    """Shared history in Redis lists, one capped list per session.
+
+    Requires the optional `redis` package.
+    """
+
+    def __init__(self, url: str, max_messages: int, ttl: Optional[float] = 1800, prefix: str = "chat:history:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("HISTORY_CACHE_BACKEND=redis requires the 'redis' package") from e
+        self._redis = redis.from_url(url)
+        self.max_messages = max_messages
+        self.ttl = int(ttl) if ttl else None
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _encode(message: CachedMessage) -> str:
+        return json.dumps([message.id, message.role, message.content, message.created_at.isoformat()])
+
+    @staticmethod
+    def _decode(raw: bytes) -> CachedMessage:
+        id_, role, content, created_at = json.loads(raw)
+        return CachedMessage(id_, role, content, datetime.fromisoformat(created_at))
+
+    async def _write(self, key: str, messages: Iterable[CachedMessage], replace: bool) -> None:
+        encoded = [self._encode(m) for m in messages]
+        async with self._redis.pipeline(transaction=True) as pipe:
+            if replace:
+                pipe.delete(key)
+                if encoded:
+                    pipe.rpush(key, *encoded)
+            elif encoded:
+                # RPUSHX only extends a list that exists, in the same MULTI as
+                # the trim; a partial history must not look complete
+                pipe.rpushx(key, *encoded)
+            pipe.ltrim(key, -self.max_messages, -1)
+            if self.ttl:
+                pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def get(self, session_id: str) -> Optional[List[CachedMessage]]:
+        raw = await self._redis.lrange(self.prefix + session_id, 0, -1)
+        if not raw:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [self._decode(item) for item in raw]
+
+    async def set(self, session_id: str, messages: Iterable[CachedMessage]) -> None:
+        await self._write(self.prefix + session_id, messages, replace=True)
+
+    async def append(self, session_id: str, messages: Iterable[CachedMessage]) -> None:
+        await self._write(self.prefix + session_id, messages, replace=False)
+
+    async def invalidate(self, session_id: str) -> None:
+        await self._redis.delete(self.prefix + session_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def create_history_backend(max_messages: int) -> Optional[HistoryBackend]:
+    """Build the history cache configured by HISTORY_CACHE_* env vars."""
+    backend = os.getenv("HISTORY_CACHE_BACKEND", "memory").lower()
+    ttl = float(os.getenv("HISTORY_CACHE_TTL", "1800")) or None
+    if backend == "none":
+        return None
+    if backend == "redis":
+        return RedisHistoryBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"), max_messages, ttl=ttl)
+    if backend != "memory":
+        logger.warning(f"Unknown HISTORY_CACHE_BACKEND '{backend}', using in-memory cache")
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        logger.warning("In-memory history cache disabled with WEB_CONCURRENCY > 1; use HISTORY_CACHE_BACKEND=redis")
+        return None
+    return InMemoryHistoryBackend(
+        max_messages,
+        max_sessions=int(os.getenv("HISTORY_CACHE_SESSIONS", "10000")),
+        ttl=ttl,
+        max_bytes=int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    )
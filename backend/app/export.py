@@ -0,0 +1,454 @@
+"""Streaming export of conversation transcripts for QA and model tuning.
+
+Conversations are read with their messages and handoffs in a single
+query over a server-side cursor (`yield_per`), so memory stays flat no
+matter how many rows are exported. They come out ordered by
+(started_at, id); each record carries that pair as its `cursor`, and an
+export can be restarted after any cursor.
+
+Output is newline-delimited JSON, one conversation per line, optionally
+gzip-compressed, or Parquet (one row per message, needs the `export`
+extra: pyarrow) written as a directory of part files. File exports save
+a checkpoint every --checkpoint-every conversations and resume from it
+when run again:
+
+    python -m app.export transcripts.ndjson.gz --compression gzip \\
+        --from 2024-01-01 --to 2024-02-01 --intent returns
+
+Reads go to the read replica when DATABASE_REPLICA_URL is set.
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+
+from pydantic_core import to_json
+from sqlalchemy import and_, exists, func, select, tuple_
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "parquet")
+COMPRESSIONS = {"ndjson": ("none", "gzip"), "parquet": ("none", "snappy", "gzip", "zstd")}
+# Rows fetched from the server-side cursor per round trip
+BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+Cursor = Tuple[datetime, UUID]
+
+
+class ExportFilters(NamedTuple):
+    """Conversation filters; all optional and combined with AND."""
+
+    started_from: Optional[datetime] = None
+    started_to: Optional[datetime] = None
+    channel: Optional[str] = None
+    # Conversations with at least one message of this intent
+    intent: Optional[str] = None
+    # Conversations with a handoff in this status, or "none" for no handoff
+    handoff_status: Optional[str] = None
+    # Closed conversations that ended before this time
+    ended_before: Optional[datetime] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            name: value.isoformat() if isinstance(value, datetime) else value
+            for name, value in self._asdict().items()
+        }
+
+
+def format_cursor(cursor: Cursor) -> str:
+    return f"{cursor[0].isoformat()}|{cursor[1]}"
+
+
+def parse_cursor(value: str) -> Cursor:
+    """Inverse of `format_cursor`; raises ValueError for anything else."""
+    started_at, _, conversation_id = value.partition("|")
+    return datetime.fromisoformat(started_at), UUID(conversation_id)
+
+
+def _utc(value: datetime) -> datetime:
+    # Dates without a timezone (e.g. --from 2024-01-01) are taken as UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _filter_clauses(conversation, filters: ExportFilters, after: Optional[Cursor]) -> List[Any]:
+    message, handoff = aliased(models.Message), aliased(models.Handoff)
+    clauses = []
+    if filters.started_from is not None:
+        clauses.append(conversation.started_at >= _utc(filters.started_from))
+    if filters.started_to is not None:
+        clauses.append(conversation.started_at < _utc(filters.started_to))
+    if filters.ended_before is not None:
+        clauses.append(conversation.status == "closed")
+        clauses.append(conversation.ended_at < _utc(filters.ended_before))
+    if filters.channel is not None:
+        clauses.append(conversation.channel == filters.channel)
+    if filters.intent is not None:
+        clauses.append(exists().where(and_(
+            message.conversation_id == conversation.id, message.intent == filters.intent
+        )))
+    if filters.handoff_status == "none":
+        clauses.append(~exists().where(handoff.conversation_id == conversation.id))
+    elif filters.handoff_status is not None:
+        clauses.append(exists().where(and_(
+            handoff.conversation_id == conversation.id, handoff.status == filters.handoff_status
+        )))
+    if after is not None:
+        clauses.append(tuple_(conversation.started_at, conversation.id) > tuple_(*after))
+    return clauses
+
+
+def transcript_query(filters: ExportFilters, after: Optional[Cursor] = None, limit: Optional[int] = None):
+    """One row per message (or per conversation without messages), in export order.
+
+    `limit` caps the number of conversations, not rows.
+    """
+    conversation, message, handoff, feedback = (
+        models.Conversation, models.Message, models.Handoff, models.Feedback
+    )
+    handoffs = (
+        select(
+            handoff.conversation_id,
+            func.json_agg(aggregate_order_by(
+                func.json_build_object(
+                    "id", handoff.id,
+                    "recommended", handoff.recommended,
+                    "reason", handoff.reason,
+                    "provider", handoff.provider,
+                    "ticket_id", handoff.ticket_id,
+                    "status", handoff.status,
+                    "created_at", handoff.created_at,
+                ),
+                handoff.created_at,
+            ), type_=JSON).label("handoffs"),
+        )
+        .group_by(handoff.conversation_id)
+        .subquery()
+    )
+    # Conversations are picked (and limited) in a subquery of their own, so
+    # the filters' EXISTS clauses aren't correlated with the joins below
+    selected = aliased(models.Conversation)
+    conversation_ids = (
+        select(selected.id)
+        .where(*_filter_clauses(selected, filters, after))
+        .order_by(selected.started_at, selected.id)
+        .limit(limit)
+    )
+    return (
+        select(
+            conversation.id,
+            conversation.session_id,
+            conversation.channel,
+            conversation.locale,
+            conversation.status,
+            conversation.started_at,
+            conversation.ended_at,
+            handoffs.c.handoffs,
+            feedback.rating,
+            feedback.comment,
+            message.id.label("message_id"),
+            message.role,
+            message.content,
+            message.intent,
+            message.confidence,
+            message.created_at.label("message_created_at"),
+        )
+        .select_from(conversation)
+        .outerjoin(message, message.conversation_id == conversation.id)
+        .outerjoin(handoffs, handoffs.c.conversation_id == conversation.id)
+        .outerjoin(feedback, feedback.conversation_id == conversation.id)
+        .where(conversation.id.in_(conversation_ids.scalar_subquery()))
+        .order_by(conversation.started_at, conversation.id, message.created_at)
+    )
+
+
+async def iter_transcripts(
+    db: AsyncSession,
+    filters: ExportFilters = ExportFilters(),
+    after: Optional[Cursor] = None,
+    batch_size: int = BATCH_SIZE,
+    limit: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield one record per conversation (at most `limit`), messages oldest first.
+
+    Rows are streamed from a server-side cursor `batch_size` at a time;
+    only the current batch and conversation are held in memory.
+    """
+    # Core rows straight from the connection; the ORM result layer adds nothing here
+    connection = await db.connection()
+    result = await connection.stream(transcript_query(filters, after, limit).execution_options(yield_per=batch_size))
+    record: Optional[Dict[str, Any]] = None
+    # Whole batches at a time: iterating rows one by one costs a greenlet switch each
+    async for partition in result.partitions():
+        for (conversation_id, session_id, channel, locale, status, started_at, ended_at, handoffs, rating,
+             comment, message_id, role, content, intent, confidence, message_created_at) in partition:
+            if record is None or record["id"] != conversation_id:
+                if record is not None:
+                    yield record
+                record = {
+                    "cursor": format_cursor((started_at, conversation_id)),
+                    "id": conversation_id,
+                    "session_id": session_id,
+                    "channel": channel,
+                    "locale": locale,
+                    "status": status,
+                    "started_at": started_at,
+                    "ended_at": ended_at,
+                    "handoffs": handoffs or [],
+                    "feedback": {"rating": rating, "comment": comment} if rating is not None else None,
+                    "messages": [],
+                }
+            if message_id is not None:
+                record["messages"].append({
+                    "id": message_id,
+                    "role": role,
+                    "content": content,
+                    "intent": intent,
+                    "confidence": confidence,
+                    "created_at": message_created_at,
+                })
+    if record is not None:
+        yield record
+
+
+def encode_ndjson(record: Dict[str, Any]) -> bytes:
+    return to_json(record) + b"\n"
+
+
+class NDJSONWriter:
+    """Appends records to one file; each checkpoint ends a gzip member.
+
+    Resuming truncates the file to the last checkpoint's offset, so lines
+    written after it (and a partial gzip member) are discarded, not duplicated.
+    """
+
+    def __init__(self, path: Path, compression: str = "none", offset: int = 0):
+        self.compression = compression
+        self._buffer: List[bytes] = []
+        self._file = open(path, "r+b" if offset else "wb")
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._buffer.append(encode_ndjson(record))
+
+    def checkpoint(self) -> Dict[str, Any]:
+        data = b"".join(self._buffer)
+        self._buffer = []
+        if data:
+            self._file.write(gzip.compress(data, compresslevel=6) if self.compression == "gzip" else data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        return {"offset": self._file.tell()}
+
+    def close(self) -> None:
+        self._file.close()
+
+
+PARQUET_COLUMNS = (
+    "conversation_id", "session_id", "channel", "locale", "status", "started_at", "ended_at", "handoffs",
+    "feedback_rating", "feedback_comment", "message_id", "role", "content", "intent", "confidence", "message_created_at",
+)
+
+
+class ParquetWriter:
+    """Writes a directory of Parquet part files, one per checkpoint.
+
+    One row per message, with the conversation's columns repeated (they
+    compress well), its handoffs as a JSON string and its feedback as
+    two columns. Resuming deletes
+    parts past the checkpoint and carries on numbering from there.
+    """
+
+    def __init__(self, path: Path, compression: str = "snappy", parts: int = 0):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("Parquet export requires the 'pyarrow' package (the 'export' extra)") from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.compression = compression
+        self.parts = parts
+        path.mkdir(parents=True, exist_ok=True)
+        for stale in path.glob("part-*.parquet"):
+            if int(stale.stem.split("-")[1]) >= parts:
+                stale.unlink()
+        self._columns: Dict[str, List[Any]] = {name: [] for name in PARQUET_COLUMNS}
+
+    def write(self, record: Dict[str, Any]) -> None:
+        handoffs = json.dumps(record["handoffs"]) if record["handoffs"] else None
+        feedback = record["feedback"] or {}
+        conversation = (
+            str(record["id"]), record["session_id"], record["channel"], record["locale"],
+            record["status"], record["started_at"], record["ended_at"], handoffs,
+            feedback.get("rating"), feedback.get("comment"),
+        )
+        for message in record["messages"] or [None]:
+            values = conversation + (
+                (str(message["id"]), message["role"], message["content"], message["intent"],
+                 message["confidence"], message["created_at"])
+                if message else (None,) * 6
+            )
+            for name, value in zip(PARQUET_COLUMNS, values):
+                self._columns[name].append(value)
+
+    def checkpoint(self) -> Dict[str, Any]:
+        if self._columns["conversation_id"]:
+            table = self._pa.table(self._columns)
+            part = self.path / f"part-{self.parts:05d}.parquet"
+            tmp = part.with_suffix(".tmp")
+            self._pq.write_table(table, tmp, compression=None if self.compression == "none" else self.compression)
+            os.replace(tmp, part)
+            self.parts += 1
+            self._columns = {name: [] for name in PARQUET_COLUMNS}
+        return {"parts": self.parts}
+
+    def close(self) -> None:
+        pass
+
+
+class ExportStats(NamedTuple):
+    conversations: int
+    messages: int
+    seconds: float
+    resumed: bool
+
+
+def _load_checkpoint(path: Path, settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    try:
+        checkpoint = json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
+    if checkpoint.get("settings") != settings:
+        raise ValueError(
+            f"Checkpoint {path} was written by an export with different settings; "
+            f"delete it to start over"
+        )
+    return checkpoint
+
+
+def _save_checkpoint(path: Path, checkpoint: Dict[str, Any]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(checkpoint))
+    os.replace(tmp, path)
+
+
+async def export_to_path(
+    session_factory: Callable[[], AsyncSession],
+    output: Path,
+    filters: ExportFilters = ExportFilters(),
+    format: str = "ndjson",
+    compression: str = "none",
+    checkpoint_path: Optional[Path] = None,
+    checkpoint_every: int = 1000,
+    batch_size: int = BATCH_SIZE,
+) -> ExportStats:
+    """Export transcripts to `output`, resuming from `checkpoint_path` if it exists.
+
+    The checkpoint is removed once the export completes.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format!r}; expected one of {', '.join(FORMATS)}")
+    if compression not in COMPRESSIONS[format]:
+        raise ValueError(f"{format} supports compression {', '.join(COMPRESSIONS[format])}, not {compression!r}")
+    checkpoint_path = checkpoint_path or output.with_name(output.name + ".checkpoint")
+    settings = {"format": format, "compression": compression, "filters": filters.to_json()}
+    checkpoint = _load_checkpoint(checkpoint_path, settings)
+    position = checkpoint["position"] if checkpoint else {}
+    if format == "ndjson":
+        writer = NDJSONWriter(output, compression, offset=position.get("offset", 0))
+    else:
+        writer = ParquetWriter(output, compression, parts=position.get("parts", 0))
+    after = parse_cursor(checkpoint["cursor"]) if checkpoint else None
+    conversations = checkpoint["conversations"] if checkpoint else 0
+    messages = checkpoint["messages"] if checkpoint else 0
+    if checkpoint:
+        logger.info(f"Resuming export after {conversations} conversations ({checkpoint['cursor']})")
+
+    start = time.perf_counter()
+    try:
+        async with session_factory() as db:
+            since_checkpoint = 0
+            async for record in iter_transcripts(db, filters, after, batch_size):
+                writer.write(record)
+                conversations += 1
+                messages += len(record["messages"])
+                since_checkpoint += 1
+                if since_checkpoint >= checkpoint_every:
+                    _save_checkpoint(checkpoint_path, {
+                        "settings": settings,
+                        "cursor": record["cursor"],
+                        "position": writer.checkpoint(),
+                        "conversations": conversations,
+                        "messages": messages,
+                    })
+                    since_checkpoint = 0
+        writer.checkpoint()
+    finally:
+        writer.close()
+    checkpoint_path.unlink(missing_ok=True)
+    return ExportStats(conversations, messages, time.perf_counter() - start, checkpoint is not None)
+
+
+def _datetime(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def main() -> None:
+    from app.database import ReplicaSessionLocal, dispose_async_engine
+
+    parser = argparse.ArgumentParser(description="Export conversation transcripts as NDJSON or Parquet.")
+    parser.add_argument("output", type=Path, help="output file (ndjson) or directory (parquet)")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--compression", default="none", help="ndjson: none, gzip; parquet: none, snappy, gzip, zstd")
+    parser.add_argument("--from", dest="started_from", type=_datetime, help="conversations started at or after")
+    parser.add_argument("--to", dest="started_to", type=_datetime, help="conversations started before")
+    parser.add_argument("--ended-before", type=_datetime, help="closed conversations that ended before")
+    parser.add_argument("--channel")
+    parser.add_argument("--intent", help="conversations with a message of this intent")
+    parser.add_argument("--handoff-status", help='conversations with a handoff in this status, or "none"')
+    parser.add_argument("--checkpoint", type=Path, help="default: <output>.checkpoint")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="conversations between checkpoints")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per cursor fetch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    filters = ExportFilters(
+        args.started_from, args.started_to, args.channel, args.intent, args.handoff_status, args.ended_before
+    )
+
+    async def run() -> ExportStats:
+        try:
+            return await export_to_path(
+                ReplicaSessionLocal, args.output, filters, args.format, args.compression,
+                args.checkpoint, args.checkpoint_every, args.batch_size,
+            )
+        finally:
+            await dispose_async_engine()
+
+    try:
+        stats = asyncio.run(run())
+    except ValueError as e:
+        parser.error(str(e))
+    print(
+        f"{stats.conversations} conversations, {stats.messages} messages in {stats.seconds:.1f}s "
+        f"({stats.messages / max(stats.seconds, 1e-9):.0f} messages/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
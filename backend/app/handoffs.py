@@ -0,0 +1,398 @@
+"""Deliver handoffs to a ticketing provider from a background worker.
+
+Chat turns that escalate only insert a handoff with status 'pending'; this
+worker turns them into helpdesk tickets off the request path:
+
+1. Claim: a batch of due handoffs is locked with FOR UPDATE SKIP LOCKED
+   and marked 'processing' in one short transaction, so concurrent
+   workers (in this process or others) never pick the same handoff. A
+   claim expires once its batch should have finished; handoffs of a
+   worker that died are then picked up again.
+2. Deliver: `create_ticket` is called for each claimed handoff, at most
+   HANDOFF_CONCURRENCY at a time, each bounded by HANDOFF_TIMEOUT seconds.
+3. Record: a ticket sets status 'created', `provider` and `ticket_id`.
+   Errors and timeouts put the handoff back to 'pending' after a backoff
+   (HANDOFF_BACKOFF seconds, doubling per attempt up to HANDOFF_BACKOFF_MAX,
+   with jitter); after HANDOFF_MAX_ATTEMPTS, or on an error the provider
+   marks as not retryable, it is 'failed' with the last error.
+
+HANDOFF_PROVIDER selects the provider: `fake` for `FakeTicketProvider`, or
+`package.module:factory` for a `TicketProvider` of your own. Unset, the
+worker doesn't run and handoffs stay pending. The app runs the worker in
+process; `python -m app.handoffs` runs it on its own.
+
+A handoff can be delivered again after its ticket was created (the worker
+died before recording it), so providers should use the handoff id as an
+idempotency key. Queue depth, delivery latency and provider call
+durations are exported as chatbot_handoff_* metrics.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+import argparse
+import asyncio
+import importlib
+import logging
+import math
+import os
+import random
+import time
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from app import metrics, models
+
+logger = logging.getLogger(__name__)
+
+# Latest messages of the conversation sent with each ticket
+TRANSCRIPT_MESSAGES = 20
+# Added to a claim's expiry on top of the time its batch needs
+CLAIM_MARGIN = 30.0
+
+HANDOFF_DELIVERIES = metrics.Counter(
+    "chatbot_handoff_deliveries_total",
+    "Handoff delivery attempts by result (created, retry, failed).",
+    ["result"],
+)
+HANDOFF_PROVIDER_DURATION = metrics.Histogram(
+    "chatbot_handoff_provider_duration_seconds",
+    "Duration of ticket provider calls by result (ok, error, timeout).",
+    ["result"],
+)
+HANDOFF_LATENCY = metrics.Histogram(
+    "chatbot_handoff_latency_seconds",
+    "Time from a handoff being saved to its ticket being recorded.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+_queue_depth = 0.0
+HANDOFF_QUEUE_DEPTH = metrics.Gauge(
+    "chatbot_handoff_queue_depth",
+    "Handoffs pending or being delivered, as of the worker's last poll.",
+    lambda: _queue_depth,
+)
+
+
+class TicketRequest(NamedTuple):
+    handoff_id: UUID
+    conversation_id: UUID
+    session_id: str
+    reason: Optional[str]
+    # (role, content) of the latest messages, oldest first
+    transcript: List[Tuple[str, str]]
+    # 1 for the first delivery of this handoff
+    attempt: int
+
+
+class TicketError(Exception):
+    """A provider failure; `retryable=False` fails the handoff without retrying."""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TicketProvider(ABC):
+    """Creates helpdesk tickets; `name` is stored in handoffs.provider."""
+
+    name = "provider"
+
+    @abstractmethod
+    async def create_ticket(self, request: TicketRequest) -> str:
+        """Create a ticket for the handoff and return its id, or raise TicketError."""
+
+
+class FakeTicketProvider(TicketProvider):
+    """In-memory provider for local development and tests.
+
+    Each call takes `latency` seconds and the first `fail_times` calls
+    fail. Tickets are keyed by handoff id, so delivering a handoff again
+    returns the ticket it already has.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, fail_times: int = 0):
+        self.latency = latency
+        self.fail_times = fail_times
+        self.requests: List[TicketRequest] = []
+        self.tickets: Dict[UUID, str] = {}
+
+    async def create_ticket(self, request: TicketRequest) -> str:
+        self.requests.append(request)
+        await asyncio.sleep(self.latency)
+        if len(self.requests) <= self.fail_times:
+            raise TicketError(f"Fake failure {len(self.requests)} of {self.fail_times}")
+        return self.tickets.setdefault(request.handoff_id, f"FAKE-{len(self.tickets) + 1}")
+
+
+def load_provider(spec: str) -> Optional[TicketProvider]:
+    """Provider for a HANDOFF_PROVIDER value, or None if it is empty."""
+    if not spec:
+        return None
+    if spec == "fake":
+        return FakeTicketProvider()
+    module_name, _, factory = spec.partition(":")
+    if not factory:
+        raise ValueError(f"HANDOFF_PROVIDER must be 'fake' or 'package.module:factory', not {spec!r}")
+    return getattr(importlib.import_module(module_name), factory)()
+
+
+class _Claimed(NamedTuple):
+    request: TicketRequest
+    created_at: datetime
+
+
+class HandoffWorker:
+    def __init__(
+        self,
+        provider: TicketProvider,
+        batch_size: int = 20,
+        concurrency: int = 10,
+        timeout: float = 10.0,
+        max_attempts: int = 5,
+        backoff: float = 2.0,
+        backoff_max: float = 300.0,
+        poll_interval: float = 1.0,
+        engine: Optional[AsyncEngine] = None,
+    ):
+        self.provider = provider
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        # Defaults to the app's engine, resolved when the worker runs
+        self.engine = engine
+        # Long enough for a whole batch of calls that all time out
+        self.claim_timeout = timeout * math.ceil(batch_size / concurrency) + CLAIM_MARGIN
+        self._stopping: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["HandoffWorker"]:
+        """Worker for HANDOFF_PROVIDER, or None if no provider is configured."""
+        provider = load_provider(os.getenv("HANDOFF_PROVIDER", ""))
+        if provider is None:
+            return None
+        return cls(
+            provider,
+            batch_size=int(os.getenv("HANDOFF_BATCH_SIZE", "20")),
+            concurrency=int(os.getenv("HANDOFF_CONCURRENCY", "10")),
+            timeout=float(os.getenv("HANDOFF_TIMEOUT", "10")),
+            max_attempts=int(os.getenv("HANDOFF_MAX_ATTEMPTS", "5")),
+            backoff=float(os.getenv("HANDOFF_BACKOFF", "2")),
+            backoff_max=float(os.getenv("HANDOFF_BACKOFF_MAX", "300")),
+            poll_interval=float(os.getenv("HANDOFF_POLL_INTERVAL", "1")),
+        )
+
+    async def run_once(self) -> Dict[str, int]:
+        """Claim one batch and deliver it; returns counts by result."""
+        from app.database import get_async_engine
+
+        global _queue_depth
+        session_factory = async_sessionmaker(self.engine or get_async_engine(), expire_on_commit=False)
+        claimed = await self._claim(session_factory)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        outcomes = await asyncio.gather(*(self._deliver(session_factory, semaphore, item) for item in claimed))
+        async with session_factory() as db:
+            _queue_depth = await db.scalar(
+                select(func.count()).select_from(models.Handoff).where(_queued(models.Handoff))
+            )
+        counts = {"claimed": len(claimed), "created": 0, "retry": 0, "failed": 0}
+        for outcome in outcomes:
+            counts[outcome] += 1
+        return counts
+
+    async def _claim(self, session_factory) -> List[_Claimed]:
+        handoff, conversation, message = models.Handoff, models.Conversation, models.Message
+        batch = (
+            select(handoff.id)
+            .where(_queued(handoff), handoff.next_attempt_at <= func.now())
+            .order_by(handoff.next_attempt_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .cte()
+        )
+        async with session_factory() as db:
+            rows = (await db.execute(
+                update(handoff)
+                .where(handoff.id.in_(select(batch.c.id)))
+                .values(
+                    status="processing",
+                    attempts=handoff.attempts + 1,
+                    next_attempt_at=func.now() + timedelta(seconds=self.claim_timeout),
+                    updated_at=func.now(),
+                )
+                .returning(handoff.id, handoff.conversation_id, handoff.reason, handoff.attempts, handoff.created_at)
+            )).all()
+            await db.commit()
+            if not rows:
+                return []
+
+            conversation_ids = {row.conversation_id for row in rows}
+            session_ids = dict((await db.execute(
+                select(conversation.id, conversation.session_id).where(conversation.id.in_(conversation_ids))
+            )).all())
+            recent = (
+                select(
+                    message.conversation_id,
+                    message.role,
+                    message.content,
+                    func.row_number().over(
+                        partition_by=message.conversation_id, order_by=message.created_at.desc()
+                    ).label("position"),
+                )
+                .where(message.conversation_id.in_(conversation_ids))
+                .subquery()
+            )
+            transcripts: Dict[UUID, List[Tuple[str, str]]] = {}
+            for conversation_id, role, content in await db.execute(
+                select(recent.c.conversation_id, recent.c.role, recent.c.content)
+                .where(recent.c.position <= TRANSCRIPT_MESSAGES)
+                .order_by(recent.c.conversation_id, recent.c.position.desc())
+            ):
+                transcripts.setdefault(conversation_id, []).append((role, content))
+
+        return [
+            _Claimed(
+                TicketRequest(
+                    handoff_id=row.id,
+                    conversation_id=row.conversation_id,
+                    session_id=session_ids[row.conversation_id],
+                    reason=row.reason,
+                    transcript=transcripts.get(row.conversation_id, []),
+                    attempt=row.attempts,
+                ),
+                row.created_at,
+            )
+            for row in rows
+        ]
+
+    async def _deliver(self, session_factory, semaphore: asyncio.Semaphore, item: _Claimed) -> str:
+        request = item.request
+        ticket_id, error, retryable = None, None, True
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ticket_id = await asyncio.wait_for(self.provider.create_ticket(request), self.timeout)
+                result = "ok"
+            except asyncio.TimeoutError:
+                error, result = f"Timed out after {self.timeout}s", "timeout"
+            except TicketError as e:
+                error, retryable, result = str(e), e.retryable, "error"
+            except Exception as e:
+                error, result = f"{type(e).__name__}: {e}", "error"
+            HANDOFF_PROVIDER_DURATION.observe(time.perf_counter() - start, result)
+
+        handoff = models.Handoff
+        values: Dict[str, Any] = {"updated_at": func.now()}
+        if error is None:
+            outcome = "created"
+            values.update(status="created", provider=self.provider.name, ticket_id=ticket_id, last_error=None)
+        elif retryable and request.attempt < self.max_attempts:
+            outcome = "retry"
+            values.update(
+                status="pending",
+                last_error=error,
+                next_attempt_at=func.now() + timedelta(seconds=self._backoff(request.attempt)),
+            )
+        else:
+            outcome = "failed"
+            values.update(status="failed", last_error=error)
+
+        async with session_factory() as db:
+            # Only if the claim is still ours: after it expires the handoff
+            # may have been claimed again
+            recorded = (await db.execute(
+                update(handoff)
+                .where(
+                    handoff.id == request.handoff_id,
+                    handoff.status == "processing",
+                    handoff.attempts == request.attempt,
+                )
+                .values(**values)
+            )).rowcount
+            await db.commit()
+        if not recorded:
+            logger.warning(f"Handoff {request.handoff_id}: claim expired, {outcome} result discarded")
+        HANDOFF_DELIVERIES.inc(outcome)
+        if outcome == "created":
+            HANDOFF_LATENCY.observe((datetime.now(timezone.utc) - item.created_at).total_seconds())
+        else:
+            logger.warning(f"Handoff {request.handoff_id} attempt {request.attempt} failed ({outcome}): {error}")
+        return outcome
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff * 2 ** (attempt - 1))
+        # Jitter spreads out retries of handoffs that failed together
+        return delay * random.uniform(0.5, 1.0)
+
+    def start(self) -> None:
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(), name="handoff-worker")
+
+    async def stop(self) -> None:
+        """Finish the batch in progress and stop."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, self.claim_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Handoff worker stopped mid-batch; its claims are retried when they expire")
+        self._task = None
+
+    async def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                result = await self.run_once()
+            except Exception as e:
+                logger.error(f"Handoff delivery failed: {e}", exc_info=True)
+                result = None
+            # A full batch suggests more is due: claim again straight away
+            if result is None or result["claimed"] < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+
+def _queued(handoff):
+    return handoff.status.in_(("pending", "processing"))
+
+
+def main() -> None:
+    from app.database import dispose_async_engine
+
+    parser = argparse.ArgumentParser(description="Deliver pending handoffs to the ticketing provider.")
+    parser.add_argument("--once", action="store_true", help="deliver one batch and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    worker = HandoffWorker.from_env()
+    if worker is None:
+        parser.error("set HANDOFF_PROVIDER to run the handoff worker")
+
+    async def run() -> None:
+        try:
+            if args.once:
+                print(", ".join(f"{key}: {value}" for key, value in (await worker.run_once()).items()))
+            else:
+                worker.start()
+                await worker._task
+        finally:
+            await dispose_async_engine()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
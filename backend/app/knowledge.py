@@ -1,18 +1,31 @@
 """Simple in-memory FAQ/knowledge base for MVP.
 
-In production, replace this with a proper retrieval system
-(vector DB, full-text search, or external knowledge API).
+FAQs are matched by keyword (`FAQIndex`) or, with FAQ_RETRIEVER=bm25, ranked
+by the BM25 engine in `app.retrieval`. In production, replace this with a
+proper retrieval system (vector DB, full-text search, or external knowledge
+API).
 """
 
-from typing import Optional, List, Tuple
+from functools import cached_property
+from typing import Any, Dict, FrozenSet, Iterable, Optional, List, Tuple
+import os
 import re
 
+from app.matching import KeywordAutomaton
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fold_keyword(keyword: str) -> str:
+    """Lowercase a keyword and collapse its whitespace, as normalize_message does."""
+    return _WHITESPACE.sub(" ", keyword.lower())
+
 
 class FAQ:
     def __init__(self, question: str, answer: str, keywords: List[str]):
         self.question = question
         self.answer = answer
-        self.keywords = [k.lower() for k in keywords]
+        self.keywords = [fold_keyword(k) for k in keywords]
 
 
 # MVP Knowledge Base
@@ -50,62 +63,322 @@ FAQS = [
 ]
 
 
-def find_best_faq(message: str) -> Optional[Tuple[FAQ, float]]:
-    """
-    Simple keyword matching to find relevant FAQ.
-    Returns (FAQ, confidence_score) or None.
+class FAQIndex:
+    """Keyword index over a list of FAQs, compiled once per knowledge base.
+
+    Every distinct keyword is fed into a single automaton, and an inverted
+    index maps each keyword to the FAQs that list it along with its weight,
+    so matching cost depends on the message rather than on the FAQ count.
     """
-    message_lower = message.lower()
-    
-    best_match = None
-    best_score = 0.0
-    
-    for faq in FAQS:
-        score = 0
-        matched_keywords = 0
-        
-        for keyword in faq.keywords:
-            if keyword in message_lower:
-                matched_keywords += 1
-                # Longer keywords get higher weight
-                score += len(keyword.split())
-        
-        if matched_keywords > 0:
+
+    def __init__(self, faqs: List[FAQ]):
+        self.faqs = list(faqs)
+        self._keyword_count = [len(faq.keywords) for faq in self.faqs]
+
+        keyword_ids: Dict[str, int] = {}
+        postings: List[Dict[int, int]] = []
+        for faq_pos, faq in enumerate(self.faqs):
+            for keyword in faq.keywords:
+                keyword_id = keyword_ids.setdefault(keyword, len(keyword_ids))
+                if keyword_id == len(postings):
+                    postings.append({})
+                # Longer keywords get higher weight; duplicates count twice
+                weight = postings[keyword_id].get(faq_pos, 0)
+                postings[keyword_id][faq_pos] = weight + len(keyword.split())
+
+        self.keywords = list(keyword_ids)
+        self._postings = [sorted(p.items()) for p in postings]
+        self._automaton = KeywordAutomaton(self.keywords)
+
+    def best_match(self, message_lower: str) -> Optional[Tuple[FAQ, float]]:
+        """Return (FAQ, confidence_score) for an already lowercased message."""
+        return self.score_keywords(self._automaton.search(message_lower))
+
+    def score_keywords(self, keyword_ids: Iterable[int]) -> Optional[Tuple[FAQ, float]]:
+        """Return (FAQ, confidence_score) given the ids of matched keywords."""
+        scores: Dict[int, int] = {}
+        for keyword_id in keyword_ids:
+            for faq_pos, weight in self._postings[keyword_id]:
+                scores[faq_pos] = scores.get(faq_pos, 0) + weight
+
+        best_pos = None
+        best_score = 0.0
+        for faq_pos, score in scores.items():
             # Normalize by number of keywords in FAQ
-            normalized_score = score / len(faq.keywords)
-            if normalized_score > best_score:
+            normalized_score = score / self._keyword_count[faq_pos]
+            # Ties go to the FAQ listed first, as with a linear scan
+            if normalized_score > best_score or (
+                normalized_score == best_score and best_pos is not None and faq_pos < best_pos
+            ):
                 best_score = normalized_score
-                best_match = faq
-    
-    # Only return if we have reasonable confidence
-    if best_match and best_score > 0.15:
-        # Convert to 0-100 scale, cap at 95 for simple keyword matching
-        confidence = min(best_score * 100, 95)
-        return best_match, confidence
-    
+                best_pos = faq_pos
+
+        # Only return if we have reasonable confidence
+        if best_pos is not None and best_score > 0.15:
+            # Convert to 0-100 scale, cap at 95 for simple keyword matching
+            confidence = min(best_score * 100, 95)
+            return self.faqs[best_pos], confidence
+
+        return None
+
+
+class IntentRule:
+    """Declarative intent rule: any keyword or entity match triggers it."""
+
+    def __init__(self, intent: str, keywords: List[str], priority: int, entity_pattern: Optional[str] = None):
+        self.intent = intent
+        self.keywords = [fold_keyword(k) for k in keywords]
+        self.priority = priority
+        self.entity_pattern = re.compile(entity_pattern, re.IGNORECASE) if entity_pattern else None
+
+
+# Higher priority wins when several rules match
+INTENT_RULES = [
+    IntentRule(
+        intent="order_tracking",
+        keywords=["track", "where is my order", "order status"],
+        priority=30,
+        entity_pattern=r'\b(ORD-\d+|#\d{5,}|\d{10,})\b',
+    ),
+    IntentRule(
+        intent="returns",
+        keywords=["return", "refund", "send back", "exchange"],
+        priority=20,
+    ),
+    IntentRule(
+        intent="escalation",
+        keywords=["agent", "human", "representative", "person", "speak to"],
+        priority=10,
+    ),
+]
+
+DEFAULT_INTENT = "faq"
+
+# Stands in for extracted entities in normalized text; still matches the
+# order number pattern, so the intent rules see an order number
+ENTITY_PLACEHOLDER = "ord-0"
+
+
+def mask_entities(text: str) -> str:
+    """Replace every extractable entity in `text` with ENTITY_PLACEHOLDER."""
+    for rule in INTENT_RULES:
+        if rule.entity_pattern:
+            text = rule.entity_pattern.sub(f" {ENTITY_PLACEHOLDER} ", text)
+    return text
+
+
+class MessageAnalysis:
+    """Result of analyzing one message: intent, entity and FAQ keyword hits."""
+
+    def __init__(
+        self,
+        text: str,
+        text_lower: str,
+        intent: str,
+        extracted_value: Optional[str],
+        faq_keyword_ids: FrozenSet[int],
+        faq_index: "FAQIndex",
+        retriever: Any = None,
+    ):
+        self.text = text
+        self.text_lower = text_lower
+        self.intent = intent
+        self.extracted_value = extracted_value
+        self.faq_keyword_ids = faq_keyword_ids
+        self._faq_index = faq_index
+        self._retriever = retriever
+
+    @cached_property
+    def faq_match(self) -> Optional[Tuple[FAQ, float]]:
+        """Best FAQ for this message, scored from the hits already found."""
+        if self._retriever is not None:
+            return self._retriever.best_match(self.text)
+        return self._faq_index.score_keywords(self.faq_keyword_ids)
+
+
+class IntentEngine:
+    """Intent rules and FAQ keywords compiled into one automaton.
+
+    `analyze` lowercases the message once (not at all if it is already
+    `folded`, e.g. by `normalize_message`) and scans it once for every intent
+    keyword and FAQ keyword; only the winning rule's entity pattern (if any)
+    runs as a separate regex search.
+    """
+
+    def __init__(self, rules: List[IntentRule], faq_index: FAQIndex, retriever: Any = None):
+        self.rules = sorted(rules, key=lambda rule: -rule.priority)
+        self.faq_index = faq_index
+        # Ranks FAQs instead of the keyword index when set
+        self.retriever = retriever
+
+        pattern_ids: Dict[str, int] = {}
+        self._pattern_rules: List[List[int]] = []
+        self._pattern_faq_keyword: List[Optional[int]] = []
+
+        def add_pattern(pattern: str) -> int:
+            pattern_id = pattern_ids.setdefault(pattern, len(pattern_ids))
+            if pattern_id == len(self._pattern_rules):
+                self._pattern_rules.append([])
+                self._pattern_faq_keyword.append(None)
+            return pattern_id
+
+        for rule_pos, rule in enumerate(self.rules):
+            for keyword in rule.keywords:
+                self._pattern_rules[add_pattern(keyword)].append(rule_pos)
+        for keyword_id, keyword in enumerate(faq_index.keywords):
+            self._pattern_faq_keyword[add_pattern(keyword)] = keyword_id
+
+        self._automaton = KeywordAutomaton(pattern_ids)
+
+    def analyze(self, message: str, folded: bool = False) -> MessageAnalysis:
+        message_lower = message if folded else message.lower()
+
+        matched_rules = set()
+        faq_keyword_ids = set()
+        for pattern_id in self._automaton.search(message_lower):
+            matched_rules.update(self._pattern_rules[pattern_id])
+            faq_keyword_id = self._pattern_faq_keyword[pattern_id]
+            if faq_keyword_id is not None:
+                faq_keyword_ids.add(faq_keyword_id)
+
+        intent = DEFAULT_INTENT
+        extracted_value = None
+        for rule_pos, rule in enumerate(self.rules):
+            entity_match = rule.entity_pattern.search(message) if rule.entity_pattern else None
+            if entity_match or rule_pos in matched_rules:
+                intent = rule.intent
+                extracted_value = entity_match.group(0) if entity_match else None
+                break
+
+        return MessageAnalysis(
+            text=message,
+            text_lower=message_lower,
+            intent=intent,
+            extracted_value=extracted_value,
+            faq_keyword_ids=frozenset(faq_keyword_ids),
+            faq_index=self.faq_index,
+            retriever=self.retriever,
+        )
+
+
+# FAQ matching engine: keyword (FAQIndex) or bm25 (app.retrieval, needs numpy)
+FAQ_RETRIEVER = os.getenv("FAQ_RETRIEVER", "keyword").lower()
+# BM25Retriever parameters
+BM25_PARAMS = {"k1": 1.2, "b": 0.75, "min_confidence": float(os.getenv("BM25_MIN_CONFIDENCE", "25"))}
+
+
+def _build_retriever(faqs: Iterable[FAQ]) -> Any:
+    if FAQ_RETRIEVER == "bm25":
+        from app.retrieval import BM25Retriever
+
+        return BM25Retriever(faqs, **BM25_PARAMS)
     return None
 
 
+def engine_fingerprint() -> str:
+    """What a compiled snapshot depends on besides its FAQs: the intent rules
+    and the retriever settings. Part of the knowledge cache key."""
+    rules = [
+        (rule.intent, rule.keywords, rule.priority, rule.entity_pattern.pattern if rule.entity_pattern else None)
+        for rule in INTENT_RULES
+    ]
+    retriever = sorted(BM25_PARAMS.items()) if FAQ_RETRIEVER == "bm25" else None
+    return repr((rules, FAQ_RETRIEVER, retriever))
+
+
+class KnowledgeSnapshot:
+    """A knowledge base compiled for matching: FAQs, keyword index, intent
+    automaton and (if configured) retriever.
+
+    Snapshots are never modified after construction. Installing one is a
+    single reference swap, so a reload never pauses in-flight requests and
+    each request sees one consistent snapshot.
+    """
+
+    def __init__(self, faqs: Iterable[FAQ], source: Optional[str] = None):
+        self.faqs = tuple(faqs)
+        self.source = source
+        self.retriever_name = FAQ_RETRIEVER
+        self.faq_index = FAQIndex(self.faqs)
+        self.retriever = _build_retriever(self.faqs)
+        self.intent_engine = IntentEngine(INTENT_RULES, self.faq_index, self.retriever)
+
+    def analyze(self, message: str, folded: bool = False) -> MessageAnalysis:
+        return self.intent_engine.analyze(message, folded)
+
+    def find_best_faq(self, message: str) -> Optional[Tuple[FAQ, float]]:
+        if self.retriever is not None:
+            return self.retriever.best_match(message)
+        return self.faq_index.best_match(message.lower())
+
+
+# (version, snapshot) in use. The version increases with every install so
+# derived caches can tell they're stale.
+_active: Tuple[int, KnowledgeSnapshot] = (0, KnowledgeSnapshot(FAQS))
+
+
+def install_snapshot(snapshot: KnowledgeSnapshot) -> int:
+    """Make `snapshot` the active knowledge base; returns its version."""
+    global FAQS, _active
+    version = _active[0] + 1
+    _active = (version, snapshot)
+    FAQS = list(snapshot.faqs)
+    return version
+
+
+def active_snapshot() -> Tuple[int, KnowledgeSnapshot]:
+    return _active
+
+
+def set_faqs(faqs: List[FAQ]) -> None:
+    """Replace the knowledge base and rebuild its keyword index."""
+    install_snapshot(KnowledgeSnapshot(faqs))
+
+
+def faqs_version() -> int:
+    return _active[0]
+
+
+def normalize_message(message: str) -> Tuple[str, Dict[str, str]]:
+    """Fold case and whitespace and mask extracted entities.
+
+    Returns (normalized text, {intent: entity}) where the entities are the
+    values masked out of the text, keyed by the rule that extracts them.
+    Messages that differ only in their order numbers normalize to the same
+    text, so anything derived from it is safe to share between users.
+    Punctuation is kept: keywords such as "24/7" or "c++" contain it.
+    """
+    entities = {}
+    for rule in INTENT_RULES:
+        if rule.entity_pattern:
+            entity_match = rule.entity_pattern.search(message)
+            if entity_match:
+                entities[rule.intent] = entity_match.group(0)
+                message = rule.entity_pattern.sub(f" {ENTITY_PLACEHOLDER} ", message)
+    return _WHITESPACE.sub(" ", message.lower()).strip(), entities
+
+
+def analyze_message(message: str, folded: bool = False) -> MessageAnalysis:
+    """Run intent detection, entity extraction and FAQ matching in one pass.
+
+    Pass folded=True for text from `normalize_message`, which is already
+    lowercase.
+    """
+    return _active[1].analyze(message, folded)
+
+
+def find_best_faq(message: str) -> Optional[Tuple[FAQ, float]]:
+    """
+    Find the most relevant FAQ with the configured engine (FAQ_RETRIEVER).
+    Returns (FAQ, confidence_score) or None.
+    """
+    return _active[1].find_best_faq(message)
+
+
 def detect_intent(message: str) -> Tuple[str, Optional[str]]:
     """
     Detect user intent and extract any relevant entities.
     Returns (intent, extracted_value).
     """
-    message_lower = message.lower()
-    
-    # Order tracking intent
-    order_pattern = r'\b(ORD-\d+|#\d{5,}|\d{10,})\b'
-    order_match = re.search(order_pattern, message, re.IGNORECASE)
-    if order_match or any(kw in message_lower for kw in ["track", "where is my order", "order status"]):
-        return "order_tracking", order_match.group(0) if order_match else None
-    
-    # Returns intent
-    if any(kw in message_lower for kw in ["return", "refund", "send back", "exchange"]):
-        return "returns", None
-    
-    # Agent escalation
-    if any(kw in message_lower for kw in ["agent", "human", "representative", "person", "speak to"]):
-        return "escalation", None
-    
-    # Default: FAQ search
-    return "faq", None
+    analysis = _active[1].analyze(message)
+    return analysis.intent, analysis.extracted_value
@@ -0,0 +1,207 @@
+"""Load the knowledge base from a JSON or YAML file and hot-reload it.
+
+The file holds a list of FAQs (or a mapping with a `faqs` list), each with
+`question`, `answer` and `keywords`:
+
+    {"faqs": [{"question": "...", "answer": "...", "keywords": ["..."]}]}
+
+Compiled snapshots are cached in a binary file next to the source (or at
+KNOWLEDGE_CACHE_PATH), keyed by a hash of the file contents and the
+matching configuration (intent rules, retriever and its parameters), so a
+restart with unchanged content and code skips parsing and indexing. The cache is a pickle: keep it somewhere only the app can
+write.
+
+`KnowledgeReloader` rebuilds snapshots in a worker thread, off the event
+loop, and installs them with `knowledge.install_snapshot`. Reloads are
+triggered by the file changing (polled every KNOWLEDGE_RELOAD_INTERVAL
+seconds) or by the admin reload endpoint.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+
+from app import knowledge
+from app.knowledge import FAQ, KnowledgeSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Bump when KnowledgeSnapshot or the classes it holds change shape
+CACHE_FORMAT = 3
+
+
+class KnowledgeFileError(ValueError):
+    """The knowledge base file is missing, unreadable or malformed."""
+
+
+def parse_faqs(raw: bytes, suffix: str) -> List[FAQ]:
+    if suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise KnowledgeFileError("YAML knowledge files require the 'PyYAML' package") from e
+        try:
+            data = yaml.safe_load(raw)
+        except yaml.YAMLError as e:
+            raise KnowledgeFileError(f"Invalid YAML: {e}") from e
+    else:
+        try:
+            data = json.loads(raw)
+        except ValueError as e:
+            raise KnowledgeFileError(f"Invalid JSON: {e}") from e
+
+    entries = data.get("faqs") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        raise KnowledgeFileError("Expected a list of FAQs or a mapping with a 'faqs' list")
+    faqs = []
+    for position, entry in enumerate(entries):
+        try:
+            question, answer, keywords = entry["question"], entry["answer"], entry.get("keywords", [])
+        except (TypeError, KeyError) as e:
+            raise KnowledgeFileError(f"FAQ #{position} needs 'question' and 'answer'") from e
+        if not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords):
+            raise KnowledgeFileError(f"FAQ #{position}: 'keywords' must be a list of strings")
+        faqs.append(FAQ(question=str(question), answer=str(answer), keywords=keywords))
+    return faqs
+
+
+def _cache_key(raw: bytes) -> str:
+    digest = hashlib.sha256(raw)
+    digest.update(f"|{CACHE_FORMAT}|{knowledge.engine_fingerprint()}".encode())
+    return digest.hexdigest()
+
+
+def _read_cache(cache_path: Path, key: str) -> Optional[KnowledgeSnapshot]:
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable knowledge cache {cache_path}: {e}")
+        return None
+    return snapshot if cached_key == key else None
+
+
+def _write_cache(cache_path: Path, key: str, snapshot: KnowledgeSnapshot) -> None:
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump((key, snapshot), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not write knowledge cache {cache_path}: {e}")
+
+
+def load_snapshot(path: Path, cache_path: Optional[Path] = None) -> Tuple[KnowledgeSnapshot, bool]:
+    """Compile the knowledge file, or load it from the binary cache.
+
+    Returns (snapshot, from_cache).
+    """
+    try:
+        raw = path.read_bytes()
+    except OSError as e:
+        raise KnowledgeFileError(f"Cannot read {path}: {e}") from e
+    key = _cache_key(raw)
+    if cache_path is not None:
+        snapshot = _read_cache(cache_path, key)
+        if snapshot is not None:
+            return snapshot, True
+    snapshot = KnowledgeSnapshot(parse_faqs(raw, path.suffix.lower()), source=str(path))
+    if cache_path is not None:
+        _write_cache(cache_path, key, snapshot)
+    return snapshot, False
+
+
+class KnowledgeReloader:
+    def __init__(self, path: Path, cache_path: Optional[Path] = None, interval: float = 5.0):
+        self.path = path
+        self.cache_path = cache_path
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._file_state: Optional[Tuple[int, int]] = None
+        self.reloads = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["KnowledgeReloader"]:
+        """Reloader for KNOWLEDGE_FILE, or None if no file is configured."""
+        path = os.getenv("KNOWLEDGE_FILE")
+        if not path:
+            return None
+        cache_path = os.getenv("KNOWLEDGE_CACHE_PATH", path + ".cache")
+        return cls(
+            Path(path),
+            Path(cache_path) if cache_path else None,
+            interval=float(os.getenv("KNOWLEDGE_RELOAD_INTERVAL", "5")),
+        )
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def reload(self) -> Dict[str, Any]:
+        """Build a snapshot from the file in a worker thread and install it.
+
+        On failure the current snapshot stays active and the error is raised.
+        """
+        async with self._lock:
+            file_state = self._stat()
+            start = time.perf_counter()
+            try:
+                snapshot, from_cache = await asyncio.to_thread(load_snapshot, self.path, self.cache_path)
+            except Exception:
+                self.failures += 1
+                # Don't retry the same broken file on every poll
+                self._file_state = file_state
+                raise
+            version = knowledge.install_snapshot(snapshot)
+            self._file_state = file_state
+            self.reloads += 1
+            build_ms = (time.perf_counter() - start) * 1000
+            logger.info(
+                f"Loaded knowledge base v{version} from {self.path}: {len(snapshot.faqs)} FAQs "
+                f"in {build_ms:.1f}ms{' (cached)' if from_cache else ''}"
+            )
+            return {
+                "version": version,
+                "faqs": len(snapshot.faqs),
+                "source": str(self.path),
+                "from_cache": from_cache,
+                "build_ms": build_ms,
+            }
+
+    def start(self) -> None:
+        """Poll the file for changes on the running event loop."""
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._watch(), name="knowledge-reloader")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._stat() == self._file_state:
+                continue
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Knowledge base reload from {self.path} failed, keeping current version: {e}")
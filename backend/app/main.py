@@ -1,31 +1,97 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager, nullcontext
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Literal, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, NamedTuple, Optional
 from uuid import uuid4
+import asyncio
+import json
 import logging
+import os
+import time
+import zlib
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from pydantic_core import to_json
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db, engine
-from app import models
-from app.knowledge import find_best_faq, detect_intent
-
-# Create tables (for MVP; in production use Alembic migrations)
-models.Base.metadata.create_all(bind=engine)
+from app.database import (
+    AsyncSessionLocal,
+    ReplicaSessionLocal,
+    count_statements,
+    dispose_async_engine,
+    get_async_engine,
+    get_db,
+    get_read_db,
+)
+from app import export, metrics, models, persistence, rollups
+from app.cache import MISSING, CachedMessage, ReplyCache
+from app.knowledge import DEFAULT_INTENT, MessageAnalysis, active_snapshot, normalize_message
+from app.handoffs import HandoffWorker
+from app.knowledge_loader import KnowledgeReloader
+from app.retention import RetentionJob
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Loads KNOWLEDGE_FILE at startup and reloads it when it changes
+knowledge_reloader = KnowledgeReloader.from_env()
+# Closes, archives and deletes old conversations every RETENTION_INTERVAL seconds
+retention_job = RetentionJob.from_env()
+# Creates helpdesk tickets for pending handoffs when HANDOFF_PROVIDER is set
+handoff_worker = HandoffWorker.from_env()
+# Token for /api/v1/admin endpoints; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Create missing tables at startup, for throwaway dev databases only; the
+# schema is otherwise managed by Alembic (`alembic upgrade head`)
+DB_CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "false").lower() == "true"
+# Seconds /ready waits for the database before reporting it unavailable
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    if DB_CREATE_SCHEMA:
+        async with get_async_engine().begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+    if knowledge_reloader is not None:
+        await knowledge_reloader.reload()
+        knowledge_reloader.start()
+    if persistence.write_behind is not None:
+        persistence.write_behind.start()
+    rollups.aggregator.start()
+    retention_job.start()
+    if handoff_worker is not None:
+        handoff_worker.start()
+    yield
+    if handoff_worker is not None:
+        await handoff_worker.stop()
+    await retention_job.stop()
+    if knowledge_reloader is not None:
+        await knowledge_reloader.stop()
+    if _background_saves:
+        await asyncio.wait(_background_saves)
+    if persistence.write_behind is not None:
+        # Flush queued turns while the engine is still open
+        await persistence.write_behind.stop()
+    await rollups.aggregator.stop()
+    # Close pooled async connections so they don't outlive the event loop
+    await dispose_async_engine()
+
+
 # Create FastAPI application
 app = FastAPI(
     title="Customer Service Chatbot API",
     description="Backend API for customer service chatbot",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -37,17 +103,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Report per-request DB statement/commit counts as response headers
+EXPOSE_DB_STATS = os.getenv("EXPOSE_DB_STATS", "false").lower() == "true"
+# Report per-request stage timings as a Server-Timing header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+
+class RequestStatsMiddleware:
+    """Request duration metric plus the X-DB-* and Server-Timing headers.
+
+    Plain ASGI rather than @app.middleware("http"), which runs the endpoint
+    in a separate task and pipes every response body through a memory
+    stream.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        with count_statements() as counter, (metrics.collect_timings() if SERVER_TIMING else nullcontext()) as timings:
+
+            async def send_with_stats(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    if EXPOSE_DB_STATS:
+                        headers["X-DB-Statements"] = str(counter.statements)
+                        headers["X-DB-Commits"] = str(counter.commits)
+                    if timings is not None:
+                        headers["Server-Timing"] = metrics.server_timing(timings, time.perf_counter() - start)
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
+        route = scope.get("route")
+        metrics.REQUEST_DURATION.observe(
+            time.perf_counter() - start, scope["method"], route.path if route else "unmatched"
+        )
+        if counter.statements:
+            logger.debug(f"{scope['method']} {scope['path']}: {counter.statements} statements, {counter.commits} commits")
+
+
+app.add_middleware(RequestStatsMiddleware)
+
 
 class ChatUser(BaseModel):
     id: Optional[str] = None
     is_authenticated: bool = False
 
 
+# Longest chat message accepted, in characters
+CHAT_MAX_MESSAGE_LENGTH = int(os.getenv("CHAT_MAX_MESSAGE_LENGTH", "4000"))
+
+
 class ChatRequest(BaseModel):
-    message: str = Field(..., min_length=1)
+    message: str = Field(..., min_length=1, max_length=CHAT_MAX_MESSAGE_LENGTH)
     session_id: Optional[str] = None
     user: Optional[ChatUser] = None
     metadata: Optional[Dict[str, Any]] = None
+    # `cursor` from the previous response; only newer messages are returned
+    since: Optional[str] = None
 
 
 class ChatMessage(BaseModel):
@@ -67,25 +184,167 @@ class ChatResponse(BaseModel):
     reply: str
     messages: Optional[List[ChatMessage]] = None
     handoff: Optional[Handoff] = None
+    # Id of the newest message, to send back as `since`
+    cursor: Optional[str] = None
+
+
+class StreamReplyEvent(BaseModel):
+    """First event of /api/v1/chat/stream, sent before anything is persisted."""
+
+    session_id: str
+    reply: str
+    handoff: Optional[Handoff] = None
+
+
+class SavedMessage(ChatMessage):
+    id: str
+
+
+class StreamSavedEvent(BaseModel):
+    """Final event of /api/v1/chat/stream, once the turn is committed."""
+
+    session_id: str
+    messages: List[SavedMessage]
+
+
+# Largest number of messages accepted by /api/v1/chat/batch
+CHAT_BATCH_MAX = int(os.getenv("CHAT_BATCH_MAX", "500"))
+
+
+class ChatBatchRequest(BaseModel):
+    # Items are validated one by one so a bad item doesn't reject the batch
+    requests: List[Dict[str, Any]] = Field(..., min_length=1, max_length=CHAT_BATCH_MAX)
+
+
+class ChatBatchItem(BaseModel):
+    index: int
+    response: Optional[ChatResponse] = None
+    error: Optional[str] = None
+
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatBatchItem]
 
 
 class HealthResponse(BaseModel):
     status: Literal["ok"]
     service: str
 
+
+class ReadyResponse(BaseModel):
+    status: Literal["ready", "unavailable"]
+    database: str
+
+
+class KnowledgeReloadResponse(BaseModel):
+    version: int
+    faqs: int
+    source: str
+    from_cache: bool
+    build_ms: float
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Customer Service Chatbot API"}
 
 
+@app.get("/ready", response_model=ReadyResponse, responses={503: {"model": ReadyResponse}})
+async def ready(response: Response) -> ReadyResponse:
+    """Readiness probe: 200 once the database answers, 503 while it doesn't.
+
+    Unlike /health, which only says the process is up, this makes a
+    round trip to the database.
+    """
+
+    async def ping() -> None:
+        async with get_async_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.wait_for(ping(), READY_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Readiness check failed: {e!r}")
+        response.status_code = 503
+        return ReadyResponse(status="unavailable", database=type(e).__name__)
+    return ReadyResponse(status="ready", database="ok")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint() -> PlainTextResponse:
+    """Counters and latency histograms in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health() -> HealthResponse:
     return HealthResponse(status="ok", service="customer-service-chatbot")
 
 
-def _generate_reply(message: str, intent: str, confidence: Optional[float]) -> tuple[str, Optional[Handoff]]:
+class ReplyDecision(NamedTuple):
+    intent: str
+    reply: str
+    handoff: Optional[Handoff]
+    faq_hit: bool = False
+
+
+# Reply decisions by normalized message; 0 disables the cache
+REPLY_CACHE_SIZE = int(os.getenv("REPLY_CACHE_SIZE", "10000"))
+# No-match decisions (generic fallbacks) get their own, smaller cache
+REPLY_CACHE_NEGATIVE_SIZE = int(os.getenv("REPLY_CACHE_NEGATIVE_SIZE", "1000"))
+reply_cache = ReplyCache(REPLY_CACHE_SIZE, REPLY_CACHE_NEGATIVE_SIZE) if REPLY_CACHE_SIZE > 0 else None
+# Longer normalized messages are answered but not cached: they rarely repeat,
+# and this keeps the cache's memory bounded by REPLY_CACHE_SIZE entries
+REPLY_CACHE_MAX_MESSAGE_LENGTH = int(os.getenv("REPLY_CACHE_MAX_MESSAGE_LENGTH", "256"))
+
+
+def _reply_cache_stat(name: str) -> Callable[[], float]:
+    return lambda: reply_cache.stats()[name] if reply_cache else 0
+
+
+metrics.Gauge("chatbot_reply_cache_entries", "Reply decisions in the reply cache.", _reply_cache_stat("size"))
+metrics.Gauge(
+    "chatbot_reply_cache_negative_entries", "No-match decisions in the reply cache.", _reply_cache_stat("negative_size")
+)
+metrics.FunctionCounter("chatbot_reply_cache_hits_total", "Replies served from the reply cache.", _reply_cache_stat("hits"))
+metrics.FunctionCounter(
+    "chatbot_reply_cache_misses_total", "Reply cache lookups that had to run the analysis.", _reply_cache_stat("misses")
+)
+metrics.FunctionCounter(
+    "chatbot_reply_cache_evictions_total", "Reply decisions evicted to stay within REPLY_CACHE_SIZE.",
+    _reply_cache_stat("evictions"),
+)
+metrics.FunctionCounter(
+    "chatbot_reply_cache_invalidations_total", "Times the reply cache was cleared by a knowledge base change.",
+    _reply_cache_stat("invalidations"),
+)
+
+
+def _decide_reply(normalized: str) -> ReplyDecision:
+    """Intent and reply for a normalized message, from the cache when possible.
+
+    Decisions are computed from the normalized text, where order numbers are
+    masked, so a cached reply never carries another user's entity.
+    """
+    version, snapshot = active_snapshot()
+    cache = reply_cache if len(normalized) <= REPLY_CACHE_MAX_MESSAGE_LENGTH else None
+    decision = cache.get(normalized, version) if cache else MISSING
+    if decision is MISSING:
+        with metrics.stage("intent_detection"):
+            analysis = snapshot.analyze(normalized, folded=True)
+        reply_text, handoff = _generate_reply(analysis)
+        # Escalations skip FAQ matching; otherwise faq_match is already cached
+        faq_hit = handoff is None and analysis.faq_match is not None
+        decision = ReplyDecision(analysis.intent, reply_text, handoff, faq_hit)
+        if cache:
+            no_match = handoff is None and not faq_hit and analysis.intent == DEFAULT_INTENT
+            cache.set(normalized, version, decision, negative=no_match)
+    return decision
+
+
+def _generate_reply(analysis: MessageAnalysis) -> tuple[str, Optional[Handoff]]:
     """Generate bot reply based on intent and knowledge base."""
-    
+    intent = analysis.intent
+
     # Check for agent escalation intent
     if intent == "escalation":
         return (
@@ -94,7 +353,8 @@ def _generate_reply(message: str, intent: str, confidence: Optional[float]) -> t
         )
     
     # Try FAQ matching first
-    faq_match = find_best_faq(message)
+    with metrics.stage("faq_match"):
+        faq_match = analysis.faq_match
     if faq_match:
         faq, faq_confidence = faq_match
         logger.info(f"FAQ match: {faq.question} (confidence: {faq_confidence:.1f}%)")
@@ -118,89 +378,504 @@ def _generate_reply(message: str, intent: str, confidence: Optional[float]) -> t
     )
 
 
+class PreparedTurn(NamedTuple):
+    turn: persistence.TurnInput
+    reply: str
+    handoff: Optional[Handoff]
+    # Cursor of the last message the client has already seen
+    since: Optional[str] = None
+
+
+def _answer(message: str) -> tuple[List[Dict[str, Any]], str, Optional[Handoff]]:
+    """Decide the reply to a message; returns (message rows, reply, handoff)."""
+    # Repeated questions reuse the intent and reply decided last time;
+    # entities come from this message, never from the cache
+    normalized, entities = normalize_message(message)
+    intent, reply_text, handoff_data, faq_hit = _decide_reply(normalized)
+    extracted_value = entities.get(intent)
+    metrics.INTENTS.inc(intent)
+    if handoff_data is not None:
+        metrics.HANDOFFS.inc()
+    else:
+        metrics.FAQ_MATCHES.inc("hit" if faq_hit else "miss")
+    logger.info(f"Intent: {intent}, Extracted: {extracted_value}")
+
+    extra_data: Dict[str, Any] = {}
+    if extracted_value:
+        extra_data["extracted_value"] = extracted_value
+    if handoff_data is None:
+        # Lets analytics rollups be rebuilt from history (app.rollups)
+        extra_data["faq_hit"] = faq_hit
+
+    messages = [
+        {
+            "role": "user",
+            "content": message,
+            "intent": intent,
+            "extra_data": extra_data or None,
+        },
+        {"role": "assistant", "content": reply_text},
+    ]
+    return messages, reply_text, handoff_data
+
+
+def _handoff_row(handoff: Optional[Handoff]) -> Optional[Dict[str, Any]]:
+    return {"recommended": handoff.recommended, "reason": handoff.reason} if handoff else None
+
+
+def _prepare_turn(request: ChatRequest) -> PreparedTurn:
+    """Decide the reply for a request and build the rows to persist."""
+    messages, reply_text, handoff_data = _answer(request.message)
+    turn = persistence.TurnInput(
+        session_id=request.session_id or f"sess_{uuid4().hex}",
+        locale=request.metadata.get("locale") if request.metadata else None,
+        messages=messages,
+        handoff=_handoff_row(handoff_data),
+    )
+    return PreparedTurn(turn, reply_text, handoff_data, request.since)
+
+
+def _messages_since(messages: List[CachedMessage], since: Optional[str]) -> List[CachedMessage]:
+    """History after the message with id `since`.
+
+    An unknown cursor (or one older than the history window) gets the whole
+    window, as if no cursor was sent.
+    """
+    if since:
+        for position in range(len(messages) - 1, -1, -1):
+            if messages[position].id == since:
+                return messages[position + 1:]
+    return messages
+
+
+def _chat_payload(prepared: PreparedTurn, saved: persistence.SavedTurn) -> Dict[str, Any]:
+    """ChatResponse as plain data, built without model validation."""
+    if saved.created:
+        logger.info(f"Created new conversation: {saved.session_id}")
+
+    handoff = prepared.handoff
+    return {
+        "session_id": saved.session_id,
+        "reply": prepared.reply,
+        "messages": [
+            {"role": msg.role, "content": msg.content, "timestamp": msg.created_at}
+            for msg in _messages_since(saved.messages, prepared.since)
+        ],
+        "handoff": handoff.model_dump() if handoff else None,
+        "cursor": saved.messages[-1].id if saved.messages else None,
+    }
+
+
+def _chat_response(prepared: PreparedTurn, saved: persistence.SavedTurn) -> ChatResponse:
+    return ChatResponse(**_chat_payload(prepared, saved))
+
+
 @app.post("/api/v1/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: Session = Depends(get_db)) -> ChatResponse:
-    """Process a chat message and return bot response."""
+async def chat(request: ChatRequest, db: AsyncSession = Depends(get_db)) -> Response:
+    """Process a chat message and return bot response.
+
+    The body is encoded straight from plain data: every field comes from
+    the validated request or the database, so validating it again against
+    `response_model` (kept for the OpenAPI schema) would only cost time.
+    """
     try:
-        # Get or create conversation
-        conversation = None
-        if request.session_id:
-            conversation = db.query(models.Conversation).filter_by(
-                session_id=request.session_id
-            ).first()
-        
-        if not conversation:
-            session_id = request.session_id or f"sess_{uuid4().hex}"
-            conversation = models.Conversation(
-                session_id=session_id,
-                channel="web",
-                locale=request.metadata.get("locale") if request.metadata else None,
-            )
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-            logger.info(f"Created new conversation: {conversation.session_id}")
-        
-        # Detect intent
-        intent, extracted_value = detect_intent(request.message)
-        logger.info(f"Intent: {intent}, Extracted: {extracted_value}")
-        
-        # Save user message
-        user_message = models.Message(
-            conversation_id=conversation.id,
-            role="user",
-            content=request.message,
-            intent=intent,
-            extra_data={"extracted_value": extracted_value} if extracted_value else None,
-        )
-        db.add(user_message)
-        
-        # Generate reply
-        reply_text, handoff_data = _generate_reply(request.message, intent, None)
-        
-        # Save assistant message
-        assistant_message = models.Message(
-            conversation_id=conversation.id,
-            role="assistant",
-            content=reply_text,
-        )
-        db.add(assistant_message)
-        
-        # Create handoff if recommended
-        if handoff_data:
-            handoff_record = models.Handoff(
-                conversation_id=conversation.id,
-                recommended=handoff_data.recommended,
-                reason=handoff_data.reason,
-                status="pending",
-            )
-            db.add(handoff_record)
-        
-        db.commit()
-        
-        # Build response with recent messages
-        recent_messages = db.query(models.Message).filter_by(
-            conversation_id=conversation.id
-        ).order_by(models.Message.created_at.desc()).limit(10).all()
-        
-        message_list = [
-            ChatMessage(
-                role=msg.role,
-                content=msg.content,
-                timestamp=msg.created_at,
-            )
-            for msg in reversed(recent_messages)
-        ]
-        
-        return ChatResponse(
-            session_id=conversation.session_id,
-            reply=reply_text,
-            messages=message_list,
-            handoff=handoff_data,
+        prepared = _prepare_turn(request)
+        turn = prepared.turn
+
+        # Save conversation, both messages and any handoff in one transaction
+        saved = await persistence.save_turn(
+            db,
+            session_id=turn.session_id,
+            locale=turn.locale,
+            messages=turn.messages,
+            handoff=turn.handoff,
         )
+        payload = _chat_payload(prepared, saved)
+        return Response(content=to_json(payload), media_type="application/json")
     
     except Exception as e:
         logger.error(f"Error processing chat: {str(e)}", exc_info=True)
-        db.rollback()
+        metrics.ERRORS.inc("chat")
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Internal server error")
 
+
+@app.post("/api/v1/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(request: ChatBatchRequest, db: AsyncSession = Depends(get_db)) -> ChatBatchResponse:
+    """Process many chat messages and persist them in one transaction.
+
+    Invalid items get a per-item error; the rest are saved together, so a
+    database failure fails the whole batch.
+    """
+    results: List[ChatBatchItem] = []
+    prepared: List[PreparedTurn] = []
+    positions: List[int] = []
+    for index, item in enumerate(request.requests):
+        try:
+            prepared.append(_prepare_turn(ChatRequest.model_validate(item)))
+            positions.append(index)
+            results.append(ChatBatchItem(index=index))
+        except ValidationError as e:
+            results.append(ChatBatchItem(index=index, error=f"Invalid request: {e.errors()[0]['msg']}"))
+        except Exception as e:
+            logger.error(f"Error processing batch item {index}: {str(e)}", exc_info=True)
+            metrics.ERRORS.inc("chat_batch")
+            results.append(ChatBatchItem(index=index, error="Internal server error"))
+
+    if prepared:
+        try:
+            saved = await persistence.save_turns(db, [p.turn for p in prepared])
+        except Exception as e:
+            logger.error(f"Error saving chat batch: {str(e)}", exc_info=True)
+            metrics.ERRORS.inc("chat_batch")
+            await db.rollback()
+            raise HTTPException(status_code=500, detail="Internal server error")
+        for index, prepared_turn, saved_turn in zip(positions, prepared, saved):
+            results[index].response = _chat_response(prepared_turn, saved_turn)
+
+    return ChatBatchResponse(results=results)
+
+
+def _sse(event: str, data: BaseModel) -> str:
+    return f"event: {event}\ndata: {data.model_dump_json()}\n\n"
+
+
+# Streamed turns still being saved; holds references so they aren't
+# garbage collected if the client goes away, and lets shutdown wait for them
+_background_saves: set = set()
+
+
+async def _save_prepared_turn(prepared: PreparedTurn, reply_sent: asyncio.Event) -> persistence.SavedTurn:
+    # Starting the DB work right away would compete with sending the reply
+    # event for the event loop; wait for it (or give up waiting after a
+    # second, e.g. if the client never reads the stream)
+    try:
+        await asyncio.wait_for(reply_sent.wait(), 1.0)
+    except asyncio.TimeoutError:
+        pass
+    turn = prepared.turn
+    async with AsyncSessionLocal() as db:
+        return await persistence.save_turn(
+            db,
+            session_id=turn.session_id,
+            locale=turn.locale,
+            messages=turn.messages,
+            handoff=turn.handoff,
+        )
+
+
+@app.post("/api/v1/chat/stream")
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """Server-Sent Events variant of /api/v1/chat.
+
+    Emits a `reply` event (reply text and handoff) as soon as the reply is
+    decided, persists the turn in the background, then emits `saved` with
+    the stored messages' ids and timestamps, or `error` if saving failed.
+    The turn is still saved if the client disconnects early.
+    """
+    prepared = _prepare_turn(request)
+    reply_sent = asyncio.Event()
+    save = asyncio.create_task(_save_prepared_turn(prepared, reply_sent))
+    _background_saves.add(save)
+    save.add_done_callback(_background_saves.discard)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            yield _sse("reply", StreamReplyEvent(
+                session_id=prepared.turn.session_id,
+                reply=prepared.reply,
+                handoff=prepared.handoff,
+            ))
+        finally:
+            reply_sent.set()
+        try:
+            saved = await asyncio.shield(save)
+        except Exception as e:
+            logger.error(f"Error saving streamed chat: {str(e)}", exc_info=True)
+            metrics.ERRORS.inc("chat_stream")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Internal server error'})}\n\n"
+            return
+        if saved.created:
+            logger.info(f"Created new conversation: {saved.session_id}")
+        yield _sse("saved", StreamSavedEvent(
+            session_id=saved.session_id,
+            messages=[
+                SavedMessage(id=msg.id, role=msg.role, content=msg.content, timestamp=msg.created_at)
+                for msg in saved.messages
+            ],
+        ))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the first event
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# WebSocket sessions: per-worker connection cap, server ping interval and
+# how long a connection may stay silent before it is closed
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "1000"))
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "300"))
+_ws_connections = 0
+
+
+def _message_frame(message: CachedMessage) -> Dict[str, Any]:
+    return {
+        "id": message.id,
+        "role": message.role,
+        "content": message.content,
+        "timestamp": message.created_at.isoformat(),
+    }
+
+
+@app.websocket("/api/v1/chat/ws")
+async def chat_ws(websocket: WebSocket, session_id: Optional[str] = None, locale: Optional[str] = None) -> None:
+    """Chat over one long-lived connection per session.
+
+    The session is resolved once on connect and its history kept in
+    connection memory, so each turn is just the reply decision and the
+    message INSERT. Frames are JSON objects with a `type`:
+
+    - server: `session` (session_id, recent messages) once on connect
+    - client: `message` (message); server answers `reply` (reply, handoff,
+      and the turn's two stored messages) or `error` (detail)
+    - either side: `ping`, answered with `pong`. The server pings after
+      WS_HEARTBEAT_INTERVAL seconds of silence and closes the connection
+      after WS_IDLE_TIMEOUT seconds without a client frame.
+
+    Binary frames close the connection with code 1003. A turn that fails
+    is answered with `error` and the connection stays usable.
+    """
+    global _ws_connections
+    await websocket.accept()
+    if _ws_connections >= WS_MAX_CONNECTIONS:
+        # 1013: try again later
+        await websocket.close(code=1013, reason="Too many connections")
+        return
+    _ws_connections += 1
+    loop = asyncio.get_running_loop()
+    try:
+        async with AsyncSessionLocal() as db:
+            state = await persistence.open_session(db, session_id or f"sess_{uuid4().hex}", locale)
+        if state.created:
+            logger.info(f"Created new conversation: {state.session_id}")
+        await websocket.send_json({
+            "type": "session",
+            "session_id": state.session_id,
+            "messages": [_message_frame(m) for m in state.history],
+        })
+
+        last_seen = loop.time()
+        while True:
+            idle = loop.time() - last_seen
+            if idle >= WS_IDLE_TIMEOUT:
+                await websocket.close(code=1000, reason="Idle timeout")
+                return
+            try:
+                received = await asyncio.wait_for(
+                    websocket.receive(), min(WS_HEARTBEAT_INTERVAL, WS_IDLE_TIMEOUT - idle)
+                )
+            except asyncio.TimeoutError:
+                await websocket.send_json({"type": "ping"})
+                continue
+            if received["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(received.get("code", 1000))
+            last_seen = loop.time()
+            raw = received.get("text")
+            if raw is None:
+                # 1003: unsupported data
+                await websocket.close(code=1003, reason="Frames must be JSON text")
+                return
+
+            try:
+                frame = json.loads(raw)
+                frame_type = frame.get("type")
+            except (ValueError, AttributeError):
+                await websocket.send_json({"type": "error", "detail": "Frames must be JSON objects"})
+                continue
+            if frame_type == "ping":
+                await websocket.send_json({"type": "pong"})
+                continue
+            if frame_type == "pong":
+                continue
+            message = frame.get("message") if frame_type == "message" else None
+            if not isinstance(message, str) or not message:
+                await websocket.send_json({"type": "error", "detail": "Expected a message frame with a non-empty message"})
+                continue
+            if len(message) > CHAT_MAX_MESSAGE_LENGTH:
+                await websocket.send_json({
+                    "type": "error", "detail": f"Messages are limited to {CHAT_MAX_MESSAGE_LENGTH} characters",
+                })
+                continue
+
+            try:
+                messages, reply_text, handoff_data = _answer(message)
+                async with AsyncSessionLocal() as db:
+                    written = await persistence.save_session_turn(db, state, messages, _handoff_row(handoff_data))
+            except Exception as e:
+                logger.error(f"Error handling websocket chat turn: {str(e)}", exc_info=True)
+                metrics.ERRORS.inc("chat_ws")
+                await websocket.send_json({"type": "error", "detail": "Internal server error"})
+                continue
+            await websocket.send_json({
+                "type": "reply",
+                "reply": reply_text,
+                "handoff": handoff_data.model_dump() if handoff_data else None,
+                "messages": [_message_frame(m) for m in written],
+            })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _ws_connections -= 1
+
+
+def _check_admin_token(token: Optional[str]) -> None:
+    if not ADMIN_TOKEN or token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@app.post("/api/v1/admin/knowledge/reload", response_model=KnowledgeReloadResponse)
+async def reload_knowledge(x_admin_token: Optional[str] = Header(None)) -> KnowledgeReloadResponse:
+    """Rebuild the knowledge base from KNOWLEDGE_FILE and swap it in."""
+    _check_admin_token(x_admin_token)
+    if knowledge_reloader is None:
+        raise HTTPException(status_code=409, detail="KNOWLEDGE_FILE is not configured")
+    try:
+        result = await knowledge_reloader.reload()
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return KnowledgeReloadResponse(**result)
+
+
+@app.get("/api/v1/admin/export/transcripts")
+async def export_transcripts(
+    started_from: Optional[datetime] = None,
+    started_to: Optional[datetime] = None,
+    channel: Optional[str] = None,
+    intent: Optional[str] = None,
+    handoff_status: Optional[str] = None,
+    ended_before: Optional[datetime] = None,
+    after: Optional[str] = None,
+    compression: Literal["none", "gzip"] = "none",
+    x_admin_token: Optional[str] = Header(None),
+) -> StreamingResponse:
+    """Stream conversations with their messages and handoffs as NDJSON.
+
+    One conversation per line, ordered by start time. To resume an
+    interrupted download, pass the `cursor` of the last complete line as
+    `after`. With compression=gzip the body is gzip-encoded on the fly.
+    """
+    _check_admin_token(x_admin_token)
+    try:
+        cursor = export.parse_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    filters = export.ExportFilters(started_from, started_to, channel, intent, handoff_status, ended_before)
+
+    async def lines() -> AsyncIterator[bytes]:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compression == "gzip" else None
+        chunk: List[bytes] = []
+        # Not get_read_db: since FastAPI 0.106 a dependency's session is closed
+        # before a streaming body runs
+        async with ReplicaSessionLocal() as db:
+            async for record in export.iter_transcripts(db, filters, cursor):
+                chunk.append(export.encode_ndjson(record))
+                if len(chunk) >= 100:
+                    data = b"".join(chunk)
+                    chunk = []
+                    yield compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else data
+        data = b"".join(chunk)
+        yield compressor.compress(data) + compressor.flush() if compressor else data
+
+    headers = {"Content-Encoding": "gzip"} if compression == "gzip" else None
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+
+
+class IntentMixBucket(BaseModel):
+    bucket: datetime
+    intents: Dict[str, int]
+
+
+class HandoffRateBucket(BaseModel):
+    bucket: datetime
+    messages: int
+    handoffs: int
+    rate: Optional[float]
+
+
+class FaqHitRateBucket(BaseModel):
+    bucket: datetime
+    lookups: int
+    hits: int
+    rate: Optional[float]
+
+
+class ReportParams(NamedTuple):
+    start: datetime
+    end: datetime
+    granularity: str
+    channel: Optional[str]
+    locale: Optional[str]
+
+
+async def _report_params(
+    start: datetime,
+    end: datetime,
+    granularity: Literal["hour", "day"] = "hour",
+    channel: Optional[str] = None,
+    locale: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(None),
+) -> ReportParams:
+    _check_admin_token(x_admin_token)
+    return ReportParams(start, end, granularity, channel, locale)
+
+
+
+
+def _sum_by_bucket(rows: List[Any], *columns: str) -> Dict[datetime, List[int]]:
+    """Per-bucket totals of `columns` over all intents."""
+    sums: Dict[datetime, List[int]] = {}
+    for row in rows:
+        totals = sums.setdefault(row.bucket, [0] * len(columns))
+        for i, column in enumerate(columns):
+            totals[i] += getattr(row, column)
+    return sums
+
+
+@app.get("/api/v1/admin/reports/intents", response_model=List[IntentMixBucket])
+async def report_intents(
+    params: ReportParams = Depends(_report_params), db: AsyncSession = Depends(get_read_db)
+) -> List[IntentMixBucket]:
+    """User messages per intent in each time bucket, from the hourly rollups."""
+    buckets: Dict[datetime, Dict[str, int]] = {}
+    for row in await rollups.report(db, *params):
+        buckets.setdefault(row.bucket, {})[row.intent] = row.messages
+    return [IntentMixBucket(bucket=bucket, intents=intents) for bucket, intents in buckets.items()]
+
+
+@app.get("/api/v1/admin/reports/handoff-rate", response_model=List[HandoffRateBucket])
+async def report_handoff_rate(
+    params: ReportParams = Depends(_report_params), db: AsyncSession = Depends(get_read_db)
+) -> List[HandoffRateBucket]:
+    """Handoffs per user message in each time bucket, from the hourly rollups."""
+    sums = _sum_by_bucket(await rollups.report(db, *params), "messages", "handoffs")
+    return [
+        HandoffRateBucket(bucket=bucket, messages=messages, handoffs=handoffs,
+                          rate=handoffs / messages if messages else None)
+        for bucket, (messages, handoffs) in sums.items()
+    ]
+
+
+@app.get("/api/v1/admin/reports/faq-hit-rate", response_model=List[FaqHitRateBucket])
+async def report_faq_hit_rate(
+    params: ReportParams = Depends(_report_params), db: AsyncSession = Depends(get_read_db)
+) -> List[FaqHitRateBucket]:
+    """Share of FAQ lookups that found an answer in each time bucket, from the hourly rollups."""
+    sums = _sum_by_bucket(await rollups.report(db, *params), "faq_hits", "faq_misses")
+    return [
+        FaqHitRateBucket(bucket=bucket, lookups=hits + misses, hits=hits,
+                         rate=hits / (hits + misses) if hits + misses else None)
+        for bucket, (hits, misses) in sums.items()
+    ]
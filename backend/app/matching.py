@@ -0,0 +1,67 @@
+"""Multi-pattern substring matching.
+
+An Aho-Corasick automaton finds every keyword occurring in a message in a
+single pass over its characters, independent of how many keywords exist.
+"""
+
+from typing import Dict, Iterable, List, Set
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over a fixed set of keywords.
+
+    `search` returns the ids (positions in the input list) of all keywords
+    that occur as substrings of the text, matching `keyword in text`
+    semantics. Empty keywords are ignored since they carry no signal.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = list(keywords)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for keyword_id, keyword in enumerate(self.keywords):
+            if not keyword:
+                continue
+            node = 0
+            for ch in keyword:
+                next_node = self._goto[node].get(ch)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][ch] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = next_node
+            self._out[node].append(keyword_id)
+
+        self._build_fail_links()
+
+    def _build_fail_links(self) -> None:
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                # Fold outputs along the fail chain so search never walks it
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def search(self, text: str) -> Set[int]:
+        """Return the ids of all keywords found in text."""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found: Set[int] = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
@@ -0,0 +1,218 @@
+"""In-process metrics, rendered in the Prometheus text format by GET /metrics.
+
+Counters and histograms are plain Python objects updated in place; with
+everything running on one event loop no locking is needed. Values are
+per process, so with several workers each one is scraped separately.
+
+`stage(name)` times a block into the per-stage latency histogram and,
+while a request is collecting them (see `collect_timings`), into that
+request's `Server-Timing` header.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; stages are mostly sub-millisecond, requests up to a few seconds
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+REGISTRY: List["Metric"] = []
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self.values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(Metric):
+    """A value read from `function` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_number(self.function())}"]
+
+
+class FunctionCounter(Gauge):
+    """A running total kept elsewhere (e.g. a cache's hit count), read at scrape time."""
+
+    kind = "counter"
+
+
+class HistogramSeries:
+    """Bucket counts, sum and count for one label combination."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # counts[i] is observations in (buckets[i - 1], buckets[i]]; the last is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[str, ...], HistogramSeries] = {}
+
+    def labels(self, *labels: str) -> HistogramSeries:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = HistogramSeries(self.buckets)
+        return series
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket_labels = _labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {repr(series.sum)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series.count}")
+        return lines
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = [line for metric in REGISTRY for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+STAGE_DURATION = Histogram(
+    "chatbot_stage_duration_seconds",
+    "Time spent in each stage of handling a chat message.",
+    ["stage"],
+)
+REQUEST_DURATION = Histogram(
+    "chatbot_http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ["method", "route"],
+)
+INTENTS = Counter("chatbot_intents_total", "Chat messages by detected intent.", ["intent"])
+FAQ_MATCHES = Counter("chatbot_faq_matches_total", "FAQ lookups by result (hit or miss).", ["result"])
+HANDOFFS = Counter("chatbot_handoffs_total", "Replies that recommended a handoff to an agent.")
+ERRORS = Counter("chatbot_errors_total", "Chat requests that failed with an internal error.", ["endpoint"])
+
+
+# Stage durations of the current request, for the Server-Timing header
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+class _StageTimer:
+    __slots__ = ("name", "series", "start")
+
+    def __init__(self, name: str, series: HistogramSeries):
+        self.name = name
+        self.series = series
+
+    def __enter__(self) -> "_StageTimer":
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = perf_counter() - self.start
+        self.series.observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed
+
+
+def stage(name: str) -> _StageTimer:
+    """Context manager timing a block as stage `name`."""
+    return _StageTimer(name, STAGE_DURATION.labels(name))
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """Collect stage durations (seconds) for the current task and its children."""
+    timings: Dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """Format stage durations as a `Server-Timing` header value (milliseconds)."""
+    entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(entries)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey, Integer, CheckConstraint
+from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey, Integer, CheckConstraint, Index, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 import uuid
@@ -47,21 +47,26 @@ class Conversation(Base):
 
 
 class Message(Base):
+    # In Postgres this table is range-partitioned by month on created_at and
+    # its primary key is (id, created_at); see migration 002 and
+    # app/partitions.py. The ORM keeps identifying rows by id alone.
     __tablename__ = "messages"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"), nullable=False, index=True)
+    conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     intent = Column(String, nullable=True)
     confidence = Column(Integer, nullable=True)
-    extra_data = Column(JSONB, nullable=True)
+    extra_data = Column(JSONB(none_as_null=True), nullable=True)
     created_at = Column(DateTime(timezone=True), default=utcnow, nullable=False)
 
     conversation = relationship("Conversation", back_populates="messages")
 
     __table_args__ = (
         CheckConstraint("role IN ('user', 'assistant', 'system')", name="check_message_role"),
+        # Serves the per-conversation history query without a sort
+        Index("ix_messages_conversation_id_created_at", "conversation_id", created_at.desc()),
     )
 
 
@@ -75,11 +80,26 @@ class Handoff(Base):
     provider = Column(String, nullable=True)
     ticket_id = Column(String, nullable=True, index=True)
     status = Column(String, default="pending", nullable=False)
+    # Delivery queue state for app/handoffs.py: attempts so far, when the
+    # next one is due (while processing: when the claim expires) and why
+    # the last one failed
+    # Server defaults (as in migration 004) cover rows inserted with raw SQL
+    attempts = Column(Integer, default=0, server_default=text("0"), nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), default=utcnow, server_default=text("now()"), nullable=False)
+    last_error = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), default=utcnow, nullable=False)
     updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False)
 
     conversation = relationship("Conversation", back_populates="handoffs")
 
+    __table_args__ = (
+        # Serves the handoff worker's claim query; delivered handoffs drop out
+        Index(
+            "ix_handoffs_queue", "next_attempt_at",
+            postgresql_where=text("status IN ('pending', 'processing')"),
+        ),
+    )
+
 
 class Feedback(Base):
     __tablename__ = "feedback"
@@ -95,3 +115,20 @@ class Feedback(Base):
     __table_args__ = (
         CheckConstraint("rating >= 0", name="check_feedback_rating_positive"),
     )
+
+
+class HourlyRollup(Base):
+    # Maintained by app/rollups.py: incremented as turns are saved and
+    # rebuilt from history by its backfill. Rows outlive the messages
+    # they count (see app/retention.py).
+    __tablename__ = "chat_rollups_hourly"
+
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    channel = Column(String, primary_key=True)
+    # Empty when the client didn't report one
+    locale = Column(String, primary_key=True)
+    intent = Column(String, primary_key=True)
+    messages = Column(Integer, default=0, nullable=False)
+    faq_hits = Column(Integer, default=0, nullable=False)
+    faq_misses = Column(Integer, default=0, nullable=False)
+    handoffs = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,129 @@
+"""Maintenance of the monthly `messages` partitions.
+
+Migration 002 range-partitions `messages` by `created_at`, one partition
+per calendar month plus a DEFAULT partition as a safety net. Run this
+ahead of time (e.g. daily from cron or at deploy) so upcoming months get
+their own partition before rows arrive:
+
+    python -m app.partitions --months-ahead 3
+
+If rows for a month have already landed in the default partition, they are
+moved into the new partition before it is attached.
+"""
+
+from datetime import date, datetime, timezone
+from typing import List, Tuple
+import argparse
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "messages"
+DEFAULT_PARTITION = "messages_default"
+
+
+def add_months(month: date, count: int) -> date:
+    total = month.year * 12 + month.month - 1 + count
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def partition_bounds(start: date, months: int) -> List[Tuple[str, date, date]]:
+    """(name, from, to) for `months` consecutive months starting at `start`."""
+    first = start.replace(day=1)
+    return [
+        (partition_name(add_months(first, i)), add_months(first, i), add_months(first, i + 1))
+        for i in range(months)
+    ]
+
+
+def _is_partitioned(conn: Connection) -> bool:
+    return bool(conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {"table": PARENT_TABLE},
+    ).scalar())
+
+
+def _existing_partitions(conn: Connection) -> set:
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": PARENT_TABLE})
+    return {row[0] for row in rows}
+
+
+def create_partition(conn: Connection, name: str, start: date, end: date) -> None:
+    """Create one monthly partition, moving any matching rows out of the default."""
+    # Month boundaries are in UTC regardless of the server's TimeZone setting
+    bounds = {
+        "start": datetime(start.year, start.month, start.day, tzinfo=timezone.utc),
+        "end": datetime(end.year, end.month, end.day, tzinfo=timezone.utc),
+    }
+    has_default = DEFAULT_PARTITION in _existing_partitions(conn)
+    stranded = has_default and conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+        "WHERE created_at >= :start AND created_at < :end)"
+    ), bounds).scalar()
+
+    if not stranded:
+        conn.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00+00') TO ('{end.isoformat()} 00:00+00')"
+        ))
+        return
+
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        "WHERE created_at >= :start AND created_at < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds).rowcount
+    conn.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start.isoformat()} 00:00+00') TO ('{end.isoformat()} 00:00+00')"
+    ))
+    logger.info(f"Moved {moved} rows from {DEFAULT_PARTITION} into {name}")
+
+
+def ensure_partitions(conn: Connection, months_ahead: int = 3, today: date = None) -> List[str]:
+    """Make sure this month and the next `months_ahead` months have partitions.
+
+    Returns the names of the partitions created.
+    """
+    if not _is_partitioned(conn):
+        logger.warning(f"{PARENT_TABLE} is not partitioned; run `alembic upgrade head` first")
+        return []
+
+    today = today or datetime.now(timezone.utc).date()
+    existing = _existing_partitions(conn)
+    created = []
+    for name, start, end in partition_bounds(today, months_ahead + 1):
+        if name in existing:
+            continue
+        create_partition(conn, name, start, end)
+        created.append(name)
+        logger.info(f"Created partition {name} [{start}, {end})")
+    return created
+
+
+def main() -> None:
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Create upcoming monthly partitions for the messages table.")
+    parser.add_argument("--months-ahead", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with engine.begin() as conn:
+        created = ensure_partitions(conn, months_ahead=args.months_ahead)
+    print(f"{len(created)} partition(s) created")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+"""Persistence for chat turns.
+
+A turn (conversation upsert, user and assistant messages, optional handoff)
+is written in a single transaction, and the response history is assembled
+from rows already known in-process instead of being read back.
+
+With CHAT_WRITE_MODE=write_behind the message inserts are handed to
+`app.writebehind` and committed in batches after the response is sent.
+
+History reads go to the read replica (DATABASE_REPLICA_URL) unless the
+conversation was written within the read-your-writes window, in which
+case they stay on the request's primary session.
+"""
+
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+from uuid import UUID, uuid4
+import logging
+import os
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics, models, rollups
+from app.cache import MISSING, CachedMessage, LRUCache, create_history_backend
+from app.database import AsyncSessionLocal, ReplicaSessionLocal, read_router
+from app.models import utcnow
+from app.writebehind import PendingTurn, WriteBehindFull, WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+# Number of messages returned with each chat response
+HISTORY_LIMIT = 10
+
+# Recent messages per session, so responses rarely read `messages` back
+history_cache = create_history_backend(HISTORY_LIMIT)
+
+# session_id -> conversation id, only for conversations known to be committed.
+# Keep the TTL well below the conversation retention window.
+session_cache = LRUCache(
+    maxsize=int(os.getenv("SESSION_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("SESSION_CACHE_TTL", "300")),
+)
+metrics.Gauge("chatbot_session_cache_entries", "Session ids in the session cache.", lambda: len(session_cache))
+metrics.FunctionCounter(
+    "chatbot_session_cache_hits_total", "Session lookups served from the session cache.", lambda: session_cache.hits
+)
+metrics.FunctionCounter(
+    "chatbot_session_cache_misses_total", "Session lookups that had to reach the database.", lambda: session_cache.misses
+)
+metrics.FunctionCounter(
+    "chatbot_session_cache_evictions_total", "Session ids evicted to stay within SESSION_CACHE_SIZE.",
+    lambda: session_cache.evictions,
+)
+
+# Batched message writes; started and stopped by the app lifespan
+write_behind = (
+    WriteBehindQueue(
+        AsyncSessionLocal,
+        max_queue=int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000")),
+        batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500")),
+        flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.05")),
+        enqueue_timeout=float(os.getenv("WRITE_BEHIND_ENQUEUE_TIMEOUT", "1.0")),
+    )
+    if os.getenv("CHAT_WRITE_MODE", "sync").lower() == "write_behind"
+    else None
+)
+# Turns that create a handoff are committed before the response is sent
+WRITE_BEHIND_SYNC_HANDOFFS = os.getenv("WRITE_BEHIND_SYNC_HANDOFFS", "true").lower() == "true"
+
+
+def _stat(component: Any, name: str) -> float:
+    """`name` from a cache's or queue's stats(); 0 when it is disabled."""
+    return component.stats().get(name, 0) if component is not None else 0
+
+
+metrics.Gauge(
+    "chatbot_history_cache_sessions", "Sessions in this worker's history cache (memory backend).",
+    lambda: _stat(history_cache, "sessions"),
+)
+metrics.Gauge(
+    "chatbot_history_cache_bytes", "Approximate size of this worker's history cache (memory backend).",
+    lambda: _stat(history_cache, "bytes"),
+)
+metrics.FunctionCounter(
+    "chatbot_history_cache_hits_total", "History reads served from the history cache.",
+    lambda: _stat(history_cache, "hits"),
+)
+metrics.FunctionCounter(
+    "chatbot_history_cache_misses_total", "History reads that had to query the messages table.",
+    lambda: _stat(history_cache, "misses"),
+)
+metrics.FunctionCounter(
+    "chatbot_history_cache_evictions_total", "Sessions evicted from the history cache (memory backend).",
+    lambda: _stat(history_cache, "evictions"),
+)
+metrics.Gauge(
+    "chatbot_write_behind_queue_depth", "Turns waiting in the write-behind queue.",
+    lambda: _stat(write_behind, "depth"),
+)
+metrics.FunctionCounter(
+    "chatbot_write_behind_flushed_turns_total", "Turns written by the write-behind flusher.",
+    lambda: _stat(write_behind, "flushed"),
+)
+metrics.FunctionCounter(
+    "chatbot_write_behind_flushes_total", "Batches committed by the write-behind flusher.",
+    lambda: _stat(write_behind, "flushes"),
+)
+metrics.FunctionCounter(
+    "chatbot_write_behind_dropped_turns_total", "Turns dropped after the write-behind flusher ran out of retries.",
+    lambda: _stat(write_behind, "dropped"),
+)
+
+
+class TurnInput:
+    """One turn to persist with `save_turns`; fields as for `save_turn`."""
+
+    def __init__(
+        self,
+        session_id: str,
+        locale: Optional[str],
+        messages: List[Dict[str, Any]],
+        handoff: Optional[Dict[str, Any]] = None,
+    ):
+        self.session_id = session_id
+        self.locale = locale
+        self.messages = messages
+        self.handoff = handoff
+
+
+class SavedTurn:
+    def __init__(self, conversation_id: UUID, session_id: str, created: bool, messages: List[CachedMessage]):
+        self.conversation_id = conversation_id
+        self.session_id = session_id
+        self.created = created
+        # Most recent messages in chronological order, including this turn's
+        self.messages = messages
+
+
+async def upsert_conversation(db: AsyncSession, session_id: str, locale: Optional[str]) -> tuple[UUID, bool]:
+    """Insert the conversation or fetch the existing one in one statement.
+
+    Returns (conversation_id, created). An existing conversation has its
+    `updated_at` bumped, which also marks the session as recently active.
+    """
+    new_id = uuid4()
+    stmt = pg_insert(models.Conversation).values(
+        id=new_id,
+        session_id=session_id,
+        channel="web",
+        locale=locale,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Conversation.session_id],
+        set_={"updated_at": stmt.excluded.updated_at},
+    ).returning(models.Conversation.id)
+    conversation_id = (await db.execute(stmt)).scalar_one()
+    return conversation_id, conversation_id == new_id
+
+
+async def save_turn(
+    db: AsyncSession,
+    session_id: str,
+    locale: Optional[str],
+    messages: List[Dict[str, Any]],
+    handoff: Optional[Dict[str, Any]] = None,
+) -> SavedTurn:
+    """Persist one chat turn and commit.
+
+    `messages` are dicts of Message column values (role, content, ...);
+    ids, conversation and timestamps are filled in here. In write-behind
+    mode only a new conversation is committed here; the message rows are
+    queued, falling back to a direct write when the queue is full.
+    """
+    with metrics.stage("conversation_lookup"):
+        conversation_id = session_cache.get(session_id)
+        if conversation_id is MISSING:
+            # Unknown sessions are created (or fetched) by the upsert
+            conversation_id, created = await upsert_conversation(db, session_id, locale)
+        else:
+            created = False
+
+    history: List[CachedMessage] = []
+    cached = None
+    if not created:
+        cached = await history_cache.get(session_id) if history_cache else None
+        if cached is not None:
+            history = cached
+        else:
+            with metrics.stage("history_query"):
+                async with _history_reader(db, conversation_id) as reader:
+                    result = await reader.execute(
+                        select(models.Message)
+                        .filter_by(conversation_id=conversation_id)
+                        .order_by(models.Message.created_at.desc())
+                        .limit(max(HISTORY_LIMIT - len(messages), 0))
+                    )
+                history = [CachedMessage.from_row(row) for row in reversed(result.scalars().all())]
+            if write_behind is not None:
+                history = _merge_pending(history, write_behind.pending_messages(conversation_id))
+
+    rows = _message_rows(conversation_id, messages)
+    await _write_turn(db, conversation_id, rows, handoff, locale, commit_first=created)
+    # Only cache the id once the conversation row is known to be committed
+    session_cache.set(session_id, conversation_id)
+
+    written = [_cached(row) for row in rows]
+    if history_cache:
+        if cached is not None:
+            await history_cache.append(session_id, written)
+        else:
+            await history_cache.set(session_id, history + written)
+
+    history = history + written
+    return SavedTurn(conversation_id, session_id, created, history[-HISTORY_LIMIT:])
+
+
+async def _write_turn(
+    db: AsyncSession,
+    conversation_id: UUID,
+    rows: List[Dict[str, Any]],
+    handoff: Optional[Dict[str, Any]],
+    locale: Optional[str],
+    commit_first: bool = False,
+) -> None:
+    """Insert a turn's rows and commit, or queue them in write-behind mode.
+
+    `commit_first` commits pending work (a new conversation) before the
+    rows are queued, since the flusher writes in its own transaction.
+    The turn is counted in the rollups once it is committed, by the
+    flusher for queued turns.
+    """
+    handoffs = [{"conversation_id": conversation_id, "status": "pending", **handoff}] if handoff else []
+    read_router.record_write(conversation_id)
+    deferred = (
+        write_behind is not None
+        and write_behind.running
+        and not (handoffs and WRITE_BEHIND_SYNC_HANDOFFS)
+    )
+    if deferred:
+        if commit_first:
+            await _commit(db)
+        try:
+            await write_behind.enqueue(PendingTurn(conversation_id, rows, handoffs, locale))
+        except WriteBehindFull as e:
+            logger.warning(f"{e}; writing turn directly")
+            deferred = False
+    if not deferred:
+        await db.execute(insert(models.Message.__table__), rows)
+        if handoffs:
+            await db.execute(insert(models.Handoff.__table__), handoffs)
+        await _commit(db)
+        rollups.aggregator.record(rows, len(handoffs), locale)
+
+
+async def _commit(db: AsyncSession) -> None:
+    with metrics.stage("commit"):
+        await db.commit()
+
+
+@asynccontextmanager
+async def _history_reader(db: AsyncSession, conversation_id: UUID) -> AsyncIterator[AsyncSession]:
+    """Session to read a conversation's history from: a replica, unless it was just written."""
+    if read_router.use_replica(conversation_id):
+        async with ReplicaSessionLocal() as replica:
+            yield replica
+    else:
+        yield db
+
+
+class SessionState:
+    """A session held open by a long-lived connection (see /api/v1/chat/ws).
+
+    The conversation id and recent history are resolved once and then
+    kept up to date in memory, so turns don't look either up again.
+    """
+
+    def __init__(
+        self,
+        conversation_id: UUID,
+        session_id: str,
+        created: bool,
+        history: List[CachedMessage],
+        locale: Optional[str] = None,
+    ):
+        self.conversation_id = conversation_id
+        self.session_id = session_id
+        self.created = created
+        self.locale = locale
+        self.history: Deque[CachedMessage] = deque(history, maxlen=HISTORY_LIMIT)
+
+
+async def open_session(db: AsyncSession, session_id: str, locale: Optional[str]) -> SessionState:
+    """Resolve (or create and commit) a session and load its recent history."""
+    with metrics.stage("conversation_lookup"):
+        conversation_id = session_cache.get(session_id)
+        if conversation_id is MISSING:
+            conversation_id, created = await upsert_conversation(db, session_id, locale)
+        else:
+            created = False
+    if created:
+        await _commit(db)
+    session_cache.set(session_id, conversation_id)
+
+    history: List[CachedMessage] = []
+    if not created:
+        cached = await history_cache.get(session_id) if history_cache else None
+        if cached is not None:
+            history = cached
+        else:
+            with metrics.stage("history_query"):
+                async with _history_reader(db, conversation_id) as reader:
+                    result = await reader.execute(
+                        select(models.Message)
+                        .filter_by(conversation_id=conversation_id)
+                        .order_by(models.Message.created_at.desc())
+                        .limit(HISTORY_LIMIT)
+                    )
+                history = [CachedMessage.from_row(row) for row in reversed(result.scalars().all())]
+            if write_behind is not None:
+                history = _merge_pending(history, write_behind.pending_messages(conversation_id))
+            if history_cache:
+                await history_cache.set(session_id, history)
+    return SessionState(conversation_id, session_id, created, history, locale)
+
+
+async def save_session_turn(
+    db: AsyncSession,
+    state: SessionState,
+    messages: List[Dict[str, Any]],
+    handoff: Optional[Dict[str, Any]] = None,
+) -> List[CachedMessage]:
+    """Persist a turn for an open session; returns the new messages.
+
+    Only the INSERTs and the commit reach the database.
+    """
+    rows = _message_rows(state.conversation_id, messages)
+    await _write_turn(db, state.conversation_id, rows, handoff, state.locale)
+    written = [_cached(row) for row in rows]
+    state.history.extend(written)
+    if history_cache:
+        # Other workers may serve this session too; keep the shared copy whole
+        await history_cache.set(state.session_id, state.history)
+    return written
+
+
+async def save_turns(db: AsyncSession, turns: List[TurnInput]) -> List[SavedTurn]:
+    """Persist many turns in one transaction with a fixed number of statements.
+
+    Sessions not in the session cache are resolved with one IN query and
+    the unknown ones created with one multi-row upsert. Histories missing
+    from the history cache are read with one windowed query. All messages,
+    then all handoffs, go out as one multi-row INSERT each. Turns for the
+    same session are applied in order, each seeing the ones before it.
+    """
+    session_ids = list(dict.fromkeys(turn.session_id for turn in turns))
+    with metrics.stage("conversation_lookup"):
+        conversation_ids: Dict[str, UUID] = {}
+        unresolved = []
+        for session_id in session_ids:
+            conversation_id = session_cache.get(session_id)
+            if conversation_id is MISSING:
+                unresolved.append(session_id)
+            else:
+                conversation_ids[session_id] = conversation_id
+
+        if unresolved:
+            result = await db.execute(
+                select(models.Conversation.session_id, models.Conversation.id)
+                .where(models.Conversation.session_id.in_(unresolved))
+            )
+            conversation_ids.update(result.tuples().all())
+
+        created = set()
+        locales = {turn.session_id: turn.locale for turn in reversed(turns)}
+        new_sessions = [session_id for session_id in unresolved if session_id not in conversation_ids]
+        if new_sessions:
+            new_ids = {session_id: uuid4() for session_id in new_sessions}
+            stmt = pg_insert(models.Conversation).values([
+                {"id": new_ids[session_id], "session_id": session_id, "channel": "web", "locale": locales[session_id]}
+                for session_id in new_sessions
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.Conversation.session_id],
+                set_={"updated_at": stmt.excluded.updated_at},
+            ).returning(models.Conversation.session_id, models.Conversation.id)
+            for session_id, conversation_id in (await db.execute(stmt)).tuples():
+                conversation_ids[session_id] = conversation_id
+                # A concurrent request may have created it first
+                if conversation_id == new_ids[session_id]:
+                    created.add(session_id)
+
+    histories: Dict[str, List[CachedMessage]] = {}
+    cache_hits = set()
+    to_read = []
+    for session_id in session_ids:
+        if session_id in created:
+            histories[session_id] = []
+            continue
+        cached = await history_cache.get(session_id) if history_cache else None
+        if cached is not None:
+            histories[session_id] = cached
+            cache_hits.add(session_id)
+        else:
+            to_read.append(conversation_ids[session_id])
+    if to_read:
+        on_replica, on_primary = [], []
+        for conversation_id in to_read:
+            (on_replica if read_router.use_replica(conversation_id) else on_primary).append(conversation_id)
+        with metrics.stage("history_query"):
+            if on_primary:
+                histories.update(await _read_histories(db, on_primary, conversation_ids))
+            if on_replica:
+                async with ReplicaSessionLocal() as replica:
+                    histories.update(await _read_histories(replica, on_replica, conversation_ids))
+
+    rows: List[Dict[str, Any]] = []
+    handoffs: List[Dict[str, Any]] = []
+    written: Dict[str, List[CachedMessage]] = {session_id: [] for session_id in session_ids}
+    saved = []
+    rows_by_turn = []
+    for turn in turns:
+        conversation_id = conversation_ids[turn.session_id]
+        turn_rows = _message_rows(conversation_id, turn.messages)
+        rows_by_turn.append(turn_rows)
+        rows.extend(turn_rows)
+        if turn.handoff:
+            handoffs.append({"conversation_id": conversation_id, "status": "pending", **turn.handoff})
+        written[turn.session_id].extend(_cached(row) for row in turn_rows)
+        history = histories[turn.session_id] + written[turn.session_id]
+        saved.append(SavedTurn(
+            conversation_id,
+            turn.session_id,
+            # Only the session's first turn in the batch counts as creating it
+            turn.session_id in created and len(written[turn.session_id]) == len(turn_rows),
+            history[-HISTORY_LIMIT:],
+        ))
+
+    for conversation_id in conversation_ids.values():
+        read_router.record_write(conversation_id)
+    if rows:
+        await db.execute(insert(models.Message.__table__), rows)
+    if handoffs:
+        await db.execute(insert(models.Handoff.__table__), handoffs)
+    await _commit(db)
+
+    for turn, turn_rows in zip(turns, rows_by_turn):
+        rollups.aggregator.record(turn_rows, 1 if turn.handoff else 0, turn.locale)
+    for session_id in session_ids:
+        session_cache.set(session_id, conversation_ids[session_id])
+        if history_cache:
+            if session_id in cache_hits:
+                await history_cache.append(session_id, written[session_id])
+            else:
+                await history_cache.set(session_id, histories[session_id] + written[session_id])
+    return saved
+
+
+async def _read_histories(
+    db: AsyncSession, conversation_ids: List[UUID], conversations_by_session: Dict[str, UUID]
+) -> Dict[str, List[CachedMessage]]:
+    """Last HISTORY_LIMIT messages of each conversation, in one query."""
+    recency = func.row_number().over(
+        partition_by=models.Message.conversation_id,
+        order_by=models.Message.created_at.desc(),
+    ).label("recency")
+    recent = (
+        select(models.Message.id, models.Message.conversation_id, models.Message.role,
+               models.Message.content, models.Message.created_at, recency)
+        .where(models.Message.conversation_id.in_(conversation_ids))
+        .subquery()
+    )
+    result = await db.execute(
+        select(recent).where(recent.c.recency <= HISTORY_LIMIT).order_by(recent.c.created_at)
+    )
+    by_conversation: Dict[UUID, List[CachedMessage]] = {conversation_id: [] for conversation_id in conversation_ids}
+    for row in result:
+        by_conversation[row.conversation_id].append(CachedMessage.from_row(row))
+    histories = {}
+    for session_id, conversation_id in conversations_by_session.items():
+        if conversation_id in by_conversation:
+            history = by_conversation[conversation_id]
+            if write_behind is not None:
+                history = _merge_pending(history, write_behind.pending_messages(conversation_id))
+            histories[session_id] = history
+    return histories
+
+
+def _message_rows(conversation_id: UUID, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Uniform keys let all rows go out as a single multi-row INSERT
+    return [
+        {
+            "id": uuid4(),
+            "conversation_id": conversation_id,
+            "intent": None,
+            "extra_data": None,
+            "created_at": utcnow(),
+            **message,
+        }
+        for message in messages
+    ]
+
+
+def _cached(row: Dict[str, Any]) -> CachedMessage:
+    return CachedMessage(str(row["id"]), row["role"], row["content"], row["created_at"])
+
+
+def _merge_pending(history: List[CachedMessage], pending: List[Dict[str, Any]]) -> List[CachedMessage]:
+    """Add queued rows missing from a history read from the database."""
+    if not pending:
+        return history
+    # A batch may be committed but not yet cleared from the queue
+    seen = {message.id for message in history}
+    merged = history + [_cached(row) for row in pending if str(row["id"]) not in seen]
+    merged.sort(key=lambda message: message.created_at)
+    return merged
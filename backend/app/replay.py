@@ -0,0 +1,287 @@
+"""Replay stored user messages through the intent/FAQ engine offline.
+
+Before changing FAQ keywords or intent rules, replay history through the
+changed engine to see what moves:
+
+    python -m app.replay --from 2024-01-01 --workers 8 --output report.json
+    python -m app.replay --jsonl transcripts.ndjson.gz --knowledge candidate.yaml
+
+Messages are streamed from `messages` (user messages only) or from a JSONL
+file, which may be gzip-compressed. Each line holds either one message
+(`{"message": "...", "intent": "..."}`, intent optional) or a transcript
+exported by `app.export`. Chunks of messages are scored across a process
+pool, exactly as `/api/v1/chat` would: the message is normalized, its
+intent detected, and FAQs matched unless it escalates.
+
+The report has the intent and FAQ distributions and, for messages with a
+recorded intent, how many the engine now classifies differently, by
+(recorded, replayed) pair with a few example messages each. The engine is
+the one in this checkout, with the knowledge base the server would load
+(KNOWLEDGE_FILE, else the built-in FAQs); `--knowledge` swaps in another
+knowledge base file. Files are always compiled afresh, never read from
+the server's snapshot cache, so engine changes show up in the report.
+"""
+
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+
+from app import knowledge, models
+from app.knowledge import KnowledgeSnapshot, normalize_message
+
+logger = logging.getLogger(__name__)
+
+# (content, recorded intent or None)
+ReplayMessage = Tuple[str, Optional[str]]
+
+REPLAY_CHUNK_SIZE = int(os.getenv("REPLAY_CHUNK_SIZE", "5000"))
+NO_FAQ = "(no match)"
+EXAMPLES_PER_CHANGE = 3
+
+
+class ReplayStats:
+    """Counts from scoring some messages; stats from chunks are merged."""
+
+    def __init__(self):
+        self.messages = 0
+        self.intents: Counter = Counter()
+        self.faqs: Counter = Counter()
+        # Messages whose intent was recorded, and (recorded, replayed) pairs that differ
+        self.compared = 0
+        self.changes: Counter = Counter()
+        self.examples: Dict[Tuple[str, str], List[str]] = {}
+
+    def merge(self, other: "ReplayStats") -> None:
+        self.messages += other.messages
+        self.intents.update(other.intents)
+        self.faqs.update(other.faqs)
+        self.compared += other.compared
+        self.changes.update(other.changes)
+        for change, examples in other.examples.items():
+            kept = self.examples.setdefault(change, [])
+            kept.extend(examples[:EXAMPLES_PER_CHANGE - len(kept)])
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        lookups = self.messages - self.intents["escalation"]
+        hits = lookups - self.faqs[NO_FAQ]
+        changed = sum(self.changes.values())
+        return {
+            "messages": self.messages,
+            "seconds": round(seconds, 3),
+            "messages_per_second": round(self.messages / seconds) if seconds else None,
+            "intents": dict(self.intents.most_common()),
+            "faqs": dict(self.faqs.most_common()),
+            "faq_hit_rate": hits / lookups if lookups else None,
+            "intent_diff": {
+                "compared": self.compared,
+                "changed": changed,
+                "changed_rate": changed / self.compared if self.compared else None,
+                "changes": [
+                    {"recorded": recorded, "replayed": replayed, "count": count,
+                     "examples": self.examples[(recorded, replayed)]}
+                    for (recorded, replayed), count in self.changes.most_common()
+                ],
+            },
+        }
+
+
+def score(snapshot: KnowledgeSnapshot, messages: Iterable[ReplayMessage]) -> ReplayStats:
+    """Run messages through the engine the way the chat endpoint does."""
+    stats = ReplayStats()
+    for content, recorded in messages:
+        normalized, _ = normalize_message(content)
+        analysis = snapshot.analyze(normalized, folded=True)
+        intent = analysis.intent
+        stats.messages += 1
+        stats.intents[intent] += 1
+        # Escalations hand off without looking for an FAQ
+        if intent != "escalation":
+            faq_match = analysis.faq_match
+            stats.faqs[faq_match[0].question if faq_match else NO_FAQ] += 1
+        if recorded is not None:
+            stats.compared += 1
+            if recorded != intent:
+                stats.changes[(recorded, intent)] += 1
+                examples = stats.examples.setdefault((recorded, intent), [])
+                if len(examples) < EXAMPLES_PER_CHANGE:
+                    examples.append(content)
+    return stats
+
+
+# Set in each pool worker by _init_worker, so chunks don't carry the snapshot
+_worker_snapshot: Optional[KnowledgeSnapshot] = None
+
+
+def _init_worker(snapshot: KnowledgeSnapshot) -> None:
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+
+def _score_chunk(messages: List[ReplayMessage]) -> ReplayStats:
+    return score(_worker_snapshot, messages)
+
+
+def chunked(messages: Iterable[ReplayMessage], size: int) -> Iterator[List[ReplayMessage]]:
+    chunk: List[ReplayMessage] = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_database_messages(
+    conn: Connection,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = REPLAY_CHUNK_SIZE,
+) -> Iterator[ReplayMessage]:
+    """User messages in [start, end), streamed over a server-side cursor."""
+    message = models.Message
+    stmt = select(message.content, message.intent).where(message.role == "user")
+    if start is not None:
+        stmt = stmt.where(message.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(message.created_at < end)
+    result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+    for partition in result.partitions():
+        yield from map(tuple, partition)
+
+
+def iter_jsonl_messages(path: Path) -> Iterator[ReplayMessage]:
+    """Messages from a JSONL file of messages or of exported transcripts."""
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "messages" in record:
+                for message in record["messages"]:
+                    if message["role"] == "user":
+                        yield message["content"], message.get("intent")
+            elif "message" in record:
+                yield record["message"], record.get("intent")
+            else:
+                raise ValueError(f"{path}:{line_number}: expected a 'message' or a transcript's 'messages'")
+
+
+def replay(
+    messages: Iterable[ReplayMessage],
+    snapshot: Optional[KnowledgeSnapshot] = None,
+    workers: int = 1,
+    chunk_size: int = REPLAY_CHUNK_SIZE,
+    progress_interval: float = 5.0,
+) -> Dict[str, Any]:
+    """Score `messages` with `snapshot` (default: the active knowledge base).
+
+    With more than one worker, chunks are scored in a process pool; at most
+    two chunks per worker are in flight, so memory stays bounded however
+    many messages are streamed. Progress is logged every
+    `progress_interval` seconds.
+    """
+    snapshot = snapshot or knowledge.active_snapshot()[1]
+    stats = ReplayStats()
+    started = last_progress = time.perf_counter()
+
+    def progress() -> None:
+        nonlocal last_progress
+        now = time.perf_counter()
+        if now - last_progress >= progress_interval:
+            last_progress = now
+            logger.info(f"Replayed {stats.messages} messages ({stats.messages / (now - started):.0f} msg/s)")
+
+    if workers <= 1:
+        for chunk in chunked(messages, chunk_size):
+            stats.merge(score(snapshot, chunk))
+            progress()
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(snapshot,)) as pool:
+            in_flight: List[Future] = []
+            for chunk in chunked(messages, chunk_size):
+                if len(in_flight) >= 2 * workers:
+                    stats.merge(in_flight.pop(0).result())
+                    progress()
+                in_flight.append(pool.submit(_score_chunk, chunk))
+            for future in in_flight:
+                stats.merge(future.result())
+                progress()
+    return stats.report(time.perf_counter() - started)
+
+
+def _utc(moment: datetime) -> datetime:
+    # Dates without a timezone (e.g. --from 2024-01-01) are taken as UTC
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _print_summary(report: Dict[str, Any]) -> None:
+    print(f"{report['messages']} messages in {report['seconds']}s ({report['messages_per_second']} msg/s)")
+    if not report["messages"]:
+        return
+    print("Intents:")
+    for intent, count in report["intents"].items():
+        print(f"  {intent:20s} {count:10d}  {count / report['messages']:6.1%}")
+    if report["faq_hit_rate"] is not None:
+        print(f"FAQ hit rate: {report['faq_hit_rate']:.1%}")
+    diff = report["intent_diff"]
+    if diff["compared"]:
+        print(f"Intent changes: {diff['changed']} of {diff['compared']} recorded ({diff['changed_rate']:.2%})")
+        for change in diff["changes"][:20]:
+            print(f"  {change['recorded']} -> {change['replayed']}: {change['count']}")
+
+
+def main() -> None:
+    from app.database import get_engine
+    from app.knowledge_loader import KnowledgeReloader, load_snapshot
+
+    parser = argparse.ArgumentParser(description="Replay stored user messages through the intent/FAQ engine.")
+    parser.add_argument("--jsonl", type=Path, help="read messages from this JSONL file instead of the database")
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat, help="database messages created from")
+    parser.add_argument("--to", dest="end", type=datetime.fromisoformat, help="database messages created before")
+    parser.add_argument("--knowledge", type=Path,
+                        help="knowledge base file to use (default: KNOWLEDGE_FILE, else the built-in FAQs)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=REPLAY_CHUNK_SIZE)
+    parser.add_argument("--output", type=Path, help="write the full report as JSON here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    if args.knowledge:
+        snapshot = load_snapshot(args.knowledge)[0]
+    else:
+        # The server's knowledge file, compiled with this checkout's engine
+        # rather than loaded from a cache built by another version
+        reloader = KnowledgeReloader.from_env()
+        snapshot = load_snapshot(reloader.path)[0] if reloader else None
+    if args.jsonl:
+        report = replay(iter_jsonl_messages(args.jsonl), snapshot, args.workers, args.chunk_size)
+    else:
+        with get_engine().connect() as conn:
+            messages = iter_database_messages(
+                conn,
+                _utc(args.start) if args.start else None,
+                _utc(args.end) if args.end else None,
+                args.chunk_size,
+            )
+            report = replay(messages, snapshot, args.workers, args.chunk_size)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    _print_summary(report)
+
+
+if __name__ == "__main__":
+    main()
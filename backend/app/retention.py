@@ -0,0 +1,362 @@
+"""Conversation retention: close idle conversations, archive and delete old ones.
+
+One run has three steps:
+
+1. Close: open conversations with no message for CONVERSATION_IDLE_TIMEOUT
+   seconds get status 'closed' and `ended_at` set to their last message.
+   Closed conversations that received a message since are reopened.
+2. Archive: conversations closed more than RETENTION_DAYS ago are
+   written, with their messages, handoffs and feedback, to gzip NDJSON
+   files in RETENTION_ARCHIVE_DIR (the `app.export` record format),
+   RETENTION_ARCHIVE_CHUNK conversations per file.
+3. Delete: once a file is safely on disk, its conversations are deleted
+   RETENTION_BATCH_SIZE at a time, one short transaction per batch.
+
+Every batch is a separate transaction, so no lock is held for long. The
+job sleeps RETENTION_THROTTLE seconds between batches so vacuum and
+replicas keep up. A Postgres advisory lock keeps concurrent runs (several
+workers, or cron plus the app) from overlapping. With RETENTION_INTERVAL
+set the app runs the job periodically; otherwise run it from cron:
+
+    python -m app.retention [--dry-run]
+
+Progress is logged and counted in chatbot_retention_* metrics.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import and_, delete, exists, func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from sqlalchemy.orm import aliased
+
+from app import export, metrics, models
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_try_advisory_lock, shared by every retention run
+ADVISORY_LOCK_KEY = 0x63687274
+
+RETENTION_CONVERSATIONS = metrics.Counter(
+    "chatbot_retention_conversations_total",
+    "Conversations processed by the retention job, by action (closed, reopened, archived, deleted).",
+    ["action"],
+)
+RETENTION_BATCH_DURATION = metrics.Histogram(
+    "chatbot_retention_batch_duration_seconds",
+    "Duration of each retention batch (one transaction, or one archive file) by step.",
+    ["step"],
+)
+_last_success = 0.0
+RETENTION_LAST_SUCCESS = metrics.Gauge(
+    "chatbot_retention_last_success_timestamp_seconds",
+    "Unix time the last retention run in this process completed.",
+    lambda: _last_success,
+)
+
+
+class RetentionJob:
+    def __init__(
+        self,
+        archive_dir: Path,
+        idle_timeout: float = 1800.0,
+        retention_days: float = 90.0,
+        batch_size: int = 500,
+        archive_chunk: int = 10000,
+        throttle: float = 0.1,
+        interval: float = 0.0,
+        engine: Optional[AsyncEngine] = None,
+    ):
+        self.archive_dir = archive_dir
+        self.idle_timeout = idle_timeout
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.archive_chunk = archive_chunk
+        self.throttle = throttle
+        self.interval = interval
+        # Defaults to the app's engine, resolved when the job runs
+        self.engine = engine
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "RetentionJob":
+        return cls(
+            Path(os.getenv("RETENTION_ARCHIVE_DIR", "archive")),
+            idle_timeout=float(os.getenv("CONVERSATION_IDLE_TIMEOUT", "1800")),
+            retention_days=float(os.getenv("RETENTION_DAYS", "90")),
+            batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "500")),
+            archive_chunk=int(os.getenv("RETENTION_ARCHIVE_CHUNK", "10000")),
+            throttle=float(os.getenv("RETENTION_THROTTLE", "0.1")),
+            interval=float(os.getenv("RETENTION_INTERVAL", "0")),
+        )
+
+    async def run(self, dry_run: bool = False, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """Run all three steps; returns counts, or None if another run holds the lock.
+
+        With `dry_run` nothing is written: the counts are what a run would
+        close, reopen, archive and delete.
+        """
+        from app.database import get_async_engine
+
+        global _last_success
+        engine = self.engine or get_async_engine()
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        now = now or datetime.now(timezone.utc)
+        idle_cutoff = now - timedelta(seconds=self.idle_timeout)
+        retention_cutoff = now - timedelta(days=self.retention_days)
+        start = time.perf_counter()
+
+        # Session-level lock on a connection of its own, held for the whole run
+        async with engine.connect() as lock:
+            if not await lock.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}):
+                logger.info("Retention run skipped: another run holds the lock")
+                return None
+            await lock.commit()
+            try:
+                if dry_run:
+                    result = await self._plan(session_factory, idle_cutoff, retention_cutoff)
+                else:
+                    result = {
+                        "reopened": await self._reopen(session_factory),
+                        "closed": await self._close_idle(session_factory, idle_cutoff),
+                        **await self._archive(session_factory, retention_cutoff, now),
+                    }
+            finally:
+                await lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                await lock.commit()
+        result.update(dry_run=dry_run, seconds=time.perf_counter() - start)
+        if not dry_run:
+            _last_success = time.time()
+        logger.info(f"Retention run{' (dry run)' if dry_run else ''}: {result}")
+        return result
+
+    async def _batches(self, session_factory, step: str, statement) -> int:
+        """Execute a bounded UPDATE ... RETURNING until it affects nothing; returns the total."""
+        total = 0
+        while True:
+            with _timed(step):
+                async with session_factory() as db:
+                    count = len((await db.execute(statement)).all())
+                    await db.commit()
+            total += count
+            RETENTION_CONVERSATIONS.inc(step, amount=count)
+            if count < self.batch_size:
+                return total
+            await asyncio.sleep(self.throttle)
+
+    async def _reopen(self, session_factory) -> int:
+        conversation = models.Conversation
+        batch = (
+            select(conversation.id)
+            .where(conversation.status == "closed", _has_message_after(conversation, conversation.ended_at))
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .cte()
+        )
+        return await self._batches(session_factory, "reopened", (
+            update(conversation)
+            .where(conversation.id.in_(select(batch.c.id)))
+            .values(status="open", ended_at=None, updated_at=func.now())
+            .returning(conversation.id)
+        ))
+
+    async def _close_idle(self, session_factory, idle_cutoff: datetime) -> int:
+        conversation, message = models.Conversation, models.Message
+        batch = (
+            select(conversation.id)
+            .where(*_idle(conversation, idle_cutoff))
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .cte()
+        )
+        last_message = (
+            select(func.max(message.created_at))
+            .where(message.conversation_id == conversation.id)
+            .scalar_subquery()
+        )
+        return await self._batches(session_factory, "closed", (
+            update(conversation)
+            .where(conversation.id.in_(select(batch.c.id)))
+            .values(status="closed", ended_at=func.coalesce(last_message, conversation.started_at), updated_at=func.now())
+            .returning(conversation.id)
+        ))
+
+    async def _archive(self, session_factory, retention_cutoff: datetime, now: datetime) -> Dict[str, Any]:
+        archived = deleted = 0
+        files: List[str] = []
+        filters = export.ExportFilters(ended_before=retention_cutoff)
+        after: Optional[export.Cursor] = None
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            path = self.archive_dir / f"conversations-{now:%Y%m%dT%H%M%S}-{len(files):05d}.ndjson.gz"
+            with _timed("archived"):
+                ids, last_cursor = await self._write_archive(session_factory, filters, after, path)
+            if not ids:
+                return {"archived": archived, "deleted": deleted, "files": files}
+            files.append(str(path))
+            archived += len(ids)
+            RETENTION_CONVERSATIONS.inc("archived", amount=len(ids))
+            # Conversations that were reopened or locked in the meantime are
+            # skipped; they stay in the file and are archived again later
+            after = export.parse_cursor(last_cursor)
+            for i in range(0, len(ids), self.batch_size):
+                deleted += await self._delete(session_factory, ids[i:i + self.batch_size], retention_cutoff)
+                await asyncio.sleep(self.throttle)
+            logger.info(f"Archived {len(ids)} conversations to {path}; {deleted} deleted so far")
+
+    async def _write_archive(
+        self, session_factory, filters: export.ExportFilters, after: Optional[export.Cursor], path: Path
+    ) -> tuple[List[UUID], Optional[str]]:
+        """Write the next chunk of archivable conversations to `path`; returns (ids, last cursor)."""
+        tmp = path.with_name(path.name + ".tmp")
+        writer = export.NDJSONWriter(tmp, "gzip")
+        ids: List[UUID] = []
+        last_cursor = None
+        try:
+            async with session_factory() as db:
+                async for record in export.iter_transcripts(db, filters, after, limit=self.archive_chunk):
+                    writer.write(record)
+                    ids.append(record["id"])
+                    last_cursor = record["cursor"]
+                    if len(ids) % 1000 == 0:
+                        # Compress and fsync off the event loop
+                        await asyncio.to_thread(writer.checkpoint)
+            await asyncio.to_thread(writer.checkpoint)
+        finally:
+            writer.close()
+        if ids:
+            os.replace(tmp, path)
+        else:
+            tmp.unlink()
+        return ids, last_cursor
+
+    async def _delete(self, session_factory, ids: List[UUID], retention_cutoff: datetime) -> int:
+        conversation = models.Conversation
+        with _timed("deleted"):
+            async with session_factory() as db:
+                # Locking the rows first blocks new messages (their foreign
+                # key check) until the batch commits; rows that got a message
+                # or are busy are left alone
+                locked = (await db.execute(
+                    select(conversation.id)
+                    .where(
+                        conversation.id.in_(ids),
+                        conversation.status == "closed",
+                        conversation.ended_at < retention_cutoff,
+                        ~_has_message_after(conversation, conversation.ended_at),
+                    )
+                    .with_for_update(skip_locked=True)
+                )).scalars().all()
+                if locked:
+                    for table in (models.Message, models.Handoff, models.Feedback):
+                        await db.execute(delete(table).where(table.conversation_id.in_(locked)))
+                    await db.execute(delete(conversation).where(conversation.id.in_(locked)))
+                await db.commit()
+        RETENTION_CONVERSATIONS.inc("deleted", amount=len(locked))
+        return len(locked)
+
+    async def _plan(self, session_factory, idle_cutoff: datetime, retention_cutoff: datetime) -> Dict[str, Any]:
+        conversation, message = models.Conversation, models.Message
+        # Idle conversations whose last activity is past the retention
+        # window are closed and archived in the same run; closed ones with
+        # newer messages are reopened first
+        archivable = select(conversation.id).where(
+            and_(
+                conversation.status == "closed",
+                conversation.ended_at < retention_cutoff,
+                ~_has_message_after(conversation, conversation.ended_at),
+            )
+            | and_(*_idle(conversation, retention_cutoff))
+        ).subquery()
+        async with session_factory() as db:
+            reopen = await db.scalar(select(func.count()).where(
+                conversation.status == "closed", _has_message_after(conversation, conversation.ended_at)
+            ))
+            close = await db.scalar(select(func.count()).where(*_idle(conversation, idle_cutoff)))
+            archive = await db.scalar(select(func.count()).select_from(archivable))
+            messages = await db.scalar(
+                select(func.count()).select_from(message).where(message.conversation_id.in_(select(archivable.c.id)))
+            )
+        return {"reopened": reopen, "closed": close, "archived": archive, "deleted": archive, "messages": messages}
+
+    def start(self) -> None:
+        """Run periodically on the running event loop, if an interval is set."""
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._loop(), name="retention")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}", exc_info=True)
+
+
+def _has_message_after(conversation, moment):
+    message = aliased(models.Message)
+    return exists().where(message.conversation_id == conversation.id, message.created_at > moment)
+
+
+def _idle(conversation, cutoff: datetime) -> List[Any]:
+    """Open conversations with no activity since `cutoff`."""
+    message = aliased(models.Message)
+    return [
+        conversation.status == "open",
+        conversation.started_at < cutoff,
+        ~exists().where(message.conversation_id == conversation.id, message.created_at >= cutoff),
+    ]
+
+
+@contextmanager
+def _timed(step: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        RETENTION_BATCH_DURATION.observe(time.perf_counter() - start, step)
+
+
+def main() -> None:
+    from app.database import dispose_async_engine
+
+    parser = argparse.ArgumentParser(description="Close idle conversations, then archive and delete old ones.")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be done")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    job = RetentionJob.from_env()
+
+    async def run() -> Optional[Dict[str, Any]]:
+        try:
+            return await job.run(dry_run=args.dry_run)
+        finally:
+            await dispose_async_engine()
+
+    result = asyncio.run(run())
+    if result is None:
+        print("Another retention run is in progress")
+    else:
+        print(", ".join(f"{key}: {value}" for key, value in result.items() if key != "files"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""BM25 retrieval over the FAQ knowledge base.
+
+Each FAQ's question, answer and keywords are tokenized into one document
+(keywords and the question count extra, as they describe what the FAQ is
+about). The per-(term, FAQ) BM25 weights are precomputed into a sparse
+term-major matrix held in flat NumPy arrays, so scoring a query is a
+gather over its terms' postings plus one `bincount`, and a batch of
+queries is scored the same way in a single call.
+
+Requires the optional `numpy` package.
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+import re
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise RuntimeError("FAQ_RETRIEVER=bm25 requires the 'numpy' package") from e
+
+from app.knowledge import FAQ, mask_entities
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+# Words too common in customer questions to say anything about the topic
+STOPWORDS = frozenset(
+    "a all an and any are as at be but can could do does for from get had has have "
+    "how i i'm if in is it it's just like me my no not of on or our please so that "
+    "that's the there this to was we what what's when where will with would you "
+    "your".split()
+)
+# Field weights: how many times each field is counted into the document
+QUESTION_WEIGHT = 2
+KEYWORD_WEIGHT = 3
+
+
+def _stem(token: str) -> str:
+    # Plural folding only: "refunds" -> "refund", but not "address" or "does"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    # Entities are masked the way normalize_message masks them, so a raw
+    # message and its normalized text give the same tokens (the reply
+    # cache analyzes normalized text); punctuation is already a separator
+    return [_stem(token) for token in _TOKEN.findall(mask_entities(text).lower()) if token not in STOPWORDS]
+
+
+class BM25Retriever:
+    """Okapi BM25 ranking of FAQs with vectorized scoring."""
+
+    def __init__(self, faqs: Sequence[FAQ], k1: float = 1.2, b: float = 0.75, min_confidence: float = 25.0):
+        self.faqs = list(faqs)
+        self.k1 = k1
+        self.b = b
+        self.min_confidence = min_confidence
+
+        documents = [self._document(faq) for faq in self.faqs]
+        lengths = np.array([sum(doc.values()) for doc in documents], dtype=np.float64)
+        avg_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, doc in enumerate(documents):
+            for term, tf in doc.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        # CSR layout, one row per term: row t's FAQs are
+        # _doc_ids[_offsets[t]:_offsets[t + 1]] with matching _weights
+        self.vocabulary: Dict[str, int] = {}
+        offsets = [0]
+        doc_ids: List[int] = []
+        weights: List[float] = []
+        n_docs = len(self.faqs)
+        for term, term_postings in postings.items():
+            self.vocabulary[term] = len(self.vocabulary)
+            idf = math.log(1 + (n_docs - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for doc_id, tf in term_postings:
+                norm = k1 * (1 - b + b * lengths[doc_id] / avg_length)
+                doc_ids.append(doc_id)
+                weights.append(idf * tf * (k1 + 1) / (tf + norm))
+            offsets.append(len(doc_ids))
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._doc_ids = np.array(doc_ids, dtype=np.int64)
+        self._weights = np.array(weights, dtype=np.float64)
+        # Best weight any FAQ gets for each term, for confidence scaling
+        self._term_max = np.zeros(len(self.vocabulary))
+        term_of_posting = np.repeat(np.arange(len(self.vocabulary)), np.diff(self._offsets))
+        np.maximum.at(self._term_max, term_of_posting, self._weights)
+
+    @staticmethod
+    def _document(faq: FAQ) -> Counter:
+        tokens = tokenize(faq.answer)
+        tokens += tokenize(faq.question) * QUESTION_WEIGHT
+        for keyword in faq.keywords:
+            tokens += tokenize(keyword) * KEYWORD_WEIGHT
+        return Counter(tokens)
+
+    def _term_ids(self, query: str) -> np.ndarray:
+        ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        return np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+    def _gather(self, term_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Postings of the given terms: (doc ids, weights, posting counts per term)."""
+        starts = self._offsets[term_ids]
+        counts = self._offsets[term_ids + 1] - starts
+        # Flat positions of every posting of every term, without a Python loop
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return self._doc_ids[positions], self._weights[positions], counts
+
+    def score_batch(self, queries: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Score every query against every FAQ in one pass.
+
+        Returns (scores, ceilings): a (len(queries), len(faqs)) score matrix
+        and each query's best possible score, the sum of its terms' maximum
+        weights.
+        """
+        n_docs = len(self.faqs)
+        per_query = [self._term_ids(query) for query in queries]
+        term_ids = np.concatenate(per_query) if per_query else np.zeros(0, dtype=np.int64)
+        query_of_term = np.repeat(np.arange(len(queries)), [len(ids) for ids in per_query])
+        doc_ids, weights, counts = self._gather(term_ids)
+        cells = np.repeat(query_of_term, counts) * n_docs + doc_ids
+        scores = np.bincount(cells, weights=weights, minlength=len(queries) * n_docs)
+        ceilings = np.bincount(query_of_term, weights=self._term_max[term_ids], minlength=len(queries))
+        return scores.reshape(len(queries), n_docs), ceilings
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[FAQ, float]]:
+        """Top-k FAQs for a query as (FAQ, BM25 score), best first."""
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries: Sequence[str], k: int = 5) -> List[List[Tuple[FAQ, float]]]:
+        scores, _ = self.score_batch(queries)
+        return [self._top_k(row, k) for row in scores]
+
+    def _top_k(self, row: np.ndarray, k: int) -> List[Tuple[FAQ, float]]:
+        k = min(k, len(row))
+        if k == 0:
+            return []
+        top = np.argpartition(-row, k - 1)[:k]
+        # Ties go to the FAQ listed first
+        top = top[np.lexsort((top, -row[top]))]
+        return [(self.faqs[i], float(row[i])) for i in top if row[i] > 0]
+
+    def best_match(self, message: str) -> Optional[Tuple[FAQ, float]]:
+        """(FAQ, confidence) like `FAQIndex.best_match`, or None.
+
+        Confidence is the score as a percentage of the query's ceiling,
+        capped at 95 like the keyword matcher.
+        """
+        scores, ceilings = self.score_batch([message])
+        if not len(self.faqs) or ceilings[0] <= 0:
+            return None
+        best = int(np.argmax(scores[0]))
+        confidence = min(100 * scores[0, best] / ceilings[0], 95.0)
+        if confidence < self.min_confidence:
+            return None
+        return self.faqs[best], float(confidence)
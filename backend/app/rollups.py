@@ -0,0 +1,340 @@
+"""Hourly analytics rollups: intent mix, FAQ hit rate and handoff rate.
+
+`chat_rollups_hourly` holds one row per (hour, channel, locale, intent)
+with counts of user messages, FAQ hits and misses, and handoffs. The
+reporting endpoints read only this table, never `messages`.
+
+Counts are kept up to date incrementally: persistence calls
+`aggregator.record` for every turn it commits (for write-behind turns, the
+flusher does once their batch is written), the counts accumulate in
+memory and are flushed every ROLLUP_FLUSH_INTERVAL seconds as one
+multi-row upsert that adds to the stored values. Each worker flushes its
+own deltas. A worker that dies without a graceful shutdown loses at most
+one interval of counts; a backfill of the affected hours repairs them.
+
+An hour is settled ROLLUP_SETTLE_DELAY seconds after it ends. The backfill
+only rebuilds settled hours, and flushes drop deltas for settled hours
+instead of adding them to counts a backfill may already include. An
+advisory lock (shared by flushes, exclusive for each backfill window)
+keeps a flush that started before an hour settled from committing while
+a backfill rebuilds it.
+
+The backfill rebuilds rollups from `messages` and `handoffs`, a day per
+transaction:
+
+    python -m app.rollups backfill [--from 2024-01-01] [--to 2024-02-01]
+
+Only backfill hours whose messages are still in the database: hours
+already removed by the retention job would be rebuilt as empty. Live
+counts use the locale the client sent with each message; the backfill,
+which only has the conversation's, uses the locale it started with.
+FAQ hits are known for messages saved with a `faq_hit` flag; older
+messages count towards neither hits nor misses.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, DefaultDict, Dict, Iterable, List, Optional, Tuple
+import argparse
+import asyncio
+import logging
+import os
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics, models
+
+logger = logging.getLogger(__name__)
+
+# (bucket_start, channel, locale, intent)
+RollupKey = Tuple[datetime, str, str, str]
+COUNTS = ("messages", "faq_hits", "faq_misses", "handoffs")
+
+# Seconds after an hour ends before it is settled; must exceed the time a
+# turn's deltas can take to be flushed (ROLLUP_FLUSH_INTERVAL, plus the
+# write-behind queue in that mode)
+ROLLUP_SETTLE_DELAY = float(os.getenv("ROLLUP_SETTLE_DELAY", "300"))
+# Arbitrary key for the flush/backfill advisory lock
+ADVISORY_LOCK_KEY = 0x726f6c6c
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def settled_before(now: datetime, delay: float = ROLLUP_SETTLE_DELAY) -> datetime:
+    """Start of the oldest hour that may still receive live deltas at `now`."""
+    return hour_bucket(now - timedelta(seconds=delay))
+
+
+class RollupAggregator:
+    """In-process rollup deltas, flushed to the database periodically."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        flush_interval: float = 10.0,
+        settle_delay: float = ROLLUP_SETTLE_DELAY,
+        clock: Callable[[], datetime] = _utcnow,
+    ):
+        self._session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.settle_delay = settle_delay
+        self._clock = clock
+        self._pending: DefaultDict[RollupKey, List[int]] = defaultdict(lambda: [0, 0, 0, 0])
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def record(self, rows: Iterable[Dict[str, Any]], handoffs: int, locale: Optional[str], channel: str = "web") -> None:
+        """Count a saved turn: its user messages (by intent) and handoffs.
+
+        `rows` are the turn's message rows as persisted; FAQ hits come from
+        the `faq_hit` flag in their extra_data. Handoffs count under the
+        intent of the turn's user message.
+        """
+        for row in rows:
+            if row["role"] != "user" or row["intent"] is None:
+                continue
+            counts = self._pending[(hour_bucket(row["created_at"]), channel, locale or "", row["intent"])]
+            counts[0] += 1
+            faq_hit = (row["extra_data"] or {}).get("faq_hit")
+            if faq_hit is not None:
+                counts[1 if faq_hit else 2] += 1
+            counts[3] += handoffs
+            handoffs = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _drop_settled(self, pending: Dict[RollupKey, List[int]]) -> None:
+        horizon = settled_before(self._clock(), self.settle_delay)
+        settled = [key for key in pending if key[0] < horizon]
+        for key in settled:
+            del pending[key]
+        if settled:
+            self.dropped += len(settled)
+            logger.warning(
+                f"Dropped {len(settled)} rollup rows of deltas for hours before {horizon}, which are "
+                "settled; backfill those hours to count them"
+            )
+
+    async def flush(self) -> int:
+        """Upsert the pending deltas; returns the number of rollup rows written.
+
+        On failure the deltas are kept for the next flush.
+        """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, defaultdict(lambda: [0, 0, 0, 0])
+        try:
+            with metrics.stage("rollup_flush"):
+                async with self._session_factory() as db:
+                    # Held until commit; checked after taking it so a backfill
+                    # that waited for this flush never sees its deltas land
+                    await db.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": ADVISORY_LOCK_KEY})
+                    self._drop_settled(pending)
+                    if pending:
+                        await db.execute(_upsert(pending))
+                    await db.commit()
+        except Exception:
+            self.failures += 1
+            for key, counts in pending.items():
+                merged = self._pending[key]
+                for i, count in enumerate(counts):
+                    merged[i] += count
+            raise
+        self.flushes += 1
+        return len(pending)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="rollup-flusher")
+
+    async def stop(self) -> None:
+        """Stop the periodic flush and write what is pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final rollup flush failed, {self.pending} rollup rows lost: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Rollup flush failed, retrying next interval: {e}")
+
+
+def _upsert(pending: Dict[RollupKey, List[int]]) -> Any:
+    values = [
+        {"bucket_start": bucket, "channel": channel, "locale": locale, "intent": intent,
+         **dict(zip(COUNTS, counts))}
+        for (bucket, channel, locale, intent), counts in pending.items()
+    ]
+    table = models.HourlyRollup.__table__
+    stmt = pg_insert(table).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.bucket_start, table.c.channel, table.c.locale, table.c.intent],
+        set_={name: table.c[name] + stmt.excluded[name] for name in COUNTS},
+    )
+
+
+def _create_aggregator() -> RollupAggregator:
+    from app.database import AsyncSessionLocal
+
+    return RollupAggregator(AsyncSessionLocal, float(os.getenv("ROLLUP_FLUSH_INTERVAL", "10")))
+
+
+# Started and stopped by the app lifespan
+aggregator = _create_aggregator()
+
+
+_BACKFILL_MESSAGES = text("""
+    INSERT INTO chat_rollups_hourly (bucket_start, channel, locale, intent, messages, faq_hits, faq_misses, handoffs)
+    SELECT date_trunc('hour', m.created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           c.channel, coalesce(c.locale, ''), m.intent,
+           count(*),
+           count(*) FILTER (WHERE m.extra_data->>'faq_hit' = 'true'),
+           count(*) FILTER (WHERE m.extra_data->>'faq_hit' = 'false'),
+           0
+    FROM messages m JOIN conversations c ON c.id = m.conversation_id
+    WHERE m.role = 'user' AND m.intent IS NOT NULL
+      AND m.created_at >= :start AND m.created_at < :end
+    GROUP BY 1, 2, 3, 4
+""")
+# A handoff counts under the intent of the latest user message before it
+# in its conversation, which is the message of the turn that created it
+_BACKFILL_HANDOFFS = text("""
+    INSERT INTO chat_rollups_hourly (bucket_start, channel, locale, intent, messages, faq_hits, faq_misses, handoffs)
+    SELECT date_trunc('hour', m.created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           c.channel, coalesce(c.locale, ''), m.intent, 0, 0, 0, count(*)
+    FROM handoffs h
+    JOIN conversations c ON c.id = h.conversation_id
+    CROSS JOIN LATERAL (
+        SELECT created_at, intent FROM messages
+        WHERE conversation_id = h.conversation_id AND role = 'user' AND intent IS NOT NULL
+          AND created_at <= h.created_at
+        ORDER BY created_at DESC LIMIT 1
+    ) m
+    WHERE m.created_at >= :start AND m.created_at < :end
+      -- Only handoffs that can belong to this window (a handoff row is
+      -- written moments after its message) need the lateral lookup
+      AND h.created_at >= :start AND h.created_at < CAST(:end AS timestamptz) + interval '1 minute'
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (bucket_start, channel, locale, intent)
+    DO UPDATE SET handoffs = chat_rollups_hourly.handoffs + excluded.handoffs
+""")
+
+
+def backfill(
+    conn: Connection,
+    start: datetime,
+    end: datetime,
+    window: timedelta = timedelta(days=1),
+    now: Optional[datetime] = None,
+) -> int:
+    """Rebuild the rollups for hours in [start, end), one transaction per `window`.
+
+    `start` and `end` are rounded down to the hour, and `end` is capped at
+    the settled hours (as of `now`, default the current time): later hours
+    still receive live deltas. Returns the number of rollup rows written.
+    Rollups for the rebuilt hours are replaced, so running it again gives
+    the same result.
+    """
+    horizon = settled_before(now or _utcnow())
+    if hour_bucket(end) > horizon:
+        logger.info(f"Hours from {horizon} are not settled yet; backfilling up to {horizon}")
+    start, end = hour_bucket(start), min(hour_bucket(end), horizon)
+    written = 0
+    while start < end:
+        stop = min(start + window, end)
+        params = {"start": start, "end": stop}
+        # Waits for in-flight flushes; later ones drop deltas for these hours
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        conn.execute(
+            text("DELETE FROM chat_rollups_hourly WHERE bucket_start >= :start AND bucket_start < :end"), params
+        )
+        conn.execute(_BACKFILL_MESSAGES, params)
+        conn.execute(_BACKFILL_HANDOFFS, params)
+        written += conn.scalar(
+            text("SELECT count(*) FROM chat_rollups_hourly WHERE bucket_start >= :start AND bucket_start < :end"),
+            params,
+        )
+        conn.commit()
+        logger.info(f"Rebuilt rollups for [{start}, {stop})")
+        start = stop
+    return written
+
+
+async def report(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    granularity: str = "hour",
+    channel: Optional[str] = None,
+    locale: Optional[str] = None,
+) -> List[Any]:
+    """Rollup rows summed per (bucket, intent), bucket truncated to `granularity` in UTC."""
+    rollup = models.HourlyRollup
+    bucket = func.timezone("UTC", func.date_trunc(granularity, func.timezone("UTC", rollup.bucket_start)))
+    bucket = bucket.label("bucket")
+    stmt = (
+        select(bucket, rollup.intent, *(func.sum(getattr(rollup, name)).label(name) for name in COUNTS))
+        .where(rollup.bucket_start >= start, rollup.bucket_start < end)
+        .group_by(bucket, rollup.intent)
+        .order_by(bucket, rollup.intent)
+    )
+    if channel is not None:
+        stmt = stmt.where(rollup.channel == channel)
+    if locale is not None:
+        stmt = stmt.where(rollup.locale == locale)
+    return (await db.execute(stmt)).all()
+
+
+def _utc(moment: datetime) -> datetime:
+    # Dates without a timezone (e.g. --from 2024-01-01) are taken as UTC
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def main() -> None:
+    from app.database import get_engine
+
+    parser = argparse.ArgumentParser(description="Rebuild analytics rollups from message history.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subcommands.add_parser("backfill", help="rebuild rollups for a time range")
+    backfill_parser.add_argument("--from", dest="start", type=datetime.fromisoformat,
+                                 help="default: the oldest message")
+    backfill_parser.add_argument("--to", dest="end", type=datetime.fromisoformat,
+                                 help="default: the latest settled hour (see ROLLUP_SETTLE_DELAY)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with get_engine().connect() as conn:
+        start = args.start or conn.scalar(select(func.min(models.Message.created_at)))
+        if start is None:
+            print("No messages to backfill from")
+            return
+        end = args.end or datetime.now(timezone.utc)
+        written = backfill(conn, _utc(start), _utc(end))
+    print(f"{written} rollup rows written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Write-behind persistence for chat messages.
+
+With CHAT_WRITE_MODE=write_behind, chat() hands each turn's message (and
+handoff) rows to an in-process queue and replies without waiting for a
+commit. A background task drains the queue and writes many turns per
+transaction with multi-row INSERTs, flushing when a batch fills up or the
+flush interval elapses.
+
+Trade-off: turns still in the queue are lost if the process dies without a
+graceful shutdown. WRITE_BEHIND_SYNC_HANDOFFS (default on) keeps turns that
+create a handoff on the synchronous path.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+import asyncio
+import logging
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics, models, rollups
+from app.database import read_router
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindFull(Exception):
+    """The queue stayed full for longer than the enqueue timeout."""
+
+
+class PendingTurn:
+    def __init__(
+        self,
+        conversation_id: UUID,
+        messages: List[Dict[str, Any]],
+        handoffs: List[Dict[str, Any]],
+        locale: Optional[str] = None,
+    ):
+        self.conversation_id = conversation_id
+        self.messages = messages
+        self.handoffs = handoffs
+        self.locale = locale
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        enqueue_timeout: float = 1.0,
+        max_retries: int = 3,
+    ):
+        self._session_factory = session_factory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Queued message rows per conversation, so a history read that misses
+        # the cache can still see writes that haven't reached the database
+        self._pending: Dict[UUID, List[PendingTurn]] = {}
+        self.enqueued = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self) -> None:
+        """Start the flusher on the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run(), name="write-behind-flusher")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Flush everything queued, then stop the flusher."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Write-behind shutdown timed out; {self._queue.qsize()} turns not persisted")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def enqueue(self, turn: PendingTurn) -> None:
+        """Queue a turn; waits while the queue is full (backpressure).
+
+        Raises WriteBehindFull if no space frees up within `enqueue_timeout`,
+        so the caller can fall back to a synchronous write.
+        """
+        self._pending.setdefault(turn.conversation_id, []).append(turn)
+        try:
+            await asyncio.wait_for(self._queue.put(turn), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(turn)
+            raise WriteBehindFull(f"write-behind queue full ({self.max_queue} turns)")
+        self.enqueued += 1
+
+    def _forget(self, turn: PendingTurn) -> None:
+        pending = self._pending.get(turn.conversation_id)
+        if pending is not None:
+            pending.remove(turn)
+            if not pending:
+                del self._pending[turn.conversation_id]
+
+    def pending_messages(self, conversation_id: UUID) -> List[Dict[str, Any]]:
+        """Message rows queued for a conversation but not yet written."""
+        return [row for turn in self._pending.get(conversation_id, ()) for row in turn.messages]
+
+    async def _next_batch(self) -> List[PendingTurn]:
+        batch = [await self._queue.get()]
+        if self._queue.qsize() < self.batch_size - 1:
+            # Give concurrent turns a moment to join this batch
+            await asyncio.sleep(self.flush_interval)
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _write(self, batch: List[PendingTurn]) -> None:
+        messages = [row for turn in batch for row in turn.messages]
+        handoffs = [row for turn in batch for row in turn.handoffs]
+        conversation_ids = sorted({turn.conversation_id for turn in batch})
+        conversations = models.Conversation.__table__
+        async with self._session_factory() as db:
+            await db.execute(insert(models.Message.__table__), messages)
+            if handoffs:
+                await db.execute(insert(models.Handoff.__table__), handoffs)
+            # The request that queued a turn doesn't commit, so its conversation
+            # upsert's updated_at bump is made here
+            await db.execute(
+                update(conversations).where(conversations.c.id.in_(conversation_ids)).values(updated_at=func.now())
+            )
+            await db.commit()
+        # Replicas may lag behind this commit; keep reads on the primary a while longer.
+        # Rollups count turns only once they are durable, so dropped batches don't count.
+        for turn in batch:
+            read_router.record_write(turn.conversation_id)
+            rollups.aggregator.record(turn.messages, len(turn.handoffs), turn.locale)
+
+    async def _flush(self, batch: List[PendingTurn]) -> None:
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                with metrics.stage("write_behind_flush"):
+                    await self._write(batch)
+                self.flushed += len(batch)
+                self.flushes += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Write-behind flush of {len(batch)} turns failed after {attempt} attempts: {e}", exc_info=True)
+                    await self._flush_halves(batch)
+                    return
+                logger.warning(f"Write-behind flush failed (attempt {attempt}): {e}")
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+    async def _flush_halves(self, batch: List[PendingTurn]) -> None:
+        """Write a batch that keeps failing in ever smaller parts.
+
+        One bad turn (say, a foreign key violation) fails its whole batch;
+        bisecting drops only the turns that fail on their own.
+        """
+        if len(batch) == 1:
+            self.dropped += 1
+            logger.error(f"Dropping write-behind turn for conversation {batch[0].conversation_id}")
+            return
+        middle = len(batch) // 2
+        for part in (batch[:middle], batch[middle:]):
+            try:
+                with metrics.stage("write_behind_flush"):
+                    await self._write(part)
+            except Exception as e:
+                logger.warning(f"Write-behind flush of {len(part)} turns failed: {e}")
+                await self._flush_halves(part)
+                continue
+            self.flushed += len(part)
+            self.flushes += 1
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            finally:
+                for turn in batch:
+                    self._forget(turn)
+                    self._queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.depth,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+        }
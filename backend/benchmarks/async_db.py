@@ -0,0 +1,83 @@
+"""Load test: blocking sync sessions vs async sessions inside `async def` handlers.
+
+Both endpoints run the same slow query (`pg_sleep`) against the configured
+database; the sync one does it the way `chat()` used to, which stalls the
+event loop, the async one awaits it. A third run drives the real
+`/api/v1/chat` endpoint. Requires a reachable Postgres (DATABASE_URL).
+
+Usage (from backend/):
+    python -m benchmarks.async_db [--requests 200] [--concurrency 50] [--delay 0.05]
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.database import SessionLocal, async_engine, engine, get_db
+from app.main import app as chat_app
+
+bench_app = FastAPI()
+
+
+@bench_app.get("/blocking")
+async def blocking(delay: float) -> dict:
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT pg_sleep(:delay)"), {"delay": delay})
+    finally:
+        db.close()
+    return {"ok": True}
+
+
+@bench_app.get("/async")
+async def non_blocking(delay: float, db: AsyncSession = Depends(get_db)) -> dict:
+    await db.execute(text("SELECT pg_sleep(:delay)"), {"delay": delay})
+    return {"ok": True}
+
+
+async def drive(app: FastAPI, method: str, path: str, total: int, concurrency: int, **kwargs) -> float:
+    """Send `total` requests with at most `concurrency` in flight; return req/s."""
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+
+        async def one() -> None:
+            async with semaphore:
+                response = await client.request(method, path, **kwargs)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return total / (time.perf_counter() - start)
+
+
+async def main(args: argparse.Namespace) -> None:
+    models.Base.metadata.create_all(bind=engine)
+    params = {"params": {"delay": args.delay}}
+
+    blocking_rps = await drive(bench_app, "GET", "/blocking", args.requests, args.concurrency, **params)
+    async_rps = await drive(bench_app, "GET", "/async", args.requests, args.concurrency, **params)
+    chat_rps = await drive(
+        chat_app, "POST", "/api/v1/chat", args.requests, args.concurrency,
+        json={"message": "How long does shipping take?"},
+    )
+
+    print(f"query delay {args.delay * 1000:.0f}ms, concurrency {args.concurrency}, {args.requests} requests")
+    print(f"  blocking sync session : {blocking_rps:8.1f} req/s")
+    print(f"  async session         : {async_rps:8.1f} req/s")
+    print(f"  /api/v1/chat (async)  : {chat_rps:8.1f} req/s")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.05, help="seconds of pg_sleep per request")
+    asyncio.run(main(parser.parse_args()))
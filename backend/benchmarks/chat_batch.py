@@ -0,0 +1,99 @@
+"""Throughput: single-message /api/v1/chat vs /api/v1/chat/batch.
+
+Sends the same messages (half to new sessions, half as follow-ups to
+sessions created in a warm-up round) through the single-message endpoint
+at a fixed concurrency, then through the batch endpoint at several batch
+sizes. Reports messages/s and SQL statements per message. Requires a
+reachable Postgres (DATABASE_URL).
+
+Usage (from backend/):
+    python -m benchmarks.chat_batch [--messages 1000] [--concurrency 20]
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import time
+from uuid import uuid4
+
+import httpx
+
+from app import main as chat_main, models
+from app.database import async_engine, engine
+from app.main import app
+
+MESSAGES = [
+    "Where is my order ORD-12345?",
+    "How long does shipping take?",
+    "What is your return policy?",
+    "I forgot my password",
+    "Can I pay with PayPal?",
+    "I need to speak to a person",
+]
+
+
+def make_requests(count: int, returning_sessions: list) -> list:
+    texts = itertools.cycle(MESSAGES)
+    requests = []
+    for i in range(count):
+        session_id = returning_sessions[i // 2 % len(returning_sessions)] if i % 2 else f"sess_{uuid4().hex}"
+        requests.append({"message": next(texts), "session_id": session_id})
+    return requests
+
+
+def _statements(response: httpx.Response) -> int:
+    response.raise_for_status()
+    return int(response.headers["X-DB-Statements"])
+
+
+async def run_single(client: httpx.AsyncClient, requests: list, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(body: dict) -> int:
+        async with semaphore:
+            return _statements(await client.post("/api/v1/chat", json=body))
+
+    start = time.perf_counter()
+    statements = sum(await asyncio.gather(*(one(body) for body in requests)))
+    return time.perf_counter() - start, statements
+
+
+async def run_batches(client: httpx.AsyncClient, requests: list, batch_size: int) -> tuple:
+    start = time.perf_counter()
+    statements = 0
+    for i in range(0, len(requests), batch_size):
+        batch = {"requests": requests[i:i + batch_size]}
+        statements += _statements(await client.post("/api/v1/chat/batch", json=batch))
+    return time.perf_counter() - start, statements
+
+
+async def main(args: argparse.Namespace) -> None:
+    models.Base.metadata.create_all(bind=engine)
+    chat_main.EXPOSE_DB_STATS = True
+    # Per-message INFO logging would dominate both modes
+    logging.getLogger("app").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        returning = [f"sess_{uuid4().hex}" for _ in range(args.messages // 2 or 1)]
+        await run_batches(client, [{"message": "hello", "session_id": s} for s in returning], 500)
+
+        print(f"{args.messages} messages, half to returning sessions")
+        print(f"{'mode':<28} {'msgs/s':>9} {'stmts/msg':>10}")
+        elapsed, statements = await run_single(client, make_requests(args.messages, returning), args.concurrency)
+        print(f"{f'single, concurrency {args.concurrency}':<28} {args.messages / elapsed:>9.0f} "
+              f"{statements / args.messages:>10.2f}")
+        for batch_size in args.batch_sizes:
+            elapsed, statements = await run_batches(client, make_requests(args.messages, returning), batch_size)
+            print(f"{f'batch of {batch_size}':<28} {args.messages / elapsed:>9.0f} "
+                  f"{statements / args.messages:>10.2f}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 100, 500])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""Per-turn /api/v1/chat response size and serialization time.
+
+Compares three ways of producing the response body for a turn in a
+conversation with a full history window:
+
+  models + response_model  ChatMessage/ChatResponse objects, validated
+                           again by FastAPI's response_model (the old path)
+  plain data, full window  `_chat_payload` encoded with pydantic_core
+  plain data, since-cursor the same, when the client sends `since`
+
+Runs in-process on synthetic turns; no database needed.
+
+Usage (from backend/):
+    python -m benchmarks.chat_payload [--turns 5000]
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic_core import to_json
+
+from app import persistence
+from app.cache import CachedMessage
+from app.main import ChatMessage, ChatResponse, Handoff, PreparedTurn, _chat_payload
+
+RESPONSE_FIELD = create_response_field(name="response", type_=ChatResponse)
+
+
+def make_turn(history: int, since: bool) -> tuple:
+    start = datetime.now(timezone.utc)
+    messages = [
+        CachedMessage(
+            str(uuid4()),
+            "user" if i % 2 == 0 else "assistant",
+            "Where is my order ORD-12345? It was supposed to arrive yesterday."
+            if i % 2 == 0
+            else "You can track your order using the tracking link in your confirmation email.",
+            start + timedelta(seconds=i),
+        )
+        for i in range(history)
+    ]
+    prepared = PreparedTurn(
+        turn=None,
+        reply=messages[-1].content,
+        handoff=Handoff(recommended=False),
+        since=messages[-3].id if since else None,
+    )
+    return prepared, persistence.SavedTurn(uuid4(), "sess_bench", False, messages)
+
+
+async def old_body(prepared: PreparedTurn, saved: persistence.SavedTurn) -> bytes:
+    response = ChatResponse(
+        session_id=saved.session_id,
+        reply=prepared.reply,
+        messages=[ChatMessage(role=m.role, content=m.content, timestamp=m.created_at) for m in saved.messages],
+        handoff=prepared.handoff,
+    )
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=response)
+    return JSONResponse(content).body
+
+
+async def new_body(prepared: PreparedTurn, saved: persistence.SavedTurn) -> bytes:
+    return to_json(_chat_payload(prepared, saved))
+
+
+async def measure(name: str, encode, prepared: PreparedTurn, saved: persistence.SavedTurn, turns: int) -> None:
+    size = len(await encode(prepared, saved))
+    start = time.perf_counter()
+    for _ in range(turns):
+        await encode(prepared, saved)
+    per_turn = (time.perf_counter() - start) / turns
+    print(f"  {name:28s} {size:6d} bytes  {per_turn * 1e6:7.1f}us/turn")
+
+
+async def run(args: argparse.Namespace) -> None:
+    full = make_turn(persistence.HISTORY_LIMIT, since=False)
+    delta = make_turn(persistence.HISTORY_LIMIT, since=True)
+    print(f"Turn with {persistence.HISTORY_LIMIT} messages of history, {args.turns} turns")
+    await measure("models + response_model", old_body, *full, args.turns)
+    await measure("plain data, full window", new_body, *full, args.turns)
+    await measure("plain data, since-cursor", new_body, *delta, args.turns)
+
+
+def main(args: argparse.Namespace) -> None:
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=5000)
+    main(parser.parse_args())
@@ -0,0 +1,81 @@
+"""Time to first byte: /api/v1/chat vs the SSE /api/v1/chat/stream.
+
+Starts the app under uvicorn on a local port (ASGITransport buffers whole
+responses, so it can't show streaming) and sends the same messages to
+both endpoints one at a time. For the stream it also reports when the
+final `saved` event arrives. Requires a reachable Postgres (DATABASE_URL).
+
+Usage (from backend/):
+    python -m benchmarks.chat_stream [--requests 200] [--port 8765]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from app import models
+from app.database import engine
+from app.main import app
+
+MESSAGES = ["Where is my order?", "How long does shipping take?", "I need a human", "hello"]
+
+
+def percentiles(samples: list) -> str:
+    ordered = sorted(samples)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    return f"p50 {statistics.median(ordered) * 1000:6.2f}ms  p95 {p95 * 1000:6.2f}ms"
+
+
+async def measure(base_url: str, requests: int) -> None:
+    plain, stream_first, stream_saved = [], [], []
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        for i in range(requests):
+            body = {"message": MESSAGES[i % len(MESSAGES)]}
+
+            start = time.perf_counter()
+            async with client.stream("POST", "/api/v1/chat", json=body) as response:
+                async for _ in response.aiter_raw():
+                    plain.append(time.perf_counter() - start)
+                    break
+
+            start = time.perf_counter()
+            async with client.stream("POST", "/api/v1/chat/stream", json=body) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("event: reply"):
+                        stream_first.append(time.perf_counter() - start)
+                    elif line.startswith("event: saved"):
+                        stream_saved.append(time.perf_counter() - start)
+                        break
+
+    print(f"{requests} sequential requests per endpoint")
+    print(f"  /api/v1/chat         first byte  {percentiles(plain)}")
+    print(f"  /api/v1/chat/stream  reply event {percentiles(stream_first)}")
+    print(f"  /api/v1/chat/stream  saved event {percentiles(stream_saved)}")
+
+
+def main(args: argparse.Namespace) -> None:
+    models.Base.metadata.create_all(bind=engine)
+    logging.getLogger("app").setLevel(logging.WARNING)
+    server = uvicorn.Server(uvicorn.Config(app, port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        asyncio.run(measure(f"http://127.0.0.1:{args.port}", args.requests))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    main(parser.parse_args())
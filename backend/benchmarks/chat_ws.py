@@ -0,0 +1,111 @@
+"""Connection scaling: the WebSocket channel vs per-message HTTP requests.
+
+Starts the app under uvicorn on a local port, then runs N concurrent
+sessions that each send K messages, first over /api/v1/chat (one HTTP
+request per message, session looked up every time) and then over one
+/api/v1/chat/ws connection per session. Reports turns/s and per-turn
+latency for each concurrency level. Requires a reachable Postgres
+(DATABASE_URL) and the `websockets` package.
+
+Usage (from backend/):
+    python -m benchmarks.chat_ws [--connections 10 100 500] [--turns 10] [--port 8766]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+
+import httpx
+import uvicorn
+import websockets
+
+from app import main as app_main, models
+from app.database import engine
+from benchmarks.chat_stream import MESSAGES, percentiles
+
+
+async def http_session(client: httpx.AsyncClient, turns: int, latencies: list, errors: list) -> None:
+    session_id = f"bench_{uuid.uuid4().hex}"
+    for i in range(turns):
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                "/api/v1/chat", json={"message": MESSAGES[i % len(MESSAGES)], "session_id": session_id}
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            errors.append(e)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def ws_session(url: str, turns: int, latencies: list, errors: list) -> None:
+    try:
+        async with websockets.connect(f"{url}?session_id=bench_{uuid.uuid4().hex}") as ws:
+            json.loads(await ws.recv())
+            for i in range(turns):
+                start = time.perf_counter()
+                await ws.send(json.dumps({"type": "message", "message": MESSAGES[i % len(MESSAGES)]}))
+                frame = json.loads(await ws.recv())
+                if frame["type"] != "reply":
+                    errors.append(frame)
+                    continue
+                latencies.append(time.perf_counter() - start)
+    except (OSError, websockets.WebSocketException) as e:
+        errors.append(e)
+
+
+def report(name: str, connections: int, latencies: list, errors: list, elapsed: float) -> None:
+    line = f"  {name:4s}  {connections:4d} sessions  {len(latencies) / elapsed:7.0f} turns/s"
+    if latencies:
+        line += f"  {percentiles(latencies)}"
+    if errors:
+        line += f"  ({len(errors)} failed)"
+    print(line)
+
+
+async def measure(port: int, connections: int, turns: int) -> None:
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        latencies: list = []
+        errors: list = []
+        start = time.perf_counter()
+        await asyncio.gather(*(http_session(client, turns, latencies, errors) for _ in range(connections)))
+        report("http", connections, latencies, errors, time.perf_counter() - start)
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    url = f"ws://127.0.0.1:{port}/api/v1/chat/ws"
+    await asyncio.gather(*(ws_session(url, turns, latencies, errors) for _ in range(connections)))
+    report("ws", connections, latencies, errors, time.perf_counter() - start)
+
+
+def main(args: argparse.Namespace) -> None:
+    models.Base.metadata.create_all(bind=engine)
+    logging.getLogger("app").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    app_main.WS_MAX_CONNECTIONS = max(app_main.WS_MAX_CONNECTIONS, max(args.connections))
+    server = uvicorn.Server(uvicorn.Config(app_main.app, port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        print(f"{args.turns} turns per session")
+        for connections in args.connections:
+            asyncio.run(measure(args.port, connections, args.turns))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8766)
+    main(parser.parse_args())
@@ -0,0 +1,123 @@
+"""Benchmark: transcript export throughput and memory.
+
+Generates synthetic conversations, messages and handoffs in a scratch
+schema (`bench_export`) and exports them with `app.export` in each output
+format, reporting message rows per second and the process's peak RSS
+after each run. The streaming exports run first; the last run loads the
+same rows as ORM objects into a list (what a naive export does) to show
+the memory the server-side cursor saves. Requires a reachable Postgres
+(DATABASE_URL); the scratch schema is dropped afterwards unless --keep
+is given.
+
+Usage (from backend/):
+    python -m benchmarks.export [--conversations 50000] [--messages-per-conversation 20] [--batch-size 2000]
+"""
+
+from pathlib import Path
+import argparse
+import asyncio
+import resource
+import tempfile
+import time
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import export, models
+from app.database import ASYNC_DATABASE_URL, Base, engine
+
+SCHEMA = "bench_export"
+
+
+def generate(conversations: int, per_conversation: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        Base.metadata.create_all(conn.execution_options(schema_translate_map={None: SCHEMA}))
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.conversations (id, session_id, channel, status, started_at, created_at, updated_at)
+            SELECT gen_random_uuid(), 'sess_' || i, 'web', 'open', t, t, t
+            FROM (
+                SELECT i, now() - random() * interval '90 days' AS t
+                FROM generate_series(1, :conversations) i
+            ) s
+        """), {"conversations": conversations})
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.messages (id, conversation_id, role, content, intent, created_at)
+            SELECT gen_random_uuid(), c.id,
+                   CASE WHEN m % 2 = 1 THEN 'user' ELSE 'assistant' END,
+                   repeat('x', 80),
+                   CASE WHEN m % 2 = 1 THEN 'faq' END,
+                   c.started_at + m * interval '20 seconds'
+            FROM {SCHEMA}.conversations c, generate_series(1, :per_conversation) m
+        """), {"per_conversation": per_conversation})
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.handoffs (id, conversation_id, recommended, status, created_at, updated_at)
+            SELECT gen_random_uuid(), id, true, 'pending', started_at, started_at
+            FROM {SCHEMA}.conversations WHERE random() < 0.05
+        """))
+        conn.execute(text(f"ANALYZE {SCHEMA}.conversations, {SCHEMA}.messages, {SCHEMA}.handoffs"))
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(batch_size: int) -> None:
+    # The scratch schema first on the search path, so app.export's queries read it
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}}
+    )
+    session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    runs = [("ndjson", "none"), ("ndjson", "gzip")]
+    try:
+        import pyarrow  # noqa: F401
+        runs += [("parquet", "snappy"), ("parquet", "zstd")]
+    except ImportError:
+        print("  (pyarrow not installed; skipping parquet)")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for format, compression in runs:
+                output = Path(tmp) / f"{format}-{compression}"
+                stats = await export.export_to_path(
+                    session_factory, output, format=format, compression=compression,
+                    checkpoint_every=5000, batch_size=batch_size,
+                )
+                size = output.stat().st_size if output.is_file() else sum(p.stat().st_size for p in output.iterdir())
+                print(
+                    f"  {format + '/' + compression:16s} {stats.messages / stats.seconds:10.0f} rows/s  "
+                    f"{stats.seconds:6.1f}s  {size / 2**20:8.1f} MB out  peak RSS {peak_rss_mb():7.0f} MB"
+                )
+
+        start = time.perf_counter()
+        async with session_factory() as db:
+            rows = (await db.execute(select(models.Message))).scalars().all()
+        seconds = time.perf_counter() - start
+        print(
+            f"  {'orm list':16s} {len(rows) / seconds:10.0f} rows/s  {seconds:6.1f}s  {'':8s}         "
+            f"peak RSS {peak_rss_mb():7.0f} MB  (messages only, nothing written)"
+        )
+    finally:
+        await async_engine.dispose()
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"Generating {args.conversations} conversations x {args.messages_per_conversation} messages...")
+    generate(args.conversations, args.messages_per_conversation)
+    try:
+        print(f"Export (batch size {args.batch_size}), peak RSS before: {peak_rss_mb():.0f} MB")
+        asyncio.run(run(args.batch_size))
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=50000)
+    parser.add_argument("--messages-per-conversation", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=export.BATCH_SIZE)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    main(parser.parse_args())
@@ -0,0 +1,82 @@
+"""Microbenchmark: per-message FAQ matching cost as the FAQ count grows.
+
+Usage (from backend/):
+    python -m benchmarks.faq_matching
+"""
+
+import random
+import time
+from typing import List
+
+from app.knowledge import FAQ, FAQS, FAQIndex
+
+FAQ_COUNTS = [6, 100, 1000, 5000, 10000]
+MESSAGES = [
+    "Where is my order?",
+    "How long does shipping take to Canada?",
+    "I forgot my password and can't sign in to my account",
+    "Can I pay with PayPal or a credit card?",
+    "I'd like to send back these shoes and get a refund please",
+    "hello",
+]
+
+
+def generate_faqs(count: int, seed: int = 42) -> List[FAQ]:
+    """Built-in FAQs padded with synthetic ones using distinct vocabulary."""
+    rng = random.Random(seed)
+    faqs = list(FAQS)
+    for i in range(count - len(faqs)):
+        keywords = [f"topic{i}", f"term{rng.randint(0, count)}", f"phrase {rng.randint(0, count)} words"]
+        faqs.append(FAQ(question=f"Synthetic question {i}?", answer=f"Synthetic answer {i}.", keywords=keywords))
+    return faqs
+
+
+def linear_find_best_faq(faqs: List[FAQ], message: str):
+    """The original per-FAQ, per-keyword substring scan."""
+    message_lower = message.lower()
+    best_match = None
+    best_score = 0.0
+    for faq in faqs:
+        score = 0
+        matched_keywords = 0
+        for keyword in faq.keywords:
+            if keyword in message_lower:
+                matched_keywords += 1
+                score += len(keyword.split())
+        if matched_keywords > 0:
+            normalized_score = score / len(faq.keywords)
+            if normalized_score > best_score:
+                best_score = normalized_score
+                best_match = faq
+    if best_match and best_score > 0.15:
+        return best_match, min(best_score * 100, 95)
+    return None
+
+
+def _per_message_us(fn, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in MESSAGES:
+            fn(message)
+    return (time.perf_counter() - start) / (rounds * len(MESSAGES)) * 1e6
+
+
+def main() -> None:
+    print(f"{'faqs':>6} {'linear us/msg':>14} {'index us/msg':>13} {'build ms':>9}")
+    for count in FAQ_COUNTS:
+        faqs = generate_faqs(count)
+        start = time.perf_counter()
+        index = FAQIndex(faqs)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        for message in MESSAGES:
+            assert index.best_match(message.lower()) == linear_find_best_faq(faqs, message)
+
+        rounds = max(1, 20000 // count)
+        linear = _per_message_us(lambda m: linear_find_best_faq(faqs, m), rounds)
+        indexed = _per_message_us(lambda m: index.best_match(m.lower()), 2000)
+        print(f"{count:>6} {linear:>14.1f} {indexed:>13.1f} {build_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark: keyword matcher vs BM25 retrieval, accuracy and latency.
+
+Accuracy is top-1 agreement with a small hand-labeled query set over the
+built-in FAQs (a label of None means no FAQ should be returned). Latency
+is measured per query and, for BM25, for whole batches scored in one call,
+on the built-in FAQs padded with synthetic ones.
+
+Usage (from backend/):
+    python -m benchmarks.faq_retrieval
+"""
+
+import time
+from typing import Callable, List, Optional, Tuple
+
+from app.knowledge import FAQS, FAQIndex
+from app.retrieval import BM25Retriever
+from benchmarks.faq_matching import generate_faqs
+
+TRACK, RETURNS, SHIPPING, PASSWORD, INTERNATIONAL, PAYMENT = (faq.question for faq in FAQS)
+
+# (query, expected FAQ question or None)
+LABELED_QUERIES: List[Tuple[str, Optional[str]]] = [
+    ("Where is my order?", TRACK),
+    ("how do i track my package", TRACK),
+    ("has my parcel been dispatched yet", TRACK),
+    ("my order hasn't shown up", TRACK),
+    ("What's the status of my delivery", TRACK),
+    ("What is your return policy?", RETURNS),
+    ("I want my money back", RETURNS),
+    ("can I send back these shoes", RETURNS),
+    ("how do refunds work", RETURNS),
+    ("the item arrived broken, can I exchange it", RETURNS),
+    ("How long does shipping take?", SHIPPING),
+    ("how many business days for standard shipping", SHIPPING),
+    ("is expedited shipping available", SHIPPING),
+    ("when will it arrive", SHIPPING),
+    ("I forgot my password", PASSWORD),
+    ("can't sign in to my account", PASSWORD),
+    ("the reset link never came to my email", PASSWORD),
+    ("how do I log in", PASSWORD),
+    ("Do you ship internationally?", INTERNATIONAL),
+    ("do you deliver to other countries", INTERNATIONAL),
+    ("can I order from overseas", INTERNATIONAL),
+    ("do you ship abroad", INTERNATIONAL),
+    ("What payment methods do you accept?", PAYMENT),
+    ("can I pay with paypal", PAYMENT),
+    ("do you take visa or mastercard", PAYMENT),
+    ("is apple pay supported", PAYMENT),
+    ("hello", None),
+    ("thanks, that's all", None),
+    ("what's the weather like", None),
+    ("tell me a joke", None),
+]
+FAQ_COUNTS = [6, 1000, 10000]
+BATCH_SIZE = 256
+
+
+def accuracy(match: Callable[[str], Optional[tuple]]) -> Tuple[float, List[str]]:
+    misses = []
+    for query, expected in LABELED_QUERIES:
+        result = match(query)
+        got = result[0].question if result else None
+        if got != expected:
+            misses.append(f"{query!r}: expected {expected!r}, got {got!r}")
+    return 1 - len(misses) / len(LABELED_QUERIES), misses
+
+
+def per_query_us(fn: Callable[[str], object], queries: List[str], rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - start) / (rounds * len(queries)) * 1e6
+
+
+def main() -> None:
+    keyword = FAQIndex(FAQS)
+    bm25 = BM25Retriever(FAQS)
+    print("accuracy on labeled queries (built-in FAQs)")
+    for name, match in [("keyword", lambda q: keyword.best_match(q.lower())), ("bm25", bm25.best_match)]:
+        score, misses = accuracy(match)
+        print(f"  {name:<8} {score:6.1%}")
+        for miss in misses:
+            print(f"      {miss}")
+
+    queries = [query for query, _ in LABELED_QUERIES]
+    batch = (queries * (BATCH_SIZE // len(queries) + 1))[:BATCH_SIZE]
+    print(f"\n{'faqs':>6} {'keyword us/q':>13} {'bm25 us/q':>10} {'bm25 batch us/q':>16} {'bm25 build ms':>14}")
+    for count in FAQ_COUNTS:
+        faqs = generate_faqs(count)
+        keyword = FAQIndex(faqs)
+        start = time.perf_counter()
+        bm25 = BM25Retriever(faqs)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        rounds = max(1, 20000 // count)
+        keyword_us = per_query_us(lambda q: keyword.best_match(q.lower()), queries, 200)
+        bm25_us = per_query_us(bm25.best_match, queries, rounds)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            bm25.score_batch(batch)
+        batch_us = (time.perf_counter() - start) / (rounds * len(batch)) * 1e6
+        print(f"{count:>6} {keyword_us:>13.1f} {bm25_us:>10.1f} {batch_us:>16.1f} {build_ms:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
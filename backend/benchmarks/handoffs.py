@@ -0,0 +1,93 @@
+"""Benchmark: handoff delivery throughput vs provider concurrency.
+
+Queues `--handoffs` pending handoffs in a scratch schema
+(`bench_handoffs`) and drains them with `app.handoffs.HandoffWorker` and a
+`FakeTicketProvider` that takes `--latency` seconds per ticket, once per
+concurrency level. Reports handoffs delivered per second and the mean
+time from a handoff being queued to its ticket being recorded. Requires a
+reachable Postgres (DATABASE_URL); the scratch schema is dropped
+afterwards.
+
+Usage (from backend/):
+    python -m benchmarks.handoffs [--handoffs 1000] [--latency 0.2] [--concurrency 1 10 50]
+"""
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import handoffs
+from app.database import ASYNC_DATABASE_URL, Base, engine
+from app.handoffs import FakeTicketProvider, HandoffWorker
+
+SCHEMA = "bench_handoffs"
+
+
+def generate(count: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        Base.metadata.create_all(conn.execution_options(schema_translate_map={None: SCHEMA}))
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.conversations (id, session_id, channel, status, started_at, created_at, updated_at)
+            SELECT gen_random_uuid(), 'sess_' || i, 'web', 'open', now(), now(), now()
+            FROM generate_series(1, :count) i
+        """), {"count": count})
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.messages (id, conversation_id, role, content, created_at)
+            SELECT gen_random_uuid(), id, 'user', 'I need a human', now() FROM {SCHEMA}.conversations
+        """))
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.handoffs (id, conversation_id, recommended, status, attempts, next_attempt_at, created_at, updated_at)
+            SELECT gen_random_uuid(), id, true, 'pending', 0, now(), now(), now() FROM {SCHEMA}.conversations
+        """))
+        conn.execute(text(f"ANALYZE {SCHEMA}.handoffs"))
+
+
+async def drain(count: int, latency: float, concurrency: int) -> None:
+    worker = HandoffWorker(
+        FakeTicketProvider(latency=latency),
+        batch_size=max(20, 2 * concurrency),
+        concurrency=concurrency,
+        engine=create_async_engine(
+            ASYNC_DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}}
+        ),
+    )
+    handoffs.HANDOFF_LATENCY.series.clear()
+    delivered = 0
+    start = time.perf_counter()
+    try:
+        while delivered < count:
+            delivered += (await worker.run_once())["created"]
+    finally:
+        await worker.engine.dispose()
+    elapsed = time.perf_counter() - start
+    # Queued at the start, so a handoff's latency is when it was delivered
+    series = handoffs.HANDOFF_LATENCY.labels()
+    print(
+        f"  concurrency {concurrency:4d}: {delivered / elapsed:7.1f} handoffs/s  "
+        f"mean latency {series.sum / series.count:6.1f}s  total {elapsed:6.1f}s"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"{args.handoffs} handoffs, provider latency {args.latency * 1000:.0f}ms")
+    try:
+        for concurrency in args.concurrency:
+            generate(args.handoffs)
+            asyncio.run(drain(args.handoffs, args.latency, concurrency))
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--handoffs", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    main(parser.parse_args())
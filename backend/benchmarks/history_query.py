@@ -0,0 +1,146 @@
+"""Benchmark: history query on a plain vs month-partitioned messages table.
+
+Generates a synthetic message history in a scratch schema (`bench_history`)
+with three copies of the data:
+
+- `messages_plain`: one heap with a single-column conversation_id index,
+  the layout from migration 001
+- `messages_composite`: the same heap with a composite
+  (conversation_id, created_at DESC) index instead, to separate the effect
+  of the index from that of partitioning
+- `messages_partitioned`: monthly range partitions with the composite
+  index, the layout from migration 002
+
+and compares the plan and latency of the query chat() runs on a history
+cache miss. Requires a reachable Postgres (DATABASE_URL); the scratch
+schema is dropped afterwards unless --keep is given.
+
+Usage (from backend/):
+    python -m benchmarks.history_query [--conversations 100000] [--messages-per-conversation 20]
+"""
+
+from datetime import datetime, timezone
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.partitions import add_months, partition_bounds
+
+SCHEMA = "bench_history"
+TABLES = ("messages_plain", "messages_composite", "messages_partitioned")
+HISTORY_QUERY = (
+    "SELECT role, content, created_at FROM {table} "
+    "WHERE conversation_id = :conversation_id ORDER BY created_at DESC LIMIT 10"
+)
+
+
+def generate(conn, conversations: int, per_conversation: int, months: int) -> None:
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    conn.execute(text(f"""
+        CREATE TABLE {SCHEMA}.messages_plain (
+            id UUID PRIMARY KEY,
+            conversation_id UUID NOT NULL,
+            role VARCHAR NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL
+        )
+    """))
+    # Rows arrive in time order, so a conversation's messages are spread
+    # across the heap the same way live traffic interleaves them
+    conn.execute(text(f"""
+        INSERT INTO {SCHEMA}.messages_plain
+        SELECT gen_random_uuid(), c.id,
+               CASE WHEN m % 2 = 0 THEN 'user' ELSE 'assistant' END,
+               repeat('x', 80),
+               c.started_at + m * interval '20 seconds'
+        FROM (
+            SELECT gen_random_uuid() AS id,
+                   now() - random() * (:months * interval '30 days') AS started_at
+            FROM generate_series(1, :conversations)
+        ) c, generate_series(1, :per_conversation) m
+        ORDER BY 5
+    """), {"conversations": conversations, "per_conversation": per_conversation, "months": months})
+    conn.execute(text(f"CREATE TABLE {SCHEMA}.messages_composite AS SELECT * FROM {SCHEMA}.messages_plain"))
+    conn.execute(text(f"CREATE INDEX ON {SCHEMA}.messages_plain (conversation_id)"))
+    conn.execute(text(
+        f"CREATE INDEX ON {SCHEMA}.messages_composite (conversation_id, created_at DESC)"
+    ))
+
+    conn.execute(text(f"""
+        CREATE TABLE {SCHEMA}.messages_partitioned (
+            id UUID NOT NULL,
+            conversation_id UUID NOT NULL,
+            role VARCHAR NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """))
+    first_month = add_months(datetime.now(timezone.utc).date().replace(day=1), -(months + 1))
+    for name, start, end in partition_bounds(first_month, months + 3):
+        conn.execute(text(
+            f"CREATE TABLE {SCHEMA}.{name} PARTITION OF {SCHEMA}.messages_partitioned "
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00+00') TO ('{end.isoformat()} 00:00+00')"
+        ))
+    conn.execute(text(f"INSERT INTO {SCHEMA}.messages_partitioned SELECT * FROM {SCHEMA}.messages_plain"))
+    conn.execute(text(
+        f"CREATE INDEX ON {SCHEMA}.messages_partitioned (conversation_id, created_at DESC)"
+    ))
+    for table in TABLES:
+        conn.execute(text(f"ANALYZE {SCHEMA}.{table}"))
+
+
+def measure(conn, table: str, conversation_ids: list) -> list:
+    query = text(HISTORY_QUERY.format(table=f"{SCHEMA}.{table}"))
+    timings = []
+    for conversation_id in conversation_ids:
+        start = time.perf_counter()
+        conn.execute(query, {"conversation_id": conversation_id}).all()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def explain(conn, table: str, conversation_id) -> str:
+    query = "EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) " + HISTORY_QUERY.format(table=f"{SCHEMA}.{table}")
+    return "\n".join(row[0] for row in conn.execute(text(query), {"conversation_id": conversation_id}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=100000)
+    parser.add_argument("--messages-per-conversation", type=int, default=20)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--keep", action="store_true", help="keep the generated schema")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        generate(conn, args.conversations, args.messages_per_conversation, args.months)
+    rows = args.conversations * args.messages_per_conversation
+    print(f"generated {rows:,} messages in {time.perf_counter() - start:.1f}s")
+
+    with engine.connect() as conn:
+        ids = [row[0] for row in conn.execute(text(
+            f"SELECT DISTINCT conversation_id FROM {SCHEMA}.messages_plain LIMIT 5000"
+        ))]
+        sample = random.Random(1).sample(ids, min(args.samples, len(ids)))
+        for table in TABLES:
+            measure(conn, table, sample[:50])  # warm the cache
+            timings = sorted(measure(conn, table, sample))
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(f"\n== {table}: p50 {statistics.median(timings):.3f}ms  p95 {p95:.3f}ms")
+            print(explain(conn, table, sample[0]))
+
+    if not args.keep:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
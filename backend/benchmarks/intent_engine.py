@@ -0,0 +1,61 @@
+"""Microbenchmark: single-pass analyze_message vs chained detect_intent + find_best_faq.
+
+Usage (from backend/):
+    python -m benchmarks.intent_engine
+"""
+
+import re
+import time
+
+from app.knowledge import FAQIndex, IntentEngine, INTENT_RULES, analyze_message
+from benchmarks.faq_matching import MESSAGES, generate_faqs, linear_find_best_faq
+
+ORDER_PATTERN = r'\b(ORD-\d+|#\d{5,}|\d{10,})\b'
+
+
+def chained_detect_intent(message: str):
+    """The original detect_intent: a regex search plus three keyword scans."""
+    message_lower = message.lower()
+    order_match = re.search(ORDER_PATTERN, message, re.IGNORECASE)
+    if order_match or any(kw in message_lower for kw in ["track", "where is my order", "order status"]):
+        return "order_tracking", order_match.group(0) if order_match else None
+    if any(kw in message_lower for kw in ["return", "refund", "send back", "exchange"]):
+        return "returns", None
+    if any(kw in message_lower for kw in ["agent", "human", "representative", "person", "speak to"]):
+        return "escalation", None
+    return "faq", None
+
+
+def _per_message_us(fn, rounds: int) -> float:
+    messages = MESSAGES + ["Where is ORD-12345? I need to speak to a human"]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+
+def main() -> None:
+    print(f"{'faqs':>6} {'chained us/msg':>15} {'engine us/msg':>14}")
+    for count in (6, 1000, 5000):
+        faqs = generate_faqs(count)
+        engine = IntentEngine(INTENT_RULES, FAQIndex(faqs))
+
+        def chained(message):
+            intent, _ = chained_detect_intent(message)
+            if intent != "escalation":
+                linear_find_best_faq(faqs, message)
+
+        def single_pass(message):
+            analysis = engine.analyze(message)
+            if analysis.intent != "escalation":
+                analysis.faq_match
+
+        rounds = max(1, 20000 // count)
+        print(f"{count:>6} {_per_message_us(chained, rounds):>15.1f} {_per_message_us(single_pass, 2000):>14.1f}")
+
+    print(f"\nbuilt-in knowledge base, analyze_message: {_per_message_us(analyze_message, 5000):.1f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark: knowledge base startup from file vs the binary snapshot cache.
+
+For growing FAQ counts, writes a synthetic knowledge file and compares
+parsing and indexing it with loading the cached snapshot. It then reloads
+the largest one through `KnowledgeReloader` while a 1ms ticker runs on the
+event loop, and reports the longest gap between ticks. That gap is the
+pause in-flight requests would see during a reload.
+
+Usage (from backend/):
+    python -m benchmarks.knowledge_snapshot
+"""
+
+from pathlib import Path
+import asyncio
+import json
+import tempfile
+import time
+
+from app.knowledge_loader import KnowledgeReloader, load_snapshot
+from benchmarks.faq_matching import generate_faqs
+
+FAQ_COUNTS = [100, 1000, 10000]
+
+
+def write_knowledge_file(path: Path, count: int) -> None:
+    faqs = [{"question": f.question, "answer": f.answer, "keywords": f.keywords} for f in generate_faqs(count)]
+    path.write_text(json.dumps({"faqs": faqs}))
+
+
+async def max_loop_stall_ms(reloader: KnowledgeReloader) -> float:
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stalls.append(now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await reloader.reload()
+    done.set()
+    await task
+    return max(stalls) * 1000
+
+
+def main() -> None:
+    print(f"{'faqs':>6} {'file kb':>8} {'parse+index ms':>15} {'cache load ms':>14} {'cache kb':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in FAQ_COUNTS:
+            path, cache_path = Path(tmp) / f"faqs{count}.json", Path(tmp) / f"faqs{count}.cache"
+            write_knowledge_file(path, count)
+            start = time.perf_counter()
+            load_snapshot(path, cache_path)
+            cold_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            _, from_cache = load_snapshot(path, cache_path)
+            warm_ms = (time.perf_counter() - start) * 1000
+            assert from_cache
+            print(
+                f"{count:>6} {path.stat().st_size / 1024:>8.0f} {cold_ms:>15.1f} "
+                f"{warm_ms:>14.1f} {cache_path.stat().st_size / 1024:>9.0f}"
+            )
+
+        reloader = KnowledgeReloader(path, None, interval=0)
+        stall = asyncio.run(max_loop_stall_ms(reloader))
+        print(f"\nreload of {FAQ_COUNTS[-1]} FAQs off the event loop: longest loop stall {stall:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""End-to-end load generator for /api/v1/chat with a realistic traffic mix.
+
+Each request is drawn from a weighted mix: FAQ questions, order tracking
+and returns (intent fallbacks, some with order numbers), and escalations.
+A share of requests start a new session; the rest continue one of the
+sessions opened so far, so both the new-conversation and returning paths
+(session cache, history) are exercised. `--concurrency` clients send
+requests back to back (closed loop) until `--requests` have completed,
+after a warmup that is not measured.
+
+Unless --url points at a running server, the app is started under uvicorn
+in a subprocess on --port, so client and server don't share a GIL. Needs
+a local Postgres at DATABASE_URL (e.g. `docker compose up postgres`).
+
+Usage (from backend/):
+    python -m benchmarks.load [--requests 2000] [--concurrency 20] [--new-sessions 0.3]
+    python -m benchmarks.load --url http://localhost:8000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+# (category, weight, messages)
+TRAFFIC_MIX: List[Tuple[str, float, List[str]]] = [
+    ("faq", 0.5, [
+        "How long does shipping take?",
+        "What is your return policy?",
+        "I forgot my password",
+        "Do you ship internationally?",
+        "What payment methods do you accept?",
+    ]),
+    ("order_tracking", 0.2, ["Where is my order?", "Where is ORD-{n}?", "Can you track order ORD-{n} for me"]),
+    ("returns", 0.15, ["I want to return my order", "Refund for ORD-{n} please"]),
+    ("escalation", 0.05, ["I need to speak to a human", "Let me talk to an agent"]),
+    ("other", 0.1, ["hello", "thanks!", "ok"]),
+]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """requests/s and p50/p95/p99/mean latency (ms) for one set of samples."""
+    if not latencies:
+        return {"requests": 0, "rps": 0.0}
+    ordered = sorted(latencies)
+
+    def pct(q: float) -> float:
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000
+
+    return {
+        "requests": len(ordered),
+        "rps": len(ordered) / elapsed,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+    }
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, new_session_ratio: float = 0.3, seed: int = 7):
+        self.base_url = base_url
+        self.new_session_ratio = new_session_ratio
+        self.rng = random.Random(seed)
+        self.sessions: List[str] = []
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors = 0
+        self._categories = [category for category, _, _ in TRAFFIC_MIX]
+        self._weights = [weight for _, weight, _ in TRAFFIC_MIX]
+        self._messages = {category: messages for category, _, messages in TRAFFIC_MIX}
+
+    def next_request(self) -> Tuple[List[str], Dict[str, str]]:
+        """(categories the request counts under, request body)."""
+        category = self.rng.choices(self._categories, self._weights)[0]
+        message = self.rng.choice(self._messages[category]).format(n=self.rng.randint(10000, 99999))
+        body = {"message": message}
+        if self.sessions and self.rng.random() >= self.new_session_ratio:
+            body["session_id"] = self.rng.choice(self.sessions)
+            return [category, "returning_session"], body
+        return [category, "new_session"], body
+
+    async def _client(self, client: httpx.AsyncClient, remaining: List[int], record: bool) -> None:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            categories, body = self.next_request()
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/v1/chat", json=body)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                self.errors += record
+                continue
+            latency = time.perf_counter() - start
+            if "session_id" not in body:
+                self.sessions.append(response.json()["session_id"])
+            if record:
+                for category in ["overall", *categories]:
+                    self.latencies.setdefault(category, []).append(latency)
+
+    async def run(self, requests: int, concurrency: int, warmup: int = 100) -> Dict[str, Dict[str, float]]:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=60) as client:
+            remaining = [warmup]
+            await asyncio.gather(*(self._client(client, remaining, False) for _ in range(concurrency)))
+            remaining = [requests]
+            start = time.perf_counter()
+            await asyncio.gather(*(self._client(client, remaining, True) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+        results = {category: summarize(samples, elapsed) for category, samples in self.latencies.items()}
+        results.setdefault("overall", summarize([], elapsed))["errors"] = self.errors
+        return results
+
+
+def start_server(port: int, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """Run the app under uvicorn in a subprocess and wait until it answers.
+
+    `env` adds to (or overrides) this process's environment.
+    """
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        # The benchmark database may be a fresh, unmigrated one
+        env={**os.environ, "DB_CREATE_SCHEMA": "true", **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None:
+            break
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"uvicorn did not start on port {port}; run it by hand to see why")
+
+
+def run(
+    requests: int = 2000,
+    concurrency: int = 20,
+    new_session_ratio: float = 0.3,
+    url: Optional[str] = None,
+    port: int = 8767,
+) -> Dict[str, Dict[str, float]]:
+    server = None if url else start_server(port)
+    try:
+        generator = LoadGenerator(url or f"http://127.0.0.1:{port}", new_session_ratio)
+        return asyncio.run(generator.run(requests, concurrency))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def print_results(results: Dict[str, Dict[str, float]]) -> None:
+    for category, stats in results.items():
+        if not stats["requests"]:
+            continue
+        print(
+            f"  {category:18s} {stats['requests']:6d} req  {stats['rps']:8.1f} req/s  "
+            f"p50 {stats['p50_ms']:7.2f}ms  p95 {stats['p95_ms']:7.2f}ms  p99 {stats['p99_ms']:7.2f}ms"
+        )
+    if results["overall"].get("errors"):
+        print(f"  {results['overall']['errors']} requests failed")
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"/api/v1/chat: {args.requests} requests, concurrency {args.concurrency}, "
+          f"{args.new_sessions:.0%} new sessions")
+    print_results(run(args.requests, args.concurrency, args.new_sessions, args.url, args.port))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--new-sessions", type=float, default=0.3, help="share of requests that start a session")
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8767)
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+"""Load test: database pool checkout wait under concurrency.
+
+Starts the app with different DB_POOL_SIZE / DB_MAX_OVERFLOW settings,
+drives /api/v1/chat at increasing concurrency with the load generator's
+traffic mix, and reads the pool metrics from /metrics: checkout wait
+(mean and p95, estimated from the histogram buckets), timeouts, and the
+request latency the clients saw. Needs a local Postgres at DATABASE_URL.
+
+Usage (from backend/):
+    python -m benchmarks.pool [--pools 2:0 5:10 20:10] [--concurrency 10 50 100] [--requests 1000]
+"""
+
+import argparse
+import asyncio
+import re
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks.load import LoadGenerator, start_server
+
+_SAMPLE = re.compile(r'^(chatbot_db_pool_\w+?)(?:\{le="([^"]+)"\})? (\S+)$')
+
+
+def pool_metrics(base_url: str) -> Tuple[Dict[str, float], List[Tuple[float, float]]]:
+    """(scalar pool metrics, cumulative wait buckets as (upper bound, count))."""
+    scalars: Dict[str, float] = {}
+    buckets: List[Tuple[float, float]] = []
+    for line in httpx.get(f"{base_url}/metrics").text.splitlines():
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        name, le, value = match.groups()
+        if le is not None:
+            buckets.append((float(le), float(value)))
+        else:
+            scalars[name] = float(value)
+    return scalars, buckets
+
+
+def bucket_quantile(q: float, before: List[Tuple[float, float]], after: List[Tuple[float, float]]) -> float:
+    """Upper bound of the bucket holding quantile `q` of the observations between two scrapes."""
+    counts = [(bound, count - previous) for (bound, count), (_, previous) in zip(after, before)]
+    total = counts[-1][1]
+    for bound, count in counts:
+        if total and count >= q * total:
+            return bound
+    return float("nan")
+
+
+def run_one(port: int, pool_size: int, max_overflow: int, concurrency: int, requests: int) -> None:
+    server = start_server(port, {"DB_POOL_SIZE": str(pool_size), "DB_MAX_OVERFLOW": str(max_overflow)})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        generator = LoadGenerator(base_url)
+        # Warm the pool up to its steady-state size before measuring
+        asyncio.run(generator.run(concurrency, concurrency, warmup=0))
+        generator = LoadGenerator(base_url)
+        before, before_buckets = pool_metrics(base_url)
+        results = asyncio.run(generator.run(requests, concurrency, warmup=0))
+        after, after_buckets = pool_metrics(base_url)
+    finally:
+        server.terminate()
+        server.wait()
+
+    checkouts = after["chatbot_db_pool_wait_seconds_count"] - before["chatbot_db_pool_wait_seconds_count"]
+    wait_sum = after["chatbot_db_pool_wait_seconds_sum"] - before["chatbot_db_pool_wait_seconds_sum"]
+    timeouts = after.get("chatbot_db_pool_timeouts_total", 0) - before.get("chatbot_db_pool_timeouts_total", 0)
+    overall = results["overall"]
+    p95_wait = bucket_quantile(0.95, before_buckets, after_buckets)
+    print(
+        f"  pool {pool_size:3d}+{max_overflow:<3d} clients {concurrency:4d}  "
+        f"wait mean {wait_sum / max(checkouts, 1) * 1000:7.2f}ms  p95 <= {p95_wait * 1000:7.1f}ms  "
+        f"timeouts {int(timeouts):3d}  |  {overall['rps']:6.1f} req/s  request p95 {overall.get('p95_ms', 0):7.1f}ms"
+        + (f"  ({overall['errors']} failed)" if overall.get("errors") else "")
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"/api/v1/chat, {args.requests} requests per run")
+    for pool in args.pools:
+        pool_size, max_overflow = (int(part) for part in pool.split(":"))
+        for concurrency in args.concurrency:
+            run_one(args.port, pool_size, max_overflow, concurrency, args.requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pools", nargs="+", default=["2:0", "5:10", "20:10"], help="pool_size:max_overflow")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8769)
+    main(parser.parse_args())
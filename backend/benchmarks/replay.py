@@ -0,0 +1,44 @@
+"""Benchmark: offline replay throughput vs worker processes.
+
+Replays synthetic user messages (the `benchmarks.faq_matching` messages
+with varied order numbers) through `app.replay` against a knowledge base
+of `--faqs` generated FAQs, once per worker count. Reports messages/sec
+and the speedup over one worker; with the scoring CPU-bound and chunks
+merged in the parent, it should scale close to linearly up to the number
+of cores.
+
+Usage (from backend/):
+    python -m benchmarks.replay [--messages 500000] [--faqs 1000] [--workers 1 2 4 8]
+"""
+
+import argparse
+import os
+
+from app import replay
+from app.knowledge import KnowledgeSnapshot
+from benchmarks.faq_matching import MESSAGES, generate_faqs
+
+
+def messages(count: int):
+    for i in range(count):
+        yield f"{MESSAGES[i % len(MESSAGES)]} ORD-{i}", None
+
+
+def main(args: argparse.Namespace) -> None:
+    snapshot = KnowledgeSnapshot(generate_faqs(args.faqs))
+    print(f"{args.messages} messages, {args.faqs} FAQs, {os.cpu_count()} CPUs")
+    baseline = None
+    for workers in args.workers:
+        report = replay.replay(messages(args.messages), snapshot, workers, args.chunk_size)
+        rate = report["messages_per_second"]
+        baseline = baseline or rate
+        print(f"  workers {workers:3d}: {rate:9d} msg/s  speedup {rate / baseline:4.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500000)
+    parser.add_argument("--faqs", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=replay.REPLAY_CHUNK_SIZE)
+    main(parser.parse_args())
@@ -0,0 +1,111 @@
+"""Benchmark: retention job throughput vs delete batch size.
+
+Generates conversations spread over the last year in a scratch schema
+(`bench_retention`), so most are idle and about three quarters are past
+the 90-day retention window, then runs `app.retention` once per delete
+batch size. Reports conversations archived and deleted per second and
+the p50/max duration of the delete transactions (how long row locks are
+held and how much WAL each commit ships to replicas at once). Requires
+a reachable Postgres (DATABASE_URL); the scratch schema is dropped
+afterwards.
+
+Usage (from backend/):
+    python -m benchmarks.retention [--conversations 20000] [--messages-per-conversation 20] [--batch-sizes 100 500 5000]
+"""
+
+from pathlib import Path
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.database import ASYNC_DATABASE_URL, Base, engine
+from app.retention import RetentionJob
+
+SCHEMA = "bench_retention"
+
+
+def generate(conversations: int, per_conversation: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        Base.metadata.create_all(conn.execution_options(schema_translate_map={None: SCHEMA}))
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.conversations (id, session_id, channel, status, started_at, created_at, updated_at)
+            SELECT gen_random_uuid(), 'sess_' || i, 'web', 'open', t, t, t
+            FROM (
+                SELECT i, now() - random() * interval '365 days' AS t
+                FROM generate_series(1, :conversations) i
+            ) s
+        """), {"conversations": conversations})
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.messages (id, conversation_id, role, content, created_at)
+            SELECT gen_random_uuid(), c.id,
+                   CASE WHEN m % 2 = 1 THEN 'user' ELSE 'assistant' END,
+                   repeat('x', 80),
+                   c.started_at + m * interval '20 seconds'
+            FROM {SCHEMA}.conversations c, generate_series(1, :per_conversation) m
+        """), {"per_conversation": per_conversation})
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.handoffs (id, conversation_id, recommended, status, created_at, updated_at)
+            SELECT gen_random_uuid(), id, true, 'pending', started_at, started_at
+            FROM {SCHEMA}.conversations WHERE random() < 0.05
+        """))
+        conn.execute(text(f"ANALYZE {SCHEMA}.conversations, {SCHEMA}.messages, {SCHEMA}.handoffs"))
+
+
+class TimedJob(RetentionJob):
+    """Records the duration of every delete transaction."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delete_seconds = []
+
+    async def _delete(self, *args, **kwargs) -> int:
+        start = time.perf_counter()
+        try:
+            return await super()._delete(*args, **kwargs)
+        finally:
+            self.delete_seconds.append(time.perf_counter() - start)
+
+
+async def run_job(batch_size: int, archive_dir: Path) -> None:
+    job = TimedJob(archive_dir, batch_size=batch_size, throttle=0, engine=create_async_engine(
+        ASYNC_DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}}
+    ))
+    try:
+        result = await job.run()
+    finally:
+        await job.engine.dispose()
+    size = sum(Path(path).stat().st_size for path in result["files"])
+    print(
+        f"  batch {batch_size:6d}: closed {result['closed']:6d}  deleted {result['deleted']:6d} "
+        f"in {result['seconds']:5.1f}s ({result['deleted'] / result['seconds']:6.0f} conv/s)  "
+        f"delete tx p50 {statistics.median(job.delete_seconds) * 1000:7.1f}ms "
+        f"max {max(job.delete_seconds) * 1000:7.1f}ms  archive {size / 2**20:.1f} MB"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"{args.conversations} conversations x {args.messages_per_conversation} messages over the last year")
+    try:
+        for batch_size in args.batch_sizes:
+            generate(args.conversations, args.messages_per_conversation)
+            with tempfile.TemporaryDirectory() as tmp:
+                asyncio.run(run_job(batch_size, Path(tmp)))
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=20000)
+    parser.add_argument("--messages-per-conversation", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 500, 5000])
+    main(parser.parse_args())
@@ -0,0 +1,136 @@
+"""Benchmark: report queries over `messages` vs the hourly rollups.
+
+Generates conversations with user messages (intents, FAQ hit flags) and
+handoffs spread over the last 30 days in a scratch schema
+(`bench_rollups`), builds the rollups with `app.rollups.backfill`, then
+times the intent-mix / handoff-rate / FAQ-hit-rate report for the last
+week as the ad-hoc GROUP BY over `messages` and `handoffs` the
+dashboards used to run, and as `app.rollups.report`. Requires a reachable
+Postgres (DATABASE_URL); the scratch schema is dropped afterwards.
+
+Usage (from backend/):
+    python -m benchmarks.rollups [--conversations 20000] [--messages-per-conversation 20] [--repeat 5]
+"""
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import rollups
+from app.database import ASYNC_DATABASE_URL, DATABASE_URL, Base, engine
+
+SCHEMA = "bench_rollups"
+
+# What the dashboards ran before the rollups
+ADHOC_INTENTS = text(f"""
+    SELECT date_trunc('hour', created_at) AS bucket, intent,
+           count(*) AS messages,
+           count(*) FILTER (WHERE extra_data->>'faq_hit' = 'true') AS faq_hits,
+           count(*) FILTER (WHERE extra_data->>'faq_hit' = 'false') AS faq_misses
+    FROM {SCHEMA}.messages
+    WHERE role = 'user' AND intent IS NOT NULL AND created_at >= :start AND created_at < :end
+    GROUP BY 1, 2
+""")
+ADHOC_HANDOFFS = text(f"""
+    SELECT date_trunc('hour', created_at) AS bucket, count(*) AS handoffs
+    FROM {SCHEMA}.handoffs
+    WHERE created_at >= :start AND created_at < :end
+    GROUP BY 1
+""")
+
+
+def generate(conversations: int, per_conversation: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        Base.metadata.create_all(conn.execution_options(schema_translate_map={None: SCHEMA}))
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.conversations (id, session_id, channel, locale, status, started_at, created_at, updated_at)
+            SELECT gen_random_uuid(), 'sess_' || i, 'web', (ARRAY['en', 'fr', 'de'])[1 + i % 3], 'open', t, t, t
+            FROM (
+                SELECT i, now() - random() * interval '30 days' AS t
+                FROM generate_series(1, :conversations) i
+            ) s
+        """), {"conversations": conversations})
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.messages (id, conversation_id, role, content, intent, extra_data, created_at)
+            SELECT gen_random_uuid(), c.id,
+                   CASE WHEN m % 2 = 1 THEN 'user' ELSE 'assistant' END,
+                   repeat('x', 80),
+                   CASE WHEN m % 2 = 1 THEN (ARRAY['general', 'order_status', 'returns', 'shipping'])[1 + m % 4] END,
+                   CASE WHEN m % 2 = 1 THEN jsonb_build_object('faq_hit', random() < 0.6) END,
+                   c.started_at + m * interval '20 seconds'
+            FROM {SCHEMA}.conversations c, generate_series(1, :per_conversation) m
+        """), {"per_conversation": per_conversation})
+        conn.execute(text(f"""
+            INSERT INTO {SCHEMA}.handoffs (id, conversation_id, recommended, status, created_at, updated_at)
+            SELECT gen_random_uuid(), id, true, 'pending', started_at + interval '21 seconds', started_at
+            FROM {SCHEMA}.conversations WHERE random() < 0.05
+        """))
+        conn.execute(text(f"ANALYZE {SCHEMA}.conversations, {SCHEMA}.messages, {SCHEMA}.handoffs"))
+
+
+def timed(run, repeat: int) -> float:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+def main(args: argparse.Namespace) -> None:
+    messages = args.conversations * args.messages_per_conversation
+    print(f"{args.conversations} conversations x {args.messages_per_conversation} messages over 30 days")
+    generate(args.conversations, args.messages_per_conversation)
+    scratch = create_engine(DATABASE_URL, poolclass=NullPool, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    end = datetime.now(timezone.utc) + timedelta(hours=1)
+    start = end - timedelta(days=7)
+    try:
+        with scratch.connect() as conn:
+            began = time.perf_counter()
+            # Nothing writes live deltas to the scratch schema: every hour is settled
+            rows = rollups.backfill(conn, end - timedelta(days=31), end, now=end + timedelta(hours=1))
+            seconds = time.perf_counter() - began
+        print(f"  backfill: {rows} rollup rows from {messages} messages in {seconds:.2f}s")
+
+        with engine.connect() as conn:
+            params = {"start": start, "end": end}
+            adhoc = timed(lambda: (conn.execute(ADHOC_INTENTS, params).all(),
+                                   conn.execute(ADHOC_HANDOFFS, params).all()), args.repeat)
+        print(f"  ad-hoc GROUP BY over messages (7 days): p50 {adhoc * 1000:8.1f}ms")
+
+        async def report() -> float:
+            async_engine = create_async_engine(
+                ASYNC_DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}}
+            )
+            try:
+                async with async_sessionmaker(async_engine)() as db:
+                    seconds = []
+                    for _ in range(args.repeat):
+                        began = time.perf_counter()
+                        await rollups.report(db, start, end)
+                        seconds.append(time.perf_counter() - began)
+                    return statistics.median(seconds)
+            finally:
+                await async_engine.dispose()
+
+        rollup = asyncio.run(report())
+        print(f"  rollup report (7 days):                 p50 {rollup * 1000:8.1f}ms  ({adhoc / rollup:.0f}x faster)")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=20000)
+    parser.add_argument("--messages-per-conversation", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,113 @@
+"""Run the micro and load benchmarks, save the results and compare to a baseline.
+
+Results are written as flat JSON, one number per metric:
+`micro.<function>[faqs=N,len=L].us_per_call`,
+`load.<category>.{rps,p50_ms,p95_ms,p99_ms}` and
+`startup.{import_ms,first_response_ms}[_no_db]`. With --baseline, each metric
+is compared to the saved value and the run exits with status 1 if any got
+worse by more than --tolerance (latencies up, requests/s down). Baselines
+only make sense on the machine that recorded them, so CI should record
+its own (e.g. on the main branch) and compare pull requests against it.
+
+Usage (from backend/):
+    python -m benchmarks.suite --output results.json [--save-baseline baseline.json]
+    python -m benchmarks.suite --baseline baseline.json [--tolerance 0.2] [--skip-load] [--skip-startup]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks import load, micro, startup
+
+# Metrics where a larger value is better; everything else is a latency
+HIGHER_IS_BETTER = ("rps",)
+# Load categories compared against the baseline; the rest are informational
+COMPARED_LOAD_CATEGORIES = ("overall", "new_session", "returning_session")
+
+
+def flatten(
+    micro_results: Dict[str, float],
+    load_results: Dict[str, Dict[str, float]],
+    startup_results: Optional[Dict[str, float]] = None,
+) -> Dict[str, float]:
+    flat = {f"micro.{key}.us_per_call": value for key, value in micro_results.items()}
+    flat.update({f"startup.{key}": value for key, value in (startup_results or {}).items()})
+    for category, stats in load_results.items():
+        for name in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            if name in stats:
+                flat[f"load.{category}.{name}"] = stats[name]
+    return flat
+
+
+def _compared(metric: str) -> bool:
+    return not metric.startswith("load.") or metric.split(".")[1] in COMPARED_LOAD_CATEGORIES
+
+
+def compare(
+    results: Dict[str, float], baseline: Dict[str, float], tolerance: float
+) -> List[Tuple[str, float, float, float]]:
+    """Regressions as (metric, baseline, current, relative change), worst first."""
+    regressions = []
+    for metric, current in results.items():
+        previous = baseline.get(metric)
+        if previous is None or previous <= 0 or not _compared(metric):
+            continue
+        change = (current - previous) / previous
+        worse = -change if metric.rsplit(".", 1)[-1] in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append((metric, previous, current, change))
+    return sorted(regressions, key=lambda regression: -abs(regression[3]))
+
+
+def main(args: argparse.Namespace) -> int:
+    micro_results: Dict[str, float] = {}
+    load_results: Dict[str, Dict[str, float]] = {}
+    startup_results: Dict[str, float] = {}
+    if not args.skip_micro:
+        print("Knowledge engine microbenchmarks")
+        micro_results = micro.run(args.faq_counts, args.rounds)
+        micro.print_results(micro_results)
+    if not args.skip_load:
+        print(f"/api/v1/chat load: {args.requests} requests, concurrency {args.concurrency}")
+        load_results = load.run(args.requests, args.concurrency, url=args.url)
+        load.print_results(load_results)
+    if not args.skip_startup:
+        print("Startup, median of 5 fresh processes")
+        startup_results = startup.run()
+        startup.print_results(startup_results)
+
+    results = flatten(micro_results, load_results, startup_results)
+    for path in filter(None, (args.output, args.save_baseline)):
+        Path(path).write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"Wrote {len(results)} metrics to {path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}:")
+            for metric, previous, current, change in regressions:
+                print(f"  {metric:60s} {previous:10.2f} -> {current:10.2f} ({change:+.0%})")
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--save-baseline", help="write results as the new baseline")
+    parser.add_argument("--baseline", help="compare against this baseline; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-startup", action="store_true")
+    parser.add_argument("--faq-counts", type=int, nargs="+", default=micro.FAQ_COUNTS)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--url", help="load-test a running server instead of starting one")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,35 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.database import ASYNC_DATABASE_URL, Base, engine
+
+
+@pytest.fixture
+def database():
+    """Create tables before the test and drop them after; yields the sync engine."""
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def async_engine(database):
+    """Async engine on the test database, usable from any number of asyncio.run() calls.
+
+    NullPool: no connection outlives the event loop that opened it.
+    """
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+    yield async_engine
+    asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture
+def session_factory(async_engine):
+    return async_sessionmaker(async_engine, expire_on_commit=False)
@@ -0,0 +1,18 @@
+from benchmarks.suite import compare, flatten
+
+
+def test_compare_flags_slower_latencies_and_lower_throughput() -> None:
+    baseline = flatten(
+        {"find_best_faq[faqs=6,len=short]": 10.0, "detect_intent[faqs=6,len=short]": 10.0},
+        {"overall": {"rps": 100.0, "p95_ms": 50.0}, "faq": {"rps": 50.0}},
+    )
+    results = flatten(
+        {"find_best_faq[faqs=6,len=short]": 14.0, "detect_intent[faqs=6,len=short]": 7.0},
+        {"overall": {"rps": 70.0, "p95_ms": 55.0}, "faq": {"rps": 10.0}},
+    )
+    regressions = compare(results, baseline, tolerance=0.2)
+    # Faster or within tolerance is fine; per-category load numbers are informational
+    assert [metric for metric, *_ in regressions] == [
+        "micro.find_best_faq[faqs=6,len=short].us_per_call",
+        "load.overall.rps",
+    ]
@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from app.cache import (
+    MISSING, CachedMessage, HistoryBackend, InMemoryHistoryBackend, LRUCache, RedisHistoryBackend, ReplyCache,
+    create_history_backend,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _messages(start: int, count: int, content: str = "hi"):
+    now = datetime.now(timezone.utc)
+    return [CachedMessage(str(i), "user", content, now) for i in range(start, start + count)]
+
+
+def test_history_keeps_last_messages_only() -> None:
+    cache = InMemoryHistoryBackend(max_messages=3)
+
+    async def run():
+        await cache.set("s1", _messages(0, 2))
+        await cache.append("s1", _messages(2, 3))
+        return await cache.get("s1")
+
+    assert [m.id for m in asyncio.run(run())] == ["2", "3", "4"]
+
+
+def test_history_append_ignores_unknown_session() -> None:
+    cache = InMemoryHistoryBackend(max_messages=3)
+
+    async def run():
+        await cache.append("missing", _messages(0, 1))
+        return await cache.get("missing")
+
+    assert asyncio.run(run()) is None
+    assert cache.stats()["misses"] == 1
+
+
+class RecordingPipeline:
+    """Stands in for a redis-py transaction pipeline; records queued commands."""
+
+    def __init__(self, executed):
+        self.executed = executed
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, command):
+        return lambda *args: self.commands.append((command, args[0]))
+
+    async def execute(self):
+        self.executed.append(self.commands)
+
+
+def test_redis_append_is_one_transaction_that_skips_missing_lists() -> None:
+    with pytest.raises(TypeError):
+        HistoryBackend()
+    backend = RedisHistoryBackend.__new__(RedisHistoryBackend)
+    backend.prefix, backend.max_messages, backend.ttl = "h:", 10, 60
+    executed = []
+    backend._redis = type("Client", (), {"pipeline": lambda self, transaction: RecordingPipeline(executed)})()
+
+    asyncio.run(backend.append("s1", _messages(0, 2)))
+    # No separate EXISTS round trip: RPUSHX is a no-op for a missing list
+    assert executed == [[("rpushx", "h:s1"), ("ltrim", "h:s1"), ("expire", "h:s1")]]
+
+
+def test_history_expires_after_ttl() -> None:
+    clock = FakeClock()
+    cache = InMemoryHistoryBackend(max_messages=3, ttl=10, clock=clock)
+    asyncio.run(cache.set("s1", _messages(0, 1)))
+    clock.now = 9
+    assert asyncio.run(cache.get("s1")) is not None
+    clock.now = 11
+    assert asyncio.run(cache.get("s1")) is None
+    assert cache.size_bytes == 0
+
+
+def test_history_evicts_least_recently_used_sessions() -> None:
+    cache = InMemoryHistoryBackend(max_messages=3, max_sessions=2)
+
+    async def run():
+        await cache.set("a", _messages(0, 1))
+        await cache.set("b", _messages(0, 1))
+        await cache.get("a")
+        await cache.set("c", _messages(0, 1))
+        return [await cache.get(s) is not None for s in ("a", "b", "c")]
+
+    assert asyncio.run(run()) == [True, False, True]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_history_respects_memory_cap() -> None:
+    cache = InMemoryHistoryBackend(max_messages=10, max_bytes=5000)
+
+    async def run():
+        for i in range(10):
+            await cache.set(f"s{i}", _messages(0, 2, content="x" * 1000))
+
+    asyncio.run(run())
+    assert cache.size_bytes <= 5000
+    assert cache.stats()["sessions"] == 2
+
+
+def test_in_memory_history_refused_with_several_workers(monkeypatch) -> None:
+    monkeypatch.delenv("HISTORY_CACHE_BACKEND", raising=False)
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    assert isinstance(create_history_backend(10), InMemoryHistoryBackend)
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert create_history_backend(10) is None
+
+
+def test_lru_cache_counts_hits_misses_and_evictions() -> None:
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 1, "evictions": 1}
+
+
+def test_lru_cache_entries_expire_after_ttl() -> None:
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=300, clock=clock)
+    cache.set("a", "id-1")
+    clock.now = 299
+    assert cache.get("a") == "id-1"
+    clock.now = 301
+    assert cache.get("a") is MISSING
+    assert len(cache) == 0
+
+
+def test_reply_cache_drops_entries_from_older_versions() -> None:
+    cache = ReplyCache(maxsize=10)
+    cache.set("where is my order", 0, "reply")
+    assert cache.get("where is my order", 0) == "reply"
+    assert cache.get("where is my order", 1) is MISSING
+    cache.set("where is my order", 1, "new reply")
+    assert cache.get("where is my order", 1) == "new reply"
+    stats = cache.stats()
+    assert (stats["size"], stats["invalidations"]) == (1, 1)
+    assert stats["hit_rate"] == 2 / 3
+
+
+def test_reply_cache_keeps_no_match_decisions_apart() -> None:
+    cache = ReplyCache(maxsize=1, negative_maxsize=2)
+    cache.set("return policy", 0, "answer")
+    for junk in ("asdf", "qwer", "zxcv"):
+        cache.set(junk, 0, "fallback", negative=True)
+    assert cache.get("return policy", 0) == "answer"
+    assert cache.get("zxcv", 0) == "fallback"
+    assert cache.get("asdf", 0) is MISSING
+    stats = cache.stats()
+    assert (stats["size"], stats["negative_size"], stats["hits"], stats["misses"]) == (1, 2, 2, 1)
+    # Negative entries belong to a knowledge base version too
+    assert cache.get("zxcv", 1) is MISSING
+    assert (cache.stats()["negative_size"], cache.stats()["invalidations"]) == (0, 1)
+    # Without a negative cache, no-match decisions aren't kept
+    cache = ReplyCache(maxsize=1)
+    cache.set("asdf", 0, "fallback", negative=True)
+    assert cache.get("asdf", 0) is MISSING
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import database, persistence
+from app.database import (
+    ASYNC_DATABASE_URL,
+    POOL_TIMEOUTS,
+    POOL_WAIT,
+    REPLICA_READS,
+    Base,
+    TimedNullPool,
+    async_engine_options,
+    get_engine,
+    read_router,
+)
+
+
+def test_pool_records_wait_time_and_timeouts() -> None:
+    async def test():
+        engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            **{**async_engine_options(pgbouncer=False), "pool_size": 1, "max_overflow": 0, "pool_timeout": 0.1},
+        )
+        database._track_in_use(engine.pool)
+        waits, timeouts = POOL_WAIT.labels().count, POOL_TIMEOUTS.value()
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                assert database._connections_in_use == 1
+                # The only connection is taken, so this one waits and gives up
+                with pytest.raises(exc.TimeoutError):
+                    async with engine.connect():
+                        pass
+            assert database._connections_in_use == 0
+        finally:
+            await engine.dispose()
+        assert POOL_WAIT.labels().count == waits + 2
+        assert POOL_TIMEOUTS.value() == timeouts + 1
+
+    asyncio.run(test())
+
+
+def test_pgbouncer_mode_disables_prepared_statement_caching() -> None:
+    options = async_engine_options(pgbouncer=True)
+    assert options["poolclass"] is TimedNullPool
+    assert options["connect_args"]["statement_cache_size"] == 0
+    assert options["connect_args"]["prepared_statement_cache_size"] == 0
+
+    async def test():
+        engine = create_async_engine(ASYNC_DATABASE_URL, **options)
+        try:
+            for _ in range(3):
+                async with engine.connect() as conn:
+                    assert (await conn.execute(text("SELECT CAST(:x AS integer)"), {"x": 1})).scalar_one() == 1
+        finally:
+            await engine.dispose()
+
+    asyncio.run(test())
+
+
+def test_history_reads_use_replica_except_after_own_writes(monkeypatch) -> None:
+    # Stand-in replica: an empty copy of the schema that never catches up,
+    # so any read served from it is visibly stale
+    replica_schema = "replica_standin"
+    with get_engine().begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {replica_schema}"))
+        Base.metadata.create_all(conn.execution_options(schema_translate_map={None: replica_schema}))
+    Base.metadata.create_all(bind=get_engine())
+    monkeypatch.setattr(database, "ASYNC_DATABASE_REPLICA_URL", ASYNC_DATABASE_URL)
+    monkeypatch.setattr(database, "_replica_session_factory", None)
+    monkeypatch.setattr(persistence, "history_cache", None)
+
+    async def test():
+        primary = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+        replica = create_async_engine(
+            ASYNC_DATABASE_URL,
+            poolclass=NullPool,
+            connect_args={"server_settings": {"search_path": replica_schema}},
+        )
+        monkeypatch.setattr(database, "_replica_async_engine", replica)
+        session_factory = async_sessionmaker(primary, expire_on_commit=False)
+
+        async def turn(content):
+            async with session_factory() as db:
+                saved = await persistence.save_turn(
+                    db, "sess_replica", None,
+                    [{"role": "user", "content": content}, {"role": "assistant", "content": "ok"}],
+                )
+            return [message.content for message in saved.messages]
+
+        try:
+            await turn("first")
+            # Just written: served from the primary, so the first turn is there
+            primary_reads = REPLICA_READS.value("primary")
+            assert await turn("second") == ["first", "ok", "second", "ok"]
+            assert REPLICA_READS.value("primary") == primary_reads + 1
+
+            # Once the guard window has passed, history comes from the (stale) replica
+            read_router._recent_writes.clear()
+            replica_reads = REPLICA_READS.value("replica")
+            assert await turn("third") == ["third", "ok"]
+            assert REPLICA_READS.value("replica") == replica_reads + 1
+        finally:
+            await primary.dispose()
+            await replica.dispose()
+
+    try:
+        asyncio.run(test())
+    finally:
+        persistence.session_cache.clear()
+        read_router._recent_writes.clear()
+        Base.metadata.drop_all(bind=get_engine())
+        with get_engine().begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {replica_schema} CASCADE"))
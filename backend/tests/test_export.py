@@ -0,0 +1,129 @@
+import asyncio
+import gzip
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from sqlalchemy import insert
+
+from app import export, models
+from app.database import engine
+from app.export import ExportFilters
+
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+def _seed(count=6):
+    """`count` conversations a day apart, alternating intents; every third has a pending handoff."""
+    conversations, messages, handoffs = [], [], []
+    for i in range(count):
+        conversation_id = uuid4()
+        started_at = START + timedelta(days=i)
+        conversations.append({
+            "id": conversation_id, "session_id": f"sess_{i}", "channel": "web" if i % 2 else "email",
+            "status": "open", "started_at": started_at, "created_at": started_at, "updated_at": started_at,
+        })
+        for j, (role, intent) in enumerate([("user", "returns" if i % 2 else "faq"), ("assistant", None)]):
+            messages.append({
+                "id": uuid4(), "conversation_id": conversation_id, "role": role, "content": f"{i}-{j}",
+                "intent": intent, "created_at": started_at + timedelta(seconds=j),
+            })
+        if i % 3 == 0:
+            handoffs.append({
+                "id": uuid4(), "conversation_id": conversation_id, "recommended": True, "status": "pending",
+                "created_at": started_at, "updated_at": started_at,
+            })
+    with engine.begin() as conn:
+        conn.execute(insert(models.Conversation), conversations)
+        conn.execute(insert(models.Message), messages)
+        conn.execute(insert(models.Handoff), handoffs)
+
+
+def _export(session_factory, filters=ExportFilters(), after=None, batch_size=3):
+    async def export_all():
+        async with session_factory() as db:
+            return [record async for record in export.iter_transcripts(db, filters, after, batch_size)]
+
+    return asyncio.run(export_all())
+
+
+def test_transcripts_stream_grouped_and_filtered(session_factory) -> None:
+    _seed()
+    # A batch size smaller than a conversation's rows splits them across fetches
+    records = _export(session_factory)
+    assert [record["session_id"] for record in records] == [f"sess_{i}" for i in range(6)]
+    assert [m["content"] for m in records[0]["messages"]] == ["0-0", "0-1"]
+    assert [h["status"] for h in records[0]["handoffs"]] == ["pending"]
+    assert records[1]["handoffs"] == []
+
+    assert [r["session_id"] for r in _export(session_factory, ExportFilters(intent="returns"))] == ["sess_1", "sess_3", "sess_5"]
+    assert [r["session_id"] for r in _export(session_factory, ExportFilters(handoff_status="pending"))] == ["sess_0", "sess_3"]
+    assert len(_export(session_factory, ExportFilters(handoff_status="none"))) == 4
+    assert [r["session_id"] for r in _export(session_factory, ExportFilters(channel="email"))] == ["sess_0", "sess_2", "sess_4"]
+    window = ExportFilters(started_from=START + timedelta(days=1), started_to=START + timedelta(days=3))
+    assert [r["session_id"] for r in _export(session_factory, window)] == ["sess_1", "sess_2"]
+
+    after = export.parse_cursor(records[3]["cursor"])
+    assert [r["session_id"] for r in _export(session_factory, after=after)] == ["sess_4", "sess_5"]
+
+
+def test_interrupted_export_resumes_from_checkpoint(monkeypatch, tmp_path, session_factory) -> None:
+    _seed()
+    output = tmp_path / "transcripts.ndjson.gz"
+    iter_transcripts = export.iter_transcripts
+
+    async def interrupted(*args, **kwargs):
+        count = 0
+        async for record in iter_transcripts(*args, **kwargs):
+            if count == 4:
+                raise ConnectionError("connection lost")
+            count += 1
+            yield record
+
+    monkeypatch.setattr(export, "iter_transcripts", interrupted)
+    with pytest.raises(ConnectionError):
+        asyncio.run(export.export_to_path(session_factory, output, compression="gzip", checkpoint_every=3))
+    checkpoint = json.loads((tmp_path / "transcripts.ndjson.gz.checkpoint").read_text())
+    assert checkpoint["conversations"] == 3
+    # Bytes past the checkpoint (e.g. a half-written gzip member) must be discarded
+    with open(output, "ab") as f:
+        f.write(b"\x1f\x8bgarbage")
+
+    monkeypatch.setattr(export, "iter_transcripts", iter_transcripts)
+    stats = asyncio.run(export.export_to_path(session_factory, output, compression="gzip", checkpoint_every=3))
+    assert stats.resumed and (stats.conversations, stats.messages) == (6, 12)
+    assert not (tmp_path / "transcripts.ndjson.gz.checkpoint").exists()
+    with gzip.open(output, "rt") as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["session_id"] for line in lines] == [f"sess_{i}" for i in range(6)]
+
+    # A checkpoint from different settings is refused rather than silently mixed in
+    (tmp_path / "other.checkpoint").write_text(json.dumps({"settings": {"format": "ndjson"}}))
+    with pytest.raises(ValueError):
+        asyncio.run(export.export_to_path(session_factory, output, checkpoint_path=tmp_path / "other.checkpoint"))
+
+
+def test_parquet_export_writes_one_row_per_message(tmp_path, session_factory) -> None:
+    pq = pytest.importorskip("pyarrow.parquet")
+    _seed()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Conversation), [{
+            "id": uuid4(), "session_id": "sess_empty", "channel": "web", "status": "open",
+            "started_at": START + timedelta(days=10), "created_at": START, "updated_at": START,
+        }])
+    output = tmp_path / "transcripts"
+    stats = asyncio.run(export.export_to_path(
+        session_factory, output, format="parquet", compression="zstd", checkpoint_every=4
+    ))
+    assert (stats.conversations, stats.messages) == (7, 12)
+    assert sorted(path.name for path in output.iterdir()) == ["part-00000.parquet", "part-00001.parquet"]
+    table = pq.read_table(output)
+    assert table.num_rows == 13
+    rows = table.to_pylist()
+    assert rows[-1]["session_id"] == "sess_empty" and rows[-1]["message_id"] is None
+    assert json.loads(rows[0]["handoffs"])[0]["status"] == "pending"
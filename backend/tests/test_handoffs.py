@@ -0,0 +1,134 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from sqlalchemy import insert, select
+
+from app import handoffs, models
+from app.database import engine
+from app.handoffs import FakeTicketProvider, HandoffWorker, TicketError
+
+
+def _handoff(session_id, status="pending", **columns):
+    """Insert a conversation with two messages and a handoff; returns the handoff id."""
+    conversation_id, handoff_id = uuid4(), uuid4()
+    now = datetime.now(timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Conversation), [{
+            "id": conversation_id, "session_id": session_id, "channel": "web", "status": "open",
+            "started_at": now, "created_at": now, "updated_at": now,
+        }])
+        conn.execute(insert(models.Message), [
+            {"id": uuid4(), "conversation_id": conversation_id, "role": role, "content": content,
+             "created_at": now + timedelta(seconds=i)}
+            for i, (role, content) in enumerate([("user", "I need a human"), ("assistant", "Connecting you")])
+        ])
+        conn.execute(insert(models.Handoff), [{
+            "id": handoff_id, "conversation_id": conversation_id, "recommended": True,
+            "reason": "User requested human assistance", "status": status, **columns,
+        }])
+    return handoff_id
+
+
+def _handoffs():
+    with engine.connect() as conn:
+        rows = conn.execute(select(models.Handoff))
+        return {row.id: row for row in rows}
+
+
+def _run(*workers, rounds=1):
+    """Run each worker's batches concurrently, `rounds` times; returns their results."""
+    async def runner():
+        return [await asyncio.gather(*(worker.run_once() for worker in workers)) for _ in range(rounds)]
+
+    return asyncio.run(runner())
+
+
+def test_worker_creates_tickets_for_pending_handoffs(async_engine) -> None:
+    ids = [_handoff(f"sess_{i}") for i in range(3)]
+    delivered = _handoff("sess_done", status="created", provider="fake", ticket_id="FAKE-0")
+    created = handoffs.HANDOFF_DELIVERIES.value("created")
+    provider = FakeTicketProvider()
+
+    [[result]] = _run(HandoffWorker(provider, engine=async_engine))
+    assert result == {"claimed": 3, "created": 3, "retry": 0, "failed": 0}
+    assert handoffs.HANDOFF_DELIVERIES.value("created") == created + 3
+    assert handoffs.HANDOFF_QUEUE_DEPTH.function() == 0
+
+    rows = _handoffs()
+    assert {rows[i].status for i in ids} == {"created"}
+    assert {rows[i].ticket_id for i in ids} == {"FAKE-1", "FAKE-2", "FAKE-3"}
+    assert {(rows[i].provider, rows[i].attempts) for i in ids} == {("fake", 1)}
+    assert rows[delivered].attempts == 0
+    request = provider.requests[0]
+    assert request.session_id.startswith("sess_") and request.attempt == 1
+    assert request.transcript == [("user", "I need a human"), ("assistant", "Connecting you")]
+
+    [[result]] = _run(HandoffWorker(provider, engine=async_engine))
+    assert result["claimed"] == 0
+
+
+def test_failed_deliveries_retry_then_fail(async_engine) -> None:
+    handoff_id = _handoff("sess_retry")
+    worker = HandoffWorker(FakeTicketProvider(fail_times=1), backoff=0, engine=async_engine)
+    [[first], [second]] = _run(worker, rounds=2)
+    assert (first["retry"], second["created"]) == (1, 1)
+    row = _handoffs()[handoff_id]
+    assert (row.status, row.attempts, row.ticket_id) == ("created", 2, "FAKE-1")
+
+    # Timeouts count as failures; the last attempt fails the handoff
+    timed_out = _handoff("sess_timeout")
+    [[result]] = _run(HandoffWorker(FakeTicketProvider(latency=1), timeout=0.05, max_attempts=1, engine=async_engine))
+    assert result["failed"] == 1
+    row = _handoffs()[timed_out]
+    assert (row.status, row.last_error) == ("failed", "Timed out after 0.05s")
+
+    class RejectingProvider(FakeTicketProvider):
+        async def create_ticket(self, request):
+            raise TicketError("Invalid requester", retryable=False)
+
+    rejected = _handoff("sess_rejected")
+    [[result]] = _run(HandoffWorker(RejectingProvider(), engine=async_engine))
+    assert result["failed"] == 1
+    assert (_handoffs()[rejected].status, _handoffs()[rejected].attempts) == ("failed", 1)
+
+
+def test_concurrent_workers_deliver_each_handoff_once(async_engine) -> None:
+    ids = {_handoff(f"sess_{i}") for i in range(10)}
+    provider = FakeTicketProvider(latency=0.02)
+    workers = [HandoffWorker(provider, batch_size=3, concurrency=2, engine=async_engine) for _ in range(3)]
+    _run(*workers, rounds=2)
+    assert sorted(request.handoff_id for request in provider.requests) == sorted(ids)
+    assert {row.status for row in _handoffs().values()} == {"created"}
+
+
+def test_expired_claim_is_delivered_again(async_engine) -> None:
+    # Claimed by a worker that died: still 'processing', claim expired
+    stale = _handoff(
+        "sess_stale", status="processing", attempts=1,
+        next_attempt_at=datetime.now(timezone.utc) - timedelta(seconds=1),
+    )
+    busy = _handoff(
+        "sess_busy", status="processing", attempts=1,
+        next_attempt_at=datetime.now(timezone.utc) + timedelta(minutes=1),
+    )
+    provider = FakeTicketProvider()
+    _run(HandoffWorker(provider, engine=async_engine))
+    assert [(request.handoff_id, request.attempt) for request in provider.requests] == [(stale, 2)]
+    assert _handoffs()[busy].status == "processing"
+
+
+def test_load_provider() -> None:
+    assert handoffs.load_provider("") is None
+    assert isinstance(handoffs.load_provider("fake"), FakeTicketProvider)
+    assert isinstance(handoffs.load_provider("app.handoffs:FakeTicketProvider"), FakeTicketProvider)
+    with pytest.raises(ValueError):
+        handoffs.load_provider("zendesk")
+    # Providers must implement create_ticket
+    with pytest.raises(TypeError):
+        handoffs.TicketProvider()
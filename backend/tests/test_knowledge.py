@@ -0,0 +1,138 @@
+import random
+import re
+
+from app.knowledge import (
+    FAQ, FAQS, FAQIndex, analyze_message, detect_intent, find_best_faq, normalize_message,
+)
+from app.matching import KeywordAutomaton
+
+
+def _linear_find_best_faq(faqs, message):
+    """Reference implementation: scan every keyword of every FAQ."""
+    message_lower = message.lower()
+    best_match = None
+    best_score = 0.0
+    for faq in faqs:
+        score = 0
+        matched_keywords = 0
+        for keyword in faq.keywords:
+            if keyword in message_lower:
+                matched_keywords += 1
+                score += len(keyword.split())
+        if matched_keywords > 0:
+            normalized_score = score / len(faq.keywords)
+            if normalized_score > best_score:
+                best_score = normalized_score
+                best_match = faq
+    if best_match and best_score > 0.15:
+        return best_match, min(best_score * 100, 95)
+    return None
+
+
+def _chained_detect_intent(message):
+    """Reference implementation: regex search followed by keyword scans."""
+    message_lower = message.lower()
+    order_match = re.search(r'\b(ORD-\d+|#\d{5,}|\d{10,})\b', message, re.IGNORECASE)
+    if order_match or any(kw in message_lower for kw in ["track", "where is my order", "order status"]):
+        return "order_tracking", order_match.group(0) if order_match else None
+    if any(kw in message_lower for kw in ["return", "refund", "send back", "exchange"]):
+        return "returns", None
+    if any(kw in message_lower for kw in ["agent", "human", "representative", "person", "speak to"]):
+        return "escalation", None
+    return "faq", None
+
+
+INTENT_MESSAGES = [
+    "Where is my order?",
+    "Where is my order ord-12345? I want to return it",
+    "My order #123456 hasn't arrived",
+    "Tracking number 1234567890 please",
+    "I want a refund, let me speak to a person",
+    "Can I exchange these shoes?",
+    "I need a human",
+    "How long does shipping take?",
+    "hello",
+]
+
+
+def test_detect_intent_keeps_rule_priority() -> None:
+    assert detect_intent("I want to return my order ORD-555, get me an agent") == ("order_tracking", "ORD-555")
+    assert detect_intent("refund please, I need a human") == ("returns", None)
+    assert detect_intent("let me speak to someone") == ("escalation", None)
+    assert detect_intent("what payment methods do you accept") == ("faq", None)
+
+
+def test_analysis_agrees_with_chained_scans() -> None:
+    for message in INTENT_MESSAGES:
+        analysis = analyze_message(message)
+        assert (analysis.intent, analysis.extracted_value) == _chained_detect_intent(message)
+        assert analysis.faq_match == find_best_faq(message)
+
+
+def test_automaton_finds_overlapping_substrings() -> None:
+    automaton = KeywordAutomaton(["he", "she", "his", "hers", "ship", ""])
+    found = automaton.search("ushers shipping")
+    assert {automaton.keywords[i] for i in found} == {"he", "she", "hers", "ship"}
+
+
+def test_find_best_faq_matches_shipping_question() -> None:
+    match = find_best_faq("How long does shipping take?")
+    assert match is not None
+    faq, confidence = match
+    assert faq.question == "How long does shipping take?"
+    assert 0 < confidence <= 95
+
+
+def test_find_best_faq_returns_none_without_keywords() -> None:
+    assert find_best_faq("hello there") is None
+
+
+def test_index_agrees_with_linear_scan_on_builtin_faqs() -> None:
+    messages = [
+        "Where is my order?",
+        "I want a refund and to send back this item",
+        "Can I pay with PayPal?",
+        "forgot my password, can't sign in",
+        "Do you ship overseas to my country?",
+        "when will my package arrive",
+        "hello",
+    ]
+    index = FAQIndex(FAQS)
+    for message in messages:
+        assert index.best_match(message.lower()) == _linear_find_best_faq(FAQS, message)
+
+
+def test_index_agrees_with_linear_scan_on_generated_faqs() -> None:
+    rng = random.Random(7)
+    vocabulary = ["ship", "shipping", "pay", "paypal", "order", "track", "how long",
+                  "gift card", "card", "return", "re", "a", "login", "log in"]
+    faqs = [
+        FAQ(
+            question=f"Question {i}",
+            answer=f"Answer {i}",
+            keywords=rng.sample(vocabulary, rng.randint(1, 5)) + rng.choice([[], ["order"]]),
+        )
+        for i in range(200)
+    ]
+    index = FAQIndex(faqs)
+    for _ in range(300):
+        message = " ".join(rng.choice(vocabulary + ["the", "my", "please"]) for _ in range(rng.randint(1, 8)))
+        assert index.best_match(message.lower()) == _linear_find_best_faq(faqs, message)
+
+
+def test_normalize_message_folds_text_and_masks_order_numbers() -> None:
+    assert normalize_message("  Where IS\tmy  order?!  ") == ("where is my order?!", {})
+    first = normalize_message("Where is ORD-12345, please?")
+    second = normalize_message("where is  ord-999, please?")
+    assert first[0] == second[0]
+    assert first[1] == {"order_tracking": "ORD-12345"}
+    assert second[1] == {"order_tracking": "ord-999"}
+
+
+def test_analysis_of_normalized_text_matches_raw_message() -> None:
+    for message in INTENT_MESSAGES:
+        normalized, entities = normalize_message(message)
+        analysis = analyze_message(normalized, folded=True)
+        expected = analyze_message(message)
+        assert (analysis.intent, entities.get(analysis.intent)) == (expected.intent, expected.extracted_value)
+        assert analysis.faq_match == expected.faq_match
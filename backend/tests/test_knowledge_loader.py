@@ -0,0 +1,104 @@
+import asyncio
+import json
+import sys
+
+import pytest
+
+from app import knowledge
+from app.knowledge import FAQS
+from app.knowledge_loader import KnowledgeFileError, KnowledgeReloader, load_snapshot, parse_faqs
+
+
+@pytest.fixture(autouse=True)
+def restore_knowledge_base():
+    yield
+    knowledge.set_faqs(FAQS)
+
+
+def _write_faqs(path, faqs):
+    path.write_text(json.dumps({"faqs": faqs}))
+
+
+GIFT_CARDS = {"question": "Gift cards?", "answer": "Yes, we sell gift cards.", "keywords": ["Gift Card"]}
+
+
+def test_parse_faqs_accepts_json_and_yaml() -> None:
+    from_json = parse_faqs(json.dumps([GIFT_CARDS]).encode(), ".json")
+    from_yaml = parse_faqs(b"faqs:\n  - question: Gift cards?\n    answer: Yes.\n    keywords: [Gift Card]\n", ".yaml")
+    assert from_json[0].keywords == from_yaml[0].keywords == ["gift card"]
+
+
+def test_parse_faqs_rejects_malformed_entries() -> None:
+    with pytest.raises(KnowledgeFileError):
+        parse_faqs(b'[{"question": "No answer"}]', ".json")
+    with pytest.raises(KnowledgeFileError):
+        parse_faqs(b"{not json", ".json")
+
+
+def test_parse_faqs_rejects_yaml_without_pyyaml(monkeypatch) -> None:
+    # A None entry makes `import yaml` raise ImportError
+    monkeypatch.setitem(sys.modules, "yaml", None)
+    with pytest.raises(KnowledgeFileError, match="PyYAML"):
+        parse_faqs(b"faqs: []\n", ".yaml")
+
+
+def test_snapshot_cache_reused_until_file_changes(tmp_path) -> None:
+    path, cache_path = tmp_path / "faqs.json", tmp_path / "faqs.json.cache"
+    _write_faqs(path, [GIFT_CARDS])
+    first, from_cache = load_snapshot(path, cache_path)
+    assert not from_cache and cache_path.exists()
+    second, from_cache = load_snapshot(path, cache_path)
+    assert from_cache
+    assert second.find_best_faq("do you have gift cards")[0].answer == "Yes, we sell gift cards."
+
+    _write_faqs(path, [dict(GIFT_CARDS, answer="Not any more.")])
+    third, from_cache = load_snapshot(path, cache_path)
+    assert not from_cache
+    assert third.faqs[0].answer == "Not any more."
+
+
+def test_snapshot_cache_invalidated_by_engine_changes(tmp_path, monkeypatch) -> None:
+    path, cache_path = tmp_path / "faqs.json", tmp_path / "faqs.json.cache"
+    _write_faqs(path, [GIFT_CARDS])
+    load_snapshot(path, cache_path)
+
+    rules = knowledge.INTENT_RULES + [knowledge.IntentRule("gift_cards", ["gift card"], priority=40)]
+    monkeypatch.setattr(knowledge, "INTENT_RULES", rules)
+    snapshot, from_cache = load_snapshot(path, cache_path)
+    assert not from_cache
+    assert snapshot.analyze("gift card balance").intent == "gift_cards"
+
+    # Retriever parameters count only for the retriever in use
+    monkeypatch.setattr(knowledge, "FAQ_RETRIEVER", "keyword")
+    fingerprint = knowledge.engine_fingerprint()
+    monkeypatch.setattr(knowledge, "BM25_PARAMS", dict(knowledge.BM25_PARAMS, min_confidence=50.0))
+    assert knowledge.engine_fingerprint() == fingerprint
+    monkeypatch.setattr(knowledge, "FAQ_RETRIEVER", "bm25")
+    fingerprint = knowledge.engine_fingerprint()
+    monkeypatch.setattr(knowledge, "BM25_PARAMS", dict(knowledge.BM25_PARAMS, min_confidence=25.0))
+    assert knowledge.engine_fingerprint() != fingerprint
+
+
+def test_reloader_swaps_snapshot_when_file_changes(tmp_path) -> None:
+    path = tmp_path / "faqs.json"
+    _write_faqs(path, [GIFT_CARDS])
+    reloader = KnowledgeReloader(path, tmp_path / "faqs.cache", interval=0.01)
+
+    async def run():
+        result = await reloader.reload()
+        assert knowledge.find_best_faq("gift card balance")[0].question == "Gift cards?"
+        reloader.start()
+        _write_faqs(path, [dict(GIFT_CARDS, answer="Gift cards are sold out."), {"question": "Q", "answer": "A"}])
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if knowledge.faqs_version() > result["version"]:
+                break
+        # A broken file leaves the current snapshot in place
+        path.write_text("{broken")
+        await asyncio.sleep(0.05)
+        await reloader.stop()
+
+    asyncio.run(run())
+    assert knowledge.find_best_faq("gift card balance")[0].answer == "Gift cards are sold out."
+    assert len(knowledge.FAQS) == 2
+    assert reloader.failures == 1
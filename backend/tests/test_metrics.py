@@ -0,0 +1,51 @@
+import time
+
+from app import metrics
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    histogram = metrics.Histogram("test_latency_seconds", "Test histogram.", ["stage"], buckets=[0.01, 0.1])
+    try:
+        for value in (0.005, 0.05, 0.05, 3.0):
+            histogram.observe(value, "parse")
+        lines = histogram.render()
+    finally:
+        metrics.REGISTRY.remove(histogram)
+
+    assert lines[:2] == ["# HELP test_latency_seconds Test histogram.", "# TYPE test_latency_seconds histogram"]
+    assert 'test_latency_seconds_bucket{stage="parse",le="0.01"} 1' in lines
+    assert 'test_latency_seconds_bucket{stage="parse",le="0.1"} 3' in lines
+    assert 'test_latency_seconds_bucket{stage="parse",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{stage="parse"} 4' in lines
+
+
+def test_stage_records_histogram_and_request_timings() -> None:
+    series = metrics.STAGE_DURATION.labels("test_stage")
+    before = series.count
+    with metrics.collect_timings() as timings:
+        with metrics.stage("test_stage"):
+            time.sleep(0.002)
+    with metrics.stage("test_stage"):
+        pass
+    assert series.count == before + 2
+    assert timings["test_stage"] >= 0.002
+    assert metrics.server_timing(timings).startswith("test_stage;dur=")
+
+
+def test_stage_overhead_is_a_few_microseconds() -> None:
+    iterations = 20000
+
+    def per_iteration(timed: bool) -> float:
+        start = time.perf_counter()
+        if timed:
+            for _ in range(iterations):
+                with metrics.stage("overhead"):
+                    pass
+        else:
+            for _ in range(iterations):
+                pass
+        return (time.perf_counter() - start) / iterations
+
+    with metrics.collect_timings():
+        overhead = min(per_iteration(True) - per_iteration(False) for _ in range(5))
+    assert overhead < 5e-6
@@ -0,0 +1,18 @@
+from datetime import date
+
+from app.partitions import add_months, partition_bounds, partition_name
+
+
+def test_add_months_wraps_years() -> None:
+    assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+
+def test_partition_bounds_cover_consecutive_months() -> None:
+    bounds = partition_bounds(date(2026, 12, 18), 3)
+    assert bounds == [
+        ("messages_y2026m12", date(2026, 12, 1), date(2027, 1, 1)),
+        ("messages_y2027m01", date(2027, 1, 1), date(2027, 2, 1)),
+        ("messages_y2027m02", date(2027, 2, 1), date(2027, 3, 1)),
+    ]
+    assert partition_name(date(2027, 3, 1)) == "messages_y2027m03"
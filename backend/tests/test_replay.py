@@ -0,0 +1,108 @@
+import gzip
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from sqlalchemy import insert
+
+from app import models, replay
+from app.database import Base, engine
+from app.knowledge import FAQ, KnowledgeSnapshot
+
+MESSAGES = [
+    ("Where is my order ORD-12345?", "order_tracking"),
+    ("I want to return this", "returns"),
+    ("I need a human", "escalation"),
+    # Recorded before a rule change: now escalates
+    ("Can I talk to an agent please", "faq"),
+    ("What is your return policy?", None),
+    ("Tell me something unusual", None),
+]
+
+
+@pytest.fixture
+def messages_file(tmp_path):
+    path = tmp_path / "messages.jsonl.gz"
+    with gzip.open(path, "wt") as f:
+        for content, intent in MESSAGES[:3]:
+            f.write(json.dumps({"message": content, "intent": intent}) + "\n")
+        # A transcript as written by app.export
+        f.write(json.dumps({"id": "c1", "messages": [
+            {"role": "user", "content": content, "intent": intent} for content, intent in MESSAGES[3:]
+        ] + [{"role": "assistant", "content": "Sure", "intent": None}]}) + "\n")
+    return path
+
+
+def test_replay_reports_distributions_and_intent_changes(messages_file) -> None:
+    assert list(replay.iter_jsonl_messages(messages_file)) == MESSAGES
+    report = replay.replay(replay.iter_jsonl_messages(messages_file), chunk_size=2)
+
+    assert report["messages"] == 6
+    assert report["intents"]["escalation"] == 2
+    assert report["intents"]["order_tracking"] == 1
+    # Escalations skip FAQ matching
+    assert sum(report["faqs"].values()) == 4
+    assert report["faqs"][replay.NO_FAQ] == 1
+    assert report["faq_hit_rate"] == 0.75
+    assert report["intent_diff"] == {
+        "compared": 4, "changed": 1, "changed_rate": 0.25,
+        "changes": [{"recorded": "faq", "replayed": "escalation", "count": 1,
+                     "examples": ["Can I talk to an agent please"]}],
+    }
+
+
+def test_parallel_replay_matches_serial(messages_file) -> None:
+    messages = list(replay.iter_jsonl_messages(messages_file)) * 50
+    serial = replay.replay(messages, chunk_size=7)
+    parallel = replay.replay(messages, workers=2, chunk_size=7)
+    for report in (serial, parallel):
+        report.pop("seconds"), report.pop("messages_per_second")
+    assert parallel == serial
+    assert len(parallel["intent_diff"]["changes"][0]["examples"]) == replay.EXAMPLES_PER_CHANGE
+
+
+def test_replay_candidate_knowledge_from_database() -> None:
+    Base.metadata.create_all(bind=engine)
+    try:
+        conversation_id = uuid4()
+        now = datetime.now(timezone.utc)
+        with engine.begin() as conn:
+            conn.execute(insert(models.Conversation), [{
+                "id": conversation_id, "session_id": "sess_replay", "channel": "web", "status": "open",
+                "started_at": now, "created_at": now, "updated_at": now,
+            }])
+            conn.execute(insert(models.Message), [
+                {"id": uuid4(), "conversation_id": conversation_id, "role": role, "content": content,
+                 "intent": intent, "created_at": now}
+                for role, content, intent in [
+                    ("user", "Do you sell gift cards?", "faq"),
+                    ("assistant", "I'd be happy to help!", None),
+                    ("user", "I need a human", "escalation"),
+                ]
+            ])
+        candidate = KnowledgeSnapshot([FAQ("Gift cards?", "Yes, in any amount.", ["gift card"])])
+        with engine.connect() as conn:
+            report = replay.replay(replay.iter_database_messages(conn), candidate)
+        assert report["messages"] == 2
+        assert report["faqs"] == {"Gift cards?": 1}
+        assert report["intent_diff"]["changed"] == 0
+    finally:
+        Base.metadata.drop_all(bind=engine)
+
+
+def test_cli_defaults_to_the_servers_knowledge_file(messages_file, tmp_path, monkeypatch, capsys) -> None:
+    faqs_path = tmp_path / "faqs.json"
+    faqs_path.write_text(json.dumps([{"question": "Returns?", "answer": "Within 30 days.", "keywords": ["return"]}]))
+    monkeypatch.setenv("KNOWLEDGE_FILE", str(faqs_path))
+    output = tmp_path / "report.json"
+    monkeypatch.setattr(sys, "argv", ["replay", "--jsonl", str(messages_file), "--workers", "1", "--output", str(output)])
+    replay.main()
+    assert "6 messages" in capsys.readouterr().out
+    assert json.loads(output.read_text())["faqs"] == {"Returns?": 2, replay.NO_FAQ: 2}
+    # Compiled afresh: the server's cache is neither read nor written
+    assert not (tmp_path / "faqs.json.cache").exists()
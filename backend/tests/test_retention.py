@@ -0,0 +1,121 @@
+import asyncio
+import gzip
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import func, insert, select, text
+
+from app import models, retention
+from app.database import engine
+from app.retention import RETENTION_CONVERSATIONS, RetentionJob
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def _conversation(session_id, started_at, message_ages, status="open", ended_at=None, handoff=False, rating=None):
+    """Insert a conversation with one message per age (time before NOW)."""
+    conversation_id = uuid4()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Conversation), [{
+            "id": conversation_id, "session_id": session_id, "channel": "web", "status": status,
+            "started_at": started_at, "ended_at": ended_at, "created_at": started_at, "updated_at": started_at,
+        }])
+        conn.execute(insert(models.Message), [
+            {"id": uuid4(), "conversation_id": conversation_id, "role": "user", "content": f"{session_id} {i}",
+             "created_at": NOW - age}
+            for i, age in enumerate(message_ages)
+        ])
+        if handoff:
+            conn.execute(insert(models.Handoff), [{
+                "id": uuid4(), "conversation_id": conversation_id, "recommended": True, "status": "pending",
+                "created_at": started_at, "updated_at": started_at,
+            }])
+        if rating is not None:
+            conn.execute(insert(models.Feedback), [{
+                "id": uuid4(), "conversation_id": conversation_id, "rating": rating, "created_at": started_at,
+            }])
+    return conversation_id
+
+
+def _seed():
+    days, minutes = timedelta(days=1), timedelta(minutes=1)
+    # Active: last message a minute ago
+    _conversation("active", NOW - 10 * minutes, [10 * minutes, minutes])
+    # Idle for an hour: closed, kept
+    _conversation("idle", NOW - 2 * 60 * minutes, [2 * 60 * minutes, 60 * minutes])
+    # Idle for 100 days: closed and archived in the same run
+    _conversation("stale", NOW - 120 * days, [120 * days, 100 * days], handoff=True, rating=4)
+    # Closed 95 days ago: archived
+    for i in range(3):
+        _conversation(f"old_{i}", NOW - 96 * days, [96 * days, 95 * days], status="closed", ended_at=NOW - 95 * days)
+    # Closed long ago but written to since: reopened, not archived
+    _conversation("returned", NOW - 200 * days, [200 * days, 2 * minutes], status="closed", ended_at=NOW - 199 * days)
+
+
+def _run(job, **kwargs):
+    return asyncio.run(job.run(now=NOW, **kwargs))
+
+
+def _conversations():
+    with engine.connect() as conn:
+        rows = conn.execute(select(models.Conversation.session_id, models.Conversation.status,
+                                   models.Conversation.ended_at))
+        return {session_id: (status, ended_at) for session_id, status, ended_at in rows}
+
+
+def test_dry_run_reports_without_writing(tmp_path, async_engine) -> None:
+    _seed()
+    before = _conversations()
+    result = _run(RetentionJob(tmp_path / "archive", throttle=0, engine=async_engine), dry_run=True)
+    assert (result["reopened"], result["closed"], result["archived"], result["messages"]) == (1, 2, 4, 8)
+    assert _conversations() == before
+    assert not (tmp_path / "archive").exists()
+
+
+def test_run_closes_idle_and_archives_then_deletes_expired(tmp_path, async_engine) -> None:
+    _seed()
+    archived = RETENTION_CONVERSATIONS.value("archived")
+    # Small batches and chunks exercise the batch loops and multiple files
+    job = RetentionJob(tmp_path / "archive", batch_size=2, archive_chunk=3, throttle=0, engine=async_engine)
+    result = _run(job)
+    assert (result["reopened"], result["closed"], result["archived"], result["deleted"]) == (1, 2, 4, 4)
+    assert len(result["files"]) == 2
+    assert RETENTION_CONVERSATIONS.value("archived") == archived + 4
+
+    conversations = _conversations()
+    assert set(conversations) == {"active", "idle", "returned"}
+    assert conversations["active"] == ("open", None)
+    assert conversations["idle"] == ("closed", NOW - timedelta(minutes=60))
+    assert conversations["returned"] == ("open", None)
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(models.Message)) == 6
+        assert conn.scalar(select(func.count()).select_from(models.Handoff)) == 0
+        assert conn.scalar(select(func.count()).select_from(models.Feedback)) == 0
+
+    records = []
+    for path in result["files"]:
+        with gzip.open(path, "rt") as f:
+            records.extend(json.loads(line) for line in f)
+    assert sorted(record["session_id"] for record in records) == ["old_0", "old_1", "old_2", "stale"]
+    stale = next(record for record in records if record["session_id"] == "stale")
+    assert [m["content"] for m in stale["messages"]] == ["stale 0", "stale 1"]
+    assert stale["handoffs"][0]["status"] == "pending" and stale["feedback"]["rating"] == 4
+    assert not list((tmp_path / "archive").glob("*.tmp"))
+
+    # Nothing left to do the second time
+    result = _run(job)
+    assert (result["closed"], result["archived"], result["deleted"]) == (0, 0, 0)
+
+
+def test_concurrent_run_is_skipped(tmp_path, async_engine) -> None:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": retention.ADVISORY_LOCK_KEY})
+        try:
+            assert _run(RetentionJob(tmp_path, throttle=0, engine=async_engine)) is None
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": retention.ADVISORY_LOCK_KEY})
@@ -0,0 +1,143 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from sqlalchemy import insert, select
+
+from app import models, rollups
+from app.database import engine
+from app.rollups import RollupAggregator
+
+HOUR = datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+
+
+pytestmark = pytest.mark.usefixtures("database")
+
+
+def _rollups():
+    with engine.connect() as conn:
+        rows = conn.execute(select(models.HourlyRollup).order_by(
+            models.HourlyRollup.bucket_start, models.HourlyRollup.intent
+        ))
+        return [
+            (row.bucket_start, row.channel, row.locale, row.intent,
+             row.messages, row.faq_hits, row.faq_misses, row.handoffs)
+            for row in rows
+        ]
+
+
+def _turn(intent, at, faq_hit=None):
+    extra_data = {"faq_hit": faq_hit} if faq_hit is not None else None
+    return [
+        {"role": "user", "intent": intent, "extra_data": extra_data, "created_at": at},
+        {"role": "assistant", "intent": None, "extra_data": None, "created_at": at},
+    ]
+
+
+def test_aggregator_flushes_additive_deltas(session_factory) -> None:
+    async def test():
+        aggregator = RollupAggregator(session_factory, clock=lambda: HOUR + timedelta(hours=1))
+        aggregator.record(_turn("general", HOUR + timedelta(minutes=5), faq_hit=True), 0, "en")
+        aggregator.record(_turn("general", HOUR + timedelta(minutes=50), faq_hit=False), 0, "en")
+        aggregator.record(_turn("escalation", HOUR + timedelta(minutes=7)), 1, None)
+        aggregator.record(_turn("general", HOUR + timedelta(hours=1)), 0, "en")
+        assert await aggregator.flush() == 3
+        assert aggregator.pending == 0
+        # A second flush for the same keys adds to the stored counts
+        aggregator.record(_turn("general", HOUR, faq_hit=True), 0, "en")
+        assert await aggregator.flush() == 1
+
+    asyncio.run(test())
+    assert _rollups() == [
+        (HOUR, "web", "", "escalation", 1, 0, 0, 1),
+        (HOUR, "web", "en", "general", 3, 2, 1, 0),
+        (HOUR + timedelta(hours=1), "web", "en", "general", 1, 0, 0, 0),
+    ]
+
+
+def test_failed_flush_keeps_deltas() -> None:
+    def broken_session():
+        raise ConnectionError("database down")
+
+    aggregator = RollupAggregator(broken_session)
+    aggregator.record(_turn("general", HOUR, faq_hit=True), 0, "en")
+    with pytest.raises(ConnectionError):
+        asyncio.run(aggregator.flush())
+    aggregator.record(_turn("general", HOUR, faq_hit=True), 0, "en")
+    assert aggregator.pending == 1
+    assert aggregator.failures == 1
+    assert list(aggregator._pending.values()) == [[2, 2, 0, 0]]
+
+
+def test_backfill_rebuilds_rollups_from_history() -> None:
+    conversation_id = uuid4()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Conversation), [{
+            "id": conversation_id, "session_id": "sess_backfill", "channel": "web", "locale": "fr",
+            "status": "open", "started_at": HOUR, "created_at": HOUR, "updated_at": HOUR,
+        }])
+        messages = []
+        for minute, intent, extra_data in [
+            (1, "general", {"faq_hit": True}),
+            (2, "general", {"faq_hit": False}),
+            # Saved before FAQ hits were recorded: neither hit nor miss
+            (3, "general", None),
+            (70, "escalation", None),
+        ]:
+            at = HOUR + timedelta(minutes=minute)
+            messages += [
+                {"id": uuid4(), "conversation_id": conversation_id, "role": "user", "content": "q",
+                 "intent": intent, "extra_data": extra_data, "created_at": at},
+                {"id": uuid4(), "conversation_id": conversation_id, "role": "assistant", "content": "a",
+                 "intent": None, "extra_data": None, "created_at": at},
+            ]
+        conn.execute(insert(models.Message), messages)
+        conn.execute(insert(models.Handoff), [{
+            "id": uuid4(), "conversation_id": conversation_id, "recommended": True, "status": "pending",
+            "created_at": HOUR + timedelta(minutes=70, milliseconds=5), "updated_at": HOUR,
+        }])
+
+    expected = [
+        (HOUR, "web", "fr", "general", 3, 1, 1, 0),
+        (HOUR + timedelta(hours=1), "web", "fr", "escalation", 1, 0, 0, 1),
+    ]
+    with engine.connect() as conn:
+        # Windows smaller than the range exercise the per-window transactions
+        assert rollups.backfill(conn, HOUR, HOUR + timedelta(hours=3), window=timedelta(hours=1)) == 2
+    assert _rollups() == expected
+    with engine.connect() as conn:
+        rollups.backfill(conn, HOUR, HOUR + timedelta(hours=3))
+    assert _rollups() == expected
+
+
+def test_backfill_and_flush_split_hours_at_settle_time(session_factory) -> None:
+    conversation_id = uuid4()
+    at = HOUR + timedelta(minutes=1)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Conversation), [{
+            "id": conversation_id, "session_id": "sess_settle", "channel": "web", "status": "open",
+            "started_at": at, "created_at": at, "updated_at": at,
+        }])
+        conn.execute(insert(models.Message), [{
+            "id": uuid4(), "conversation_id": conversation_id, "role": "user", "content": "q",
+            "intent": "general", "created_at": at,
+        }])
+
+    # A minute after the hour ends its deltas may still be in flight
+    with engine.connect() as conn:
+        assert rollups.backfill(conn, HOUR, HOUR + timedelta(hours=2), now=HOUR + timedelta(hours=1, minutes=1)) == 0
+        assert rollups.backfill(conn, HOUR, HOUR + timedelta(hours=2), now=HOUR + timedelta(hours=2)) == 1
+
+    async def flush_late_delta():
+        aggregator = RollupAggregator(session_factory, clock=lambda: HOUR + timedelta(hours=2))
+        aggregator.record(_turn("general", at), 0, None)
+        return await aggregator.flush(), aggregator.dropped
+
+    # The backfill already counted it: the settled hour's delta is dropped
+    assert asyncio.run(flush_late_delta()) == (0, 1)
+    assert _rollups() == [(HOUR, "web", "", "general", 1, 0, 0, 0)]
@@ -0,0 +1,160 @@
+import asyncio
+import sys
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from sqlalchemy import func, select
+
+from app import models, persistence, rollups
+from app.models import utcnow
+from app.rollups import RollupAggregator
+from app.writebehind import PendingTurn, WriteBehindFull, WriteBehindQueue
+
+
+async def _new_conversation(session_factory):
+    async with session_factory() as db:
+        conversation_id, _ = await persistence.upsert_conversation(db, f"sess_{uuid4().hex}", None)
+        await db.commit()
+    return conversation_id
+
+
+def _message(conversation_id, content):
+    return {
+        "id": uuid4(),
+        "conversation_id": conversation_id,
+        "role": "user",
+        "content": content,
+        "intent": None,
+        "extra_data": None,
+        "created_at": utcnow(),
+    }
+
+
+async def _count_messages(session_factory, conversation_id):
+    async with session_factory() as db:
+        return (await db.execute(
+            select(func.count()).select_from(models.Message).filter_by(conversation_id=conversation_id)
+        )).scalar_one()
+
+
+def test_queued_turns_are_batched_and_flushed_on_stop(session_factory) -> None:
+    async def test():
+        conversation_id = await _new_conversation(session_factory)
+        queue = WriteBehindQueue(session_factory, flush_interval=0.2)
+        queue.start()
+        for i in range(20):
+            await queue.enqueue(PendingTurn(conversation_id, [_message(conversation_id, f"m{i}")], []))
+        assert len(queue.pending_messages(conversation_id)) == 20
+
+        await queue.stop()
+
+        assert await _count_messages(session_factory, conversation_id) == 20
+        assert queue.pending_messages(conversation_id) == []
+        assert queue.stats()["flushed"] == 20
+        # All turns enqueued within one flush interval share a transaction
+        assert queue.stats()["flushes"] == 1
+
+    asyncio.run(test())
+
+
+def test_full_queue_raises_after_enqueue_timeout(session_factory) -> None:
+    async def test():
+        conversation_id = await _new_conversation(session_factory)
+        queue = WriteBehindQueue(session_factory, max_queue=1, enqueue_timeout=0.05)
+        # Flusher not running, so nothing drains the queue
+        queue._queue = asyncio.Queue(maxsize=1)
+        await queue.enqueue(PendingTurn(conversation_id, [_message(conversation_id, "first")], []))
+        with pytest.raises(WriteBehindFull):
+            await queue.enqueue(PendingTurn(conversation_id, [_message(conversation_id, "second")], []))
+        assert [row["content"] for row in queue.pending_messages(conversation_id)] == ["first"]
+
+    asyncio.run(test())
+
+
+def test_save_turn_defers_messages_in_write_behind_mode(monkeypatch, session_factory) -> None:
+    async def test():
+        queue = WriteBehindQueue(session_factory, flush_interval=0.2)
+        monkeypatch.setattr(persistence, "write_behind", queue)
+        queue.start()
+        session_id = f"sess_{uuid4().hex}"
+        async with session_factory() as db:
+            turn = await persistence.save_turn(
+                db, session_id, None,
+                [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}],
+            )
+        assert len(turn.messages) == 2
+        # Not written yet, but visible to a history read that misses the cache
+        assert await _count_messages(session_factory, turn.conversation_id) == 0
+        await persistence.history_cache.invalidate(session_id)
+        async with session_factory() as db:
+            turn = await persistence.save_turn(db, session_id, None, [{"role": "user", "content": "again"}])
+        assert [m.content for m in turn.messages] == ["hi", "hello", "again"]
+
+        await queue.stop()
+        assert await _count_messages(session_factory, turn.conversation_id) == 3
+
+    asyncio.run(test())
+
+
+def test_turns_count_in_rollups_only_once_written(monkeypatch, session_factory) -> None:
+    async def test():
+        aggregator = RollupAggregator(session_factory)
+        monkeypatch.setattr(rollups, "aggregator", aggregator)
+        conversation_id = await _new_conversation(session_factory)
+
+        def broken_session():
+            raise ConnectionError("database down")
+
+        failing = WriteBehindQueue(broken_session, flush_interval=0, max_retries=1)
+        failing.start()
+        await failing.enqueue(PendingTurn(conversation_id, [{**_message(conversation_id, "lost"), "intent": "faq"}], []))
+        await failing.stop()
+        assert failing.stats()["dropped"] == 1
+        assert aggregator.pending == 0
+
+        queue = WriteBehindQueue(session_factory, flush_interval=0.2)
+        queue.start()
+        await queue.enqueue(PendingTurn(conversation_id, [{**_message(conversation_id, "hi"), "intent": "faq"}], [], "en"))
+        assert aggregator.pending == 0
+        await queue.stop()
+        assert [key[2:] for key in aggregator._pending] == [("en", "faq")]
+
+    asyncio.run(test())
+
+
+def test_failing_turn_is_dropped_without_its_batch(session_factory) -> None:
+    async def test():
+        conversation_id = await _new_conversation(session_factory)
+        missing_id = uuid4()
+        queue = WriteBehindQueue(session_factory, flush_interval=0.2, max_retries=1)
+        queue.start()
+        for i in range(7):
+            await queue.enqueue(PendingTurn(conversation_id, [_message(conversation_id, f"m{i}")], []))
+            if i == 3:
+                # Foreign key violation: fails every batch it is part of
+                await queue.enqueue(PendingTurn(missing_id, [_message(missing_id, "orphan")], []))
+        await queue.stop()
+
+        assert await _count_messages(session_factory, conversation_id) == 7
+        assert queue.stats()["flushed"] == 7
+        assert queue.stats()["dropped"] == 1
+
+    asyncio.run(test())
+
+
+def test_flush_bumps_conversation_updated_at(session_factory) -> None:
+    async def test():
+        conversation_id = await _new_conversation(session_factory)
+        async with session_factory() as db:
+            before = (await db.get(models.Conversation, conversation_id)).updated_at
+        queue = WriteBehindQueue(session_factory, flush_interval=0)
+        queue.start()
+        await queue.enqueue(PendingTurn(conversation_id, [_message(conversation_id, "hi")], []))
+        await queue.stop()
+        async with session_factory() as db:
+            assert (await db.get(models.Conversation, conversation_id)).updated_at > before
+
+    asyncio.run(test())